@@ -8,6 +8,7 @@ This script ensures the correct patrol cars are in the system:
 - 2 Recovery/Backup vehicles
 """
 from db_utils import get_sqlalchemy_engine
+from contractor_resolver import invalidate_vehicle_contractor_cache
 from sqlalchemy import text
 
 def _is_sqlite():
@@ -69,6 +70,7 @@ def add_or_update_vehicles():
                     "contractor": contractor
                 })
             print(f"  ✓ {plate_number} ({contractor})")
+    invalidate_vehicle_contractor_cache()
 
     print("\n✅ Patrol vehicles configured successfully!")
     print("\nVehicle Summary:")
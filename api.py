@@ -1,21 +1,66 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from jose import jwt
 import bcrypt
-from datetime import datetime, timedelta
-from db_utils import get_sqlalchemy_engine, init_database
-from auth_utils import get_contractor_id
-from sqlalchemy import text
-import pandas as pd
+import asyncio
+import json
+import zlib
+from itertools import accumulate
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Union
+from db_utils import bootstrap_database, ensure_vehicle_last_position_once, pool_metrics
+from ingest_queue import IngestQueue, QueueFull
+from patrol_log_storage import MAINTENANCE_IN_API, MAINTENANCE_INTERVAL_SECONDS, run_maintenance
+import async_db
 
-# Initialize database on startup
-print("🔄 Initializing database...")
-init_database()
-print("✅ Database ready for operations")
+# msgpack bodies for /patrol_logs/bulk are optional; JSON (gzipped or not) always works
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 app = FastAPI(title="VTS Report Tool API")
 
+# GPS fixes are acknowledged on enqueue and written in batches
+patrol_log_queue = IngestQueue("patrol_logs", async_db.add_patrol_logs)
+
+@app.on_event("startup")
+def initialize_database():
+    # Once per worker process, after import; a no-op lookup when the schema version is recorded
+    bootstrap_database()
+    ensure_vehicle_last_position_once()
+    print("✅ Database ready for operations")
+
+@app.on_event("startup")
+async def start_ingest_queues():
+    await patrol_log_queue.start()
+
+async def patrol_log_maintenance_loop():
+    # Rollups, month archiving and retention; see patrol_log_storage.py
+    while True:
+        try:
+            await run_in_threadpool(run_maintenance)
+        except Exception as e:
+            print(f"❌ Patrol log maintenance failed: {e}")
+        await asyncio.sleep(MAINTENANCE_INTERVAL_SECONDS)
+
+maintenance_task = None
+
+@app.on_event("startup")
+async def start_patrol_log_maintenance():
+    global maintenance_task
+    if MAINTENANCE_IN_API:
+        maintenance_task = asyncio.create_task(patrol_log_maintenance_loop())
+
+@app.on_event("shutdown")
+async def close_database():
+    if maintenance_task is not None:
+        maintenance_task.cancel()
+    await patrol_log_queue.stop()
+    await async_db.dispose_async_engine()
+
 SECRET_KEY = "your-secret-key-here"  # In production, use environment variable
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
@@ -54,20 +99,12 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
         raise HTTPException(status_code=401, detail="Invalid token")
 
 @app.post("/login", response_model=TokenResponse)
-def login(request: LoginRequest):
-    engine = get_sqlalchemy_engine()
-    conn = engine.raw_connection()
-    cur = conn.cursor()
-
-    cur.execute("SELECT u.id, u.password_hash, u.role FROM users u JOIN contractors c ON u.contractor_id = c.id WHERE c.name = %s AND u.username = %s",
-                (request.contractor, request.username))
-    user = cur.fetchone()
-
-    cur.close()
-    conn.close()
+async def login(request: LoginRequest):
+    user = await async_db.get_login_user(request.contractor, request.username)
 
-    if user and bcrypt.checkpw(request.password.encode('utf-8'), user[1].encode('utf-8')):
-        role = "re_admin" if request.contractor == "RE Office" else user[2]
+    # bcrypt is deliberately slow; check it off the event loop
+    if user and await run_in_threadpool(bcrypt.checkpw, request.password.encode('utf-8'), user["password_hash"].encode('utf-8')):
+        role = "re_admin" if request.contractor == "RE Office" else user["role"]
         access_token = create_access_token(
             data={"sub": request.username, "contractor": request.contractor, "role": role},
             expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -76,21 +113,19 @@ def login(request: LoginRequest):
     else:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+@app.get("/metrics/db_pool")
+def db_pool_metrics(user: dict = Depends(verify_token)):
+    """Connection pool checkout/wait counters for this API process"""
+    return pool_metrics()
+
+@app.get("/metrics/ingest")
+def ingest_metrics(user: dict = Depends(verify_token)):
+    """Queue depth and batch counters of the buffered write endpoints"""
+    return {"patrol_logs": patrol_log_queue.metrics()}
+
 @app.get("/vehicles")
-def get_vehicles(user: dict = Depends(verify_token)):
-    contractor = user["contractor"]
-    contractor_id = get_contractor_id(contractor)
-    engine = get_sqlalchemy_engine()
-    query = text("""
-        SELECT id, plate_number
-        FROM vehicles
-        WHERE contractor = :contractor
-        ORDER BY plate_number
-    """)
-    with engine.begin() as conn:
-        result = conn.execute(query, {"contractor": contractor})
-        vehicles = [{"id": row[0], "plate_number": row[1]} for row in result.fetchall()]
-    return vehicles
+async def get_vehicles(user: dict = Depends(verify_token)):
+    return await async_db.list_vehicles(user["contractor"])
 
 class PatrolLogRequest(BaseModel):
     vehicle_id: int
@@ -101,44 +136,174 @@ class PatrolLogRequest(BaseModel):
     speed: float
     status: str = "online"
 
-@app.post("/patrol_logs", status_code=201)
-def create_patrol_log(log: PatrolLogRequest, user: dict = Depends(verify_token)):
+@app.post("/patrol_logs", status_code=202)
+async def create_patrol_log(log: PatrolLogRequest, user: dict = Depends(verify_token)):
     """
-    Create a new patrol log entry with GPS location, speed, and status.
+    Queue a patrol log entry with GPS location, speed, and status.
     This endpoint is called by mobile apps and web apps when GPS tracking is active.
+    The point is written with others in a batch shortly after; a full queue
+    answers 429 with Retry-After.
     """
-    engine = get_sqlalchemy_engine()
-    insert_query = """
-        INSERT INTO patrol_logs (vehicle_id, timestamp, latitude, longitude, activity, speed, status)
-        VALUES (:vehicle_id, :timestamp, :latitude, :longitude, :activity, :speed, :status)
+    try:
+        patrol_log_queue.submit({
+            "vehicle_id": log.vehicle_id,
+            "timestamp": log.timestamp,
+            "latitude": log.latitude,
+            "longitude": log.longitude,
+            "activity": log.activity,
+            "speed": log.speed,
+            "status": log.status
+        })
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    return {"message": "Patrol log accepted", "status": "online"}
+
+# Most fixes accepted in one /patrol_logs/bulk upload
+PATROL_LOG_BULK_MAX_POINTS = 4000
+# Largest /patrol_logs/bulk body read off the wire, and largest it may inflate to
+# (a full batch of delta-encoded JSON is a few hundred KB)
+PATROL_LOG_BULK_MAX_BODY_BYTES = 1 * 1024 * 1024
+PATROL_LOG_BULK_MAX_DECODED_BYTES = 4 * 1024 * 1024
+# Coordinates travel as integer microdegrees (~0.1 m)
+COORDINATE_SCALE = 1_000_000
+
+class PatrolLogBulkRequest(BaseModel):
+    """Columnar batch of one vehicle's fixes.
+
+    ``ts`` is epoch milliseconds (UTC), ``lat``/``lon`` are microdegrees; in
+    all three the first value is absolute and each later one is the delta
+    from the previous point. ``activity`` and ``speed`` (km/h) are per point
+    or one value for all.
     """
+    vehicle_id: int
+    ts: List[int]
+    lat: List[int]
+    lon: List[int]
+    speed: Union[List[float], float] = 0.0
+    activity: Union[List[str], str] = "moving"
+    status: str = "online"
+
+async def _read_bulk_body(request: Request) -> bytes:
+    """Request body, refusing with 413 once it passes PATROL_LOG_BULK_MAX_BODY_BYTES"""
+    too_large = HTTPException(status_code=413,
+                              detail=f"Body larger than {PATROL_LOG_BULK_MAX_BODY_BYTES} bytes")
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > PATROL_LOG_BULK_MAX_BODY_BYTES:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > PATROL_LOG_BULK_MAX_BODY_BYTES:
+            raise too_large
+    return bytes(body)
+
+def _gunzip_bounded(body: bytes) -> bytes:
+    """Inflate a gzip body, refusing with 413 past PATROL_LOG_BULK_MAX_DECODED_BYTES"""
+    inflater = zlib.decompressobj(wbits=31)
+    data = inflater.decompress(body, PATROL_LOG_BULK_MAX_DECODED_BYTES)
+    if not inflater.unconsumed_tail:
+        data += inflater.flush()
+    if inflater.unconsumed_tail or len(data) > PATROL_LOG_BULK_MAX_DECODED_BYTES:
+        raise HTTPException(status_code=413,
+                            detail=f"Body inflates past {PATROL_LOG_BULK_MAX_DECODED_BYTES} bytes")
+    if not inflater.eof:
+        raise ValueError("truncated gzip body")
+    return data
+
+def _decode_bulk_body(body: bytes, content_type: str, content_encoding: str) -> dict:
+    """Raw /patrol_logs/bulk body (optionally gzipped JSON or msgpack) to a dict"""
+    if content_encoding == "gzip" or body[:2] == b"\x1f\x8b":
+        body = _gunzip_bounded(body)
+    if "msgpack" in content_type:
+        if msgpack is None:
+            raise HTTPException(status_code=415, detail="msgpack bodies are not supported on this server; send JSON")
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body)
+
+def _expand_bulk(bulk: PatrolLogBulkRequest) -> list:
+    """Undo the delta encoding into patrol_logs rows"""
+    count = len(bulk.ts)
+    columns = {"lat": bulk.lat, "lon": bulk.lon}
+    for name in ("speed", "activity"):
+        value = getattr(bulk, name)
+        if isinstance(value, list):
+            columns[name] = value
+        else:
+            columns[name] = [value] * count
+    if any(len(values) != count for values in columns.values()):
+        raise HTTPException(status_code=400, detail="ts, lat, lon, speed and activity must have the same length")
+
+    timestamps = accumulate(bulk.ts)
+    latitudes = accumulate(bulk.lat)
+    longitudes = accumulate(bulk.lon)
+    return [
+        {
+            "vehicle_id": bulk.vehicle_id,
+            # UTC like the app's '...Z' fixes; record_patrol_logs stores both as naive UTC
+            "timestamp": datetime.fromtimestamp(ms / 1000, timezone.utc).isoformat(),
+            "latitude": lat / COORDINATE_SCALE,
+            "longitude": lon / COORDINATE_SCALE,
+            "activity": activity,
+            "speed": speed,
+            "status": bulk.status,
+        }
+        for ms, lat, lon, speed, activity in zip(
+            timestamps, latitudes, longitudes, columns["speed"], columns["activity"]
+        )
+    ]
+
+@app.post("/patrol_logs/bulk", status_code=201)
+async def create_patrol_logs_bulk(request: Request, user: dict = Depends(verify_token)):
+    """
+    Store up to PATROL_LOG_BULK_MAX_POINTS fixes of one vehicle in one request
+    (see PatrolLogBulkRequest for the columnar, delta-encoded layout).
+    Accepts JSON or msgpack (Content-Type: application/msgpack), either of
+    them gzipped (Content-Encoding: gzip). Bodies over
+    PATROL_LOG_BULK_MAX_BODY_BYTES, or inflating past
+    PATROL_LOG_BULK_MAX_DECODED_BYTES, get 413. The points are inserted with
+    one multi-row INSERT in a single transaction.
+    """
+    body = await _read_bulk_body(request)
     try:
-        with engine.begin() as conn:
-            conn.execute(text(insert_query), {
-                "vehicle_id": log.vehicle_id,
-                "timestamp": log.timestamp,
-                "latitude": log.latitude,
-                "longitude": log.longitude,
-                "activity": log.activity,
-                "speed": log.speed,
-                "status": log.status
-            })
-        return {"message": "Patrol log created successfully", "status": "online"}
+        data = _decode_bulk_body(body, request.headers.get("content-type", ""),
+                                 request.headers.get("content-encoding", ""))
+        bulk = PatrolLogBulkRequest(**data)
+    except HTTPException:
+        raise
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json()))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to create patrol log: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Could not decode body: {e}")
+    if len(bulk.ts) > PATROL_LOG_BULK_MAX_POINTS:
+        raise HTTPException(status_code=413, detail=f"At most {PATROL_LOG_BULK_MAX_POINTS} points per upload")
+
+    logs = _expand_bulk(bulk)
+    if not logs:
+        return {"message": "No points", "inserted": 0}
+    try:
+        await async_db.add_patrol_logs(logs)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to store patrol logs: {str(e)}")
+    return {"message": "Patrol logs created successfully", "inserted": len(logs)}
 
 @app.get("/patrol_logs/{vehicle_id}")
-def get_patrol_logs(vehicle_id: int, user: dict = Depends(verify_token)):
-    engine = get_sqlalchemy_engine()
-    logs_query = """
-        SELECT timestamp, latitude, longitude, activity
-        FROM patrol_logs
-        WHERE vehicle_id = :vehicle_id
-        ORDER BY timestamp DESC
-    """
-    with engine.begin() as conn:
-        patrol_logs = pd.read_sql(logs_query, conn, params={"vehicle_id": vehicle_id})
-    return patrol_logs.to_dict(orient="records")
+async def get_patrol_logs(
+    vehicle_id: int,
+    response: Response,
+    limit: int = Query(async_db.DEFAULT_PAGE_SIZE, ge=1, le=async_db.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    user: dict = Depends(verify_token)
+):
+    """Newest patrol points first, one page at a time; X-Next-Cursor holds the next page's cursor"""
+    try:
+        patrol_logs, next_cursor = await async_db.patrol_points_page(vehicle_id, limit, cursor, start_date, end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return patrol_logs[async_db.PATROL_POINT_PAGE_COLUMNS].to_dict(orient="records")
 
 class IdleReportRequest(BaseModel):
     vehicle: str
@@ -155,60 +320,51 @@ class IdleReportEndRequest(BaseModel):
     idle_duration_min: float
 
 @app.post("/idle_reports")
-def create_idle_report(report: IdleReportRequest, user: dict = Depends(verify_token)):
-    engine = get_sqlalchemy_engine()
-    insert_query = """
-        INSERT INTO idle_reports (vehicle, idle_start, location_address, latitude, longitude, description, contractor_id, uploaded_by)
-        VALUES (:vehicle, :idle_start, :location_address, :latitude, :longitude, :description, :contractor_id, :uploaded_by)
-    """
+async def create_idle_report(report: IdleReportRequest, user: dict = Depends(verify_token)):
     try:
-        with engine.begin() as conn:
-            conn.execute(text(insert_query), {
-                "vehicle": report.vehicle,
-                "idle_start": report.idle_start,
-                "location_address": report.location_address,
-                "latitude": report.latitude,
-                "longitude": report.longitude,
-                "description": report.description,
-                "contractor_id": report.contractor_id,
-                "uploaded_by": user["username"]
-            })
+        await async_db.start_idle_report({
+            "vehicle": report.vehicle,
+            "idle_start": report.idle_start,
+            "location_address": report.location_address,
+            "latitude": report.latitude,
+            "longitude": report.longitude,
+            "description": report.description,
+            "contractor_id": report.contractor_id
+        }, uploaded_by=user["username"])
         return {"message": "Idle report created successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create idle report: {str(e)}")
 
 @app.put("/idle_reports/end")
-def end_idle_report(report: IdleReportEndRequest, user: dict = Depends(verify_token)):
-    engine = get_sqlalchemy_engine()
-    update_query = """
-        UPDATE idle_reports
-        SET idle_end = :idle_end, idle_duration_min = :idle_duration_min
-        WHERE vehicle = :vehicle AND idle_end IS NULL
-        ORDER BY idle_start DESC LIMIT 1
-    """
+async def end_idle_report(report: IdleReportEndRequest, user: dict = Depends(verify_token)):
     try:
-        with engine.begin() as conn:
-            result = conn.execute(text(update_query), {
-                "vehicle": report.vehicle,
-                "idle_end": report.idle_end,
-                "idle_duration_min": report.idle_duration_min
-            })
-            if result.rowcount == 0:
-                raise HTTPException(status_code=404, detail="No active idle report found")
-        return {"message": "Idle report updated successfully"}
+        updated = await async_db.end_idle_report(report.vehicle, report.idle_end, report.idle_duration_min)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update idle report: {str(e)}")
+    if updated == 0:
+        raise HTTPException(status_code=404, detail="No active idle report found")
+    return {"message": "Idle report updated successfully"}
 
 @app.get("/incidents")
-def get_incidents(user: dict = Depends(verify_token)):
-    from sqlalchemy import text
-    contractor = user["contractor"]
-    contractor_id = get_contractor_id(contractor)
-    engine = get_sqlalchemy_engine()
-    query = "SELECT * FROM incident_reports WHERE contractor_id = :contractor_id ORDER BY incident_date DESC LIMIT 50"
-    with engine.begin() as conn:
-        incidents = pd.read_sql(text(query), conn, params={"contractor_id": contractor_id})
-    return incidents.to_dict(orient="records")
+async def get_incidents(
+    response: Response,
+    limit: int = Query(50, ge=1, le=async_db.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    user: dict = Depends(verify_token)
+):
+    """Newest incidents first, one page at a time; X-Next-Cursor holds the next page's cursor"""
+    contractor_id = await async_db.get_contractor_id(user["contractor"])
+    try:
+        incidents, next_cursor = await async_db.incident_page(
+            contractor_id, limit, cursor, start_date, end_date, columns=async_db.INCIDENT_LIST_COLUMNS
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return incidents
 
 # Add more endpoints as needed for reports
 
@@ -2,6 +2,7 @@ import streamlit as st
 import pandas as pd
 from datetime import timedelta
 import time
+from idle_detection import IDLE_SPEED_THRESHOLD, find_idle_runs
 
 def clean_data(df):
     # Drop completely empty rows
@@ -15,31 +16,16 @@ def clean_data(df):
                 pass
     return df
 
-def find_idle_times(df, vehicle_col, time_col, speed_col, idle_threshold=5):
-    idle_report = []
-    for vehicle_id, group in df.groupby(vehicle_col):
-        group = group.sort_values(time_col).copy()
-        # Convert speed to numeric, treat non-numeric as 0 (idle)
-        group['speed_val'] = pd.to_numeric(group[speed_col], errors='coerce').fillna(0)
-        # Idle if speed <= 2 or NaN
-        group['is_idle'] = (group['speed_val'] <= 2) | group['speed_val'].isna()
-        # Find idle periods using vectorized operations
-        group['idle_start'] = group[time_col].where(group['is_idle'] & ~group['is_idle'].shift(1, fill_value=False), pd.NaT)
-        group['idle_end'] = group[time_col].where(group['is_idle'] & ~group['is_idle'].shift(-1, fill_value=False), pd.NaT)
-        # Forward fill idle_start for consecutive idle rows
-        group['idle_start'] = group['idle_start'].fillna(method='ffill')
-        # Filter to rows where idle_end is set
-        idle_periods = group.dropna(subset=['idle_end'])
-        for _, row in idle_periods.iterrows():
-            idle_duration = (row['idle_end'] - row['idle_start']).total_seconds() / 60
-            if idle_duration > idle_threshold:
-                idle_report.append({
-                    'Vehicle': vehicle_id,
-                    'Idle Start': row['idle_start'],
-                    'Idle End': row['idle_end'],
-                    'Idle Duration (min)': round(idle_duration, 2)
-                })
-    return pd.DataFrame(idle_report)
+def find_idle_times(df, vehicle_col, time_col, speed_col, idle_threshold=5, speed_threshold=IDLE_SPEED_THRESHOLD):
+    # Whole-frame run-length detection; see idle_detection.find_idle_runs
+    idle_df = find_idle_runs(df, vehicle_col, time_col, speed_col,
+                             speed_threshold=speed_threshold, min_duration=idle_threshold)
+    return idle_df.rename(columns={
+        'vehicle': 'Vehicle',
+        'idle_start': 'Idle Start',
+        'idle_end': 'Idle End',
+        'idle_duration_min': 'Idle Duration (min)'
+    })
 
 st.title('Vehicle Idle Time Analyzer')
 
@@ -58,10 +44,11 @@ if uploaded_file:
     time_col = st.selectbox('Select timestamp column', columns)
     speed_col = st.selectbox('Select speed column (0 = idle)', columns)
     threshold = st.number_input('Idle threshold (minutes)', min_value=1, value=5)
+    speed_threshold = st.number_input('Idle speed (km/h, at or below counts as idle)', min_value=0.0, value=float(IDLE_SPEED_THRESHOLD))
 
     if st.button('Analyze Idle Times'):
         start_time = time.time()
-        idle_df = find_idle_times(df, vehicle_col, time_col, speed_col, idle_threshold=threshold)
+        idle_df = find_idle_times(df, vehicle_col, time_col, speed_col, idle_threshold=threshold, speed_threshold=speed_threshold)
         end_time = time.time()
         st.write(f'Analysis completed in {end_time - start_time:.2f} seconds')
         st.write('Idle Periods (> threshold):', idle_df)
@@ -0,0 +1,340 @@
+# async_db.py - Async data access for the FastAPI backends (SQLAlchemy asyncio)
+"""
+Non-blocking counterpart of db_utils for `async def` endpoints.
+
+Uses asyncpg on PostgreSQL and aiosqlite on the local SQLite file, with the
+same DATABASE_URL and pool settings as the sync engine. Queries that already
+exist as sync helpers (patrol log write-through, month-table reads) run on the
+async connection through ``run_sync`` instead of being duplicated.
+"""
+import os
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import ArgumentError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from db_utils import (
+    DATABASE_URL, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_SIZE, DB_POOL_TIMEOUT,
+    DB_STATEMENT_TIMEOUT_MS, _mask_db_url, decode_cursor, encode_cursor, idle_report_plates,
+    record_patrol_log, record_patrol_logs, row_id_column, timestamp_param,
+)
+from patrol_log_storage import read_points_page
+
+SQLITE_ASYNC_URL = "sqlite+aiosqlite:///vts_database.db"
+
+# Columns a client may set when filing an incident from the mobile app
+INCIDENT_CREATE_COLUMNS = [
+    "incident_type", "patrol_car", "incident_date", "incident_time", "caller",
+    "phone_number", "location", "bound", "chainage", "description",
+]
+INCIDENT_SUMMARY_COLUMNS = [
+    "id", "incident_type", "patrol_car", "incident_date", "incident_time",
+    "location", "description", "created_at",
+]
+# Fields the mobile incident list shows, instead of every incident_reports column
+INCIDENT_LIST_COLUMNS = INCIDENT_SUMMARY_COLUMNS + ["bound", "chainage", "uploaded_by"]
+PATROL_POINT_PAGE_COLUMNS = ["timestamp", "latitude", "longitude", "activity"]
+
+# List endpoints return at most this many rows per page (keyset pagination)
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Seconds a contractor's dashboard counts are served from memory; writes made
+# through this module drop the entry sooner (writes from other processes wait out the TTL)
+DASHBOARD_CACHE_TTL_SECONDS = float(os.getenv("DASHBOARD_CACHE_TTL_SECONDS", "5"))
+
+# ------------------- ENGINE -------------------
+_async_engine = None
+_async_engine_lock = threading.Lock()
+
+
+def _async_database_url():
+    """DATABASE_URL rewritten for the async driver, plus its connect args"""
+    if not DATABASE_URL:
+        return SQLITE_ASYNC_URL, {}
+    if DATABASE_URL.startswith("sqlite"):
+        return "sqlite+aiosqlite" + DATABASE_URL[DATABASE_URL.index(":"):], {}
+
+    parts = urllib.parse.urlsplit(DATABASE_URL)
+    query = dict(urllib.parse.parse_qsl(parts.query))
+    # asyncpg takes ssl as a connect argument instead of libpq's sslmode
+    connect_args = {"ssl": query.pop("sslmode", "require"), "timeout": 30}
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+    url = urllib.parse.urlunsplit(
+        ("postgresql+asyncpg", parts.netloc, parts.path, urllib.parse.urlencode(query), parts.fragment)
+    )
+    return url, connect_args
+
+
+def _create_async_engine():
+    url, connect_args = _async_database_url()
+    if url.startswith("sqlite"):
+        return create_async_engine(url)
+    try:
+        return create_async_engine(
+            url,
+            connect_args=connect_args,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+    except ArgumentError:
+        print(f"Invalid DATABASE_URL provided: {_mask_db_url(DATABASE_URL)}")
+        print("Falling back to local SQLite: vts_database.db")
+        return create_async_engine(SQLITE_ASYNC_URL)
+
+
+def get_async_engine() -> AsyncEngine:
+    """The process-wide async engine, created on first use"""
+    global _async_engine
+    if _async_engine is None:
+        with _async_engine_lock:
+            if _async_engine is None:
+                _async_engine = _create_async_engine()
+    return _async_engine
+
+
+async def dispose_async_engine() -> None:
+    """Close pooled connections (call from the app's shutdown handler)"""
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+
+
+def _is_sqlite(conn) -> bool:
+    return conn.dialect.name == "sqlite"
+
+
+def _rows(result) -> List[Dict[str, Any]]:
+    return [dict(row._mapping) for row in result]
+
+
+# ------------------- USERS -------------------
+async def get_contractor_id(name: str) -> Optional[int]:
+    async with get_async_engine().connect() as conn:
+        result = await conn.execute(
+            text("SELECT id FROM contractors WHERE name = :name"), {"name": name}
+        )
+        row = result.fetchone()
+    return row[0] if row else None
+
+
+async def get_login_user(contractor: str, username: str) -> Optional[Dict[str, Any]]:
+    """The user row (with password hash) for a contractor/username pair, or None"""
+    async with get_async_engine().connect() as conn:
+        result = await conn.execute(
+            text("""
+                SELECT u.id, u.username, u.password_hash, u.role, u.contractor_id
+                FROM users u
+                JOIN contractors c ON u.contractor_id = c.id
+                WHERE c.name = :contractor AND u.username = :username
+            """),
+            {"contractor": contractor, "username": username}
+        )
+        row = result.fetchone()
+    return dict(row._mapping) if row else None
+
+
+# ------------------- INCIDENTS -------------------
+async def create_incident(incident: Dict[str, Any], uploaded_by: str, contractor_id: Optional[int]) -> int:
+    """Insert an incident report and return its id"""
+    params = {column: incident.get(column) for column in INCIDENT_CREATE_COLUMNS}
+    params.update(uploaded_by=uploaded_by, contractor_id=contractor_id, created_at=datetime.now())
+    columns = ", ".join(params)
+    values = ", ".join(f":{column}" for column in params)
+
+    async with get_async_engine().begin() as conn:
+        if _is_sqlite(conn):
+            result = await conn.execute(
+                text(f"INSERT INTO incident_reports ({columns}) VALUES ({values})"), params
+            )
+            incident_id = result.lastrowid
+        else:
+            result = await conn.execute(
+                text(f"INSERT INTO incident_reports ({columns}) VALUES ({values}) RETURNING id"), params
+            )
+            incident_id = result.scalar_one()
+    invalidate_dashboard_stats(contractor_id)
+    return incident_id
+
+
+async def incident_page(contractor_id: Optional[int], limit: int = DEFAULT_PAGE_SIZE,
+                        cursor: Optional[str] = None, start_date=None, end_date=None,
+                        columns: List[str] = INCIDENT_SUMMARY_COLUMNS) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """A page of a contractor's incidents, newest created_at first, and the cursor of the next page.
+
+    Keyset pagination on (created_at, id); the optional incident_date range is
+    filtered in SQL. Raises ValueError for a malformed cursor.
+    """
+    async with get_async_engine().connect() as conn:
+        row_id = row_id_column(conn)
+        conditions = ["contractor_id = :contractor_id"]
+        params = {"contractor_id": contractor_id, "limit": limit}
+        if start_date is not None:
+            conditions.append("incident_date >= :start_date")
+            params["start_date"] = start_date
+        if end_date is not None:
+            conditions.append("incident_date <= :end_date")
+            params["end_date"] = end_date
+        if cursor:
+            created_at, params["before_id"] = decode_cursor(cursor)
+            params["before_created_at"] = timestamp_param(conn, created_at)
+            conditions.append(f"(created_at, {row_id}) < (:before_created_at, :before_id)")
+        selected = ", ".join(f"{row_id} AS id" if column == "id" else column for column in columns)
+        result = await conn.execute(
+            text(f"""
+                SELECT {selected}
+                FROM incident_reports
+                WHERE {" AND ".join(conditions)}
+                ORDER BY created_at DESC, {row_id} DESC
+                LIMIT :limit
+            """),
+            params
+        )
+        rows = _rows(result)
+    next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"]) if len(rows) == limit else None
+    return rows, next_cursor
+
+
+# ------------------- DASHBOARD -------------------
+# (contractor_id, contractor) -> (expires_at, stats)
+_dashboard_cache: Dict[Tuple[Any, str], Tuple[float, Dict[str, int]]] = {}
+
+# One round trip; each count is served by an index on contractor_id, and vehicles
+# come from vehicle_last_position (one row per tracked vehicle) instead of patrol_logs
+_DASHBOARD_STATS_QUERY = """
+    SELECT
+        (SELECT COUNT(*) FROM incident_reports WHERE contractor_id = :contractor_id) AS incidents,
+        (SELECT COUNT(*) FROM idle_reports WHERE contractor_id = :contractor_id) AS idle_reports,
+        (SELECT COUNT(*) FROM breaks WHERE contractor_id = :contractor_id) AS breaks,
+        (SELECT COUNT(*) FROM vehicle_last_position lp
+         JOIN vehicles v ON v.id = lp.vehicle_id
+         WHERE v.contractor = :contractor) AS vehicles
+"""
+
+
+def invalidate_dashboard_stats(contractor_id=None) -> None:
+    """Drop cached dashboard counts for one contractor, or for all when None"""
+    if contractor_id is None:
+        _dashboard_cache.clear()
+        return
+    for key in [key for key in _dashboard_cache if str(key[0]) == str(contractor_id)]:
+        _dashboard_cache.pop(key, None)
+
+
+async def dashboard_stats(contractor_id: Optional[int], contractor: str = "") -> Dict[str, int]:
+    """Report counts for a contractor's dashboard, cached for DASHBOARD_CACHE_TTL_SECONDS.
+
+    Only this module's writes invalidate the entry; the TTL is the only
+    consistency bound for writes made in other processes (Streamlit, db_utils).
+    """
+    key = (contractor_id, contractor)
+    cached = _dashboard_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    async with get_async_engine().connect() as conn:
+        result = await conn.execute(
+            text(_DASHBOARD_STATS_QUERY), {"contractor_id": contractor_id, "contractor": contractor}
+        )
+        row = result.one()._mapping
+    stats = {
+        "incidents": row["incidents"],
+        "idle_reports": row["idle_reports"],
+        "breaks": row["breaks"],
+        "vehicles": row["vehicles"] or 8,
+    }
+    _dashboard_cache[key] = (time.monotonic() + DASHBOARD_CACHE_TTL_SECONDS, stats)
+    return stats
+
+
+# ------------------- VEHICLES & PATROL LOGS -------------------
+async def list_vehicles(contractor: str) -> List[Dict[str, Any]]:
+    async with get_async_engine().connect() as conn:
+        result = await conn.execute(
+            text("""
+                SELECT id, plate_number
+                FROM vehicles
+                WHERE contractor = :contractor
+                ORDER BY plate_number
+            """),
+            {"contractor": contractor}
+        )
+        return _rows(result)
+
+
+async def add_patrol_log(log: Dict[str, Any]) -> None:
+    """Insert a patrol point and update vehicle_last_position in one transaction"""
+    async with get_async_engine().begin() as conn:
+        await conn.run_sync(record_patrol_log, log)
+
+
+async def add_patrol_logs(logs: List[Dict[str, Any]]) -> None:
+    """Insert a batch of patrol points (multi-row INSERTs) in one transaction"""
+    async with get_async_engine().begin() as conn:
+        await conn.run_sync(record_patrol_logs, logs)
+
+
+async def patrol_points_page(vehicle_id: int, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                             start=None, end=None) -> Tuple[pd.DataFrame, Optional[str]]:
+    """A page of a vehicle's raw points, newest first, and the cursor of the next page.
+
+    Keyset pagination on (timestamp, id) across the month tables. Raises
+    ValueError for a malformed cursor.
+    """
+    before = decode_cursor(cursor) if cursor else None
+    async with get_async_engine().connect() as conn:
+        points = await conn.run_sync(
+            read_points_page, vehicle_id, limit, before, start, end, PATROL_POINT_PAGE_COLUMNS
+        )
+    next_cursor = None
+    if len(points) == limit:
+        next_cursor = encode_cursor(points["timestamp"].iloc[-1], points["id"].iloc[-1])
+    return points, next_cursor
+
+
+# ------------------- IDLE REPORTS -------------------
+async def start_idle_report(report: Dict[str, Any], uploaded_by: str) -> None:
+    """Open an idle period reported live by a device (idle_end is set later)"""
+    params = dict(report, uploaded_by=uploaded_by, plate=idle_report_plates([report["vehicle"]])[0])
+    async with get_async_engine().begin() as conn:
+        await conn.execute(
+            text("""
+                INSERT INTO idle_reports
+                (vehicle, plate, idle_start, location_address, latitude, longitude, description, contractor_id, uploaded_by)
+                VALUES (:vehicle, :plate, :idle_start, :location_address, :latitude, :longitude, :description, :contractor_id, :uploaded_by)
+            """),
+            params
+        )
+    invalidate_dashboard_stats(report.get("contractor_id"))
+
+
+async def end_idle_report(vehicle: str, idle_end, idle_duration_min: float) -> int:
+    """Close the vehicle's latest open idle period; returns the number of rows updated"""
+    async with get_async_engine().begin() as conn:
+        # SQLite's SERIAL column isn't auto-assigned, so address rows by rowid there
+        row_id = "rowid" if _is_sqlite(conn) else "id"
+        result = await conn.execute(
+            text(f"""
+                UPDATE idle_reports
+                SET idle_end = :idle_end, idle_duration_min = :idle_duration_min
+                WHERE {row_id} = (
+                    SELECT {row_id} FROM idle_reports
+                    WHERE vehicle = :vehicle AND idle_end IS NULL
+                    ORDER BY idle_start DESC
+                    LIMIT 1
+                )
+            """),
+            {"vehicle": vehicle, "idle_end": idle_end, "idle_duration_min": idle_duration_min}
+        )
+        return result.rowcount
@@ -1,7 +1,7 @@
 import streamlit as st
 import psycopg2
 import bcrypt
-from db_utils import get_sqlalchemy_engine
+from db_utils import db_cursor, param_marker
 
 def login():
     st.header("🔑 Login Page")
@@ -11,27 +11,20 @@ def login():
     password = st.text_input("Password", type="password")
 
     if st.button("Login"):
-        engine = get_sqlalchemy_engine()
-        conn = engine.raw_connection()
-        cur = conn.cursor()
-
-        # First get contractor_id from contractors table
-        cur.execute("SELECT id FROM contractors WHERE name = %s", (contractor,))
-        contractor_row = cur.fetchone()
-        if not contractor_row:
-            st.error("❌ Invalid contractor")
-            cur.close()
-            conn.close()
-            return
-
-        contractor_id = contractor_row[0]
-
-        cur.execute("SELECT id, password_hash, role, contractor_id FROM users WHERE contractor_id=%s AND username=%s",
-                    (contractor_id, username))
-        user = cur.fetchone()
-
-        cur.close()
-        conn.close()
+        marker = param_marker()
+        with db_cursor() as cur:
+            # First get contractor_id from contractors table
+            cur.execute(f"SELECT id FROM contractors WHERE name = {marker}", (contractor,))
+            contractor_row = cur.fetchone()
+            if not contractor_row:
+                st.error("❌ Invalid contractor")
+                return
+
+            contractor_id = contractor_row[0]
+
+            cur.execute(f"SELECT id, password_hash, role, contractor_id FROM users WHERE contractor_id={marker} AND username={marker}",
+                        (contractor_id, username))
+            user = cur.fetchone()
 
         if user and bcrypt.checkpw(password.encode('utf-8'), user[1].encode('utf-8')):
             st.session_state["logged_in"] = True
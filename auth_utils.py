@@ -4,13 +4,11 @@ import streamlit as st
 from sqlalchemy import text
 from db_utils import get_sqlalchemy_engine
 
-engine = get_sqlalchemy_engine()
-
 
 def add_user(username, plain_password, role="contractor", contractor_id=None):
     """Add a new user to the database."""
     hashed = bcrypt.hashpw(plain_password.encode(), bcrypt.gensalt()).decode()
-    with engine.begin() as conn:
+    with get_sqlalchemy_engine().begin() as conn:
         conn.execute(
             text("""INSERT INTO users
                     (username, password_hash, role, contractor_id)
@@ -30,7 +28,7 @@ def get_user(username, contractor_id=None):
         query += " AND contractor_id=:contractor_id"
         params["contractor_id"] = contractor_id
     
-    with engine.begin() as conn:
+    with get_sqlalchemy_engine().begin() as conn:
         row = conn.execute(text(query), params).fetchone()
     
     return dict(row) if row else None
@@ -50,7 +48,7 @@ def get_active_contractor():
 
 def get_contractor_id(name):
     """Get contractor ID by name."""
-    with engine.begin() as conn:
+    with get_sqlalchemy_engine().begin() as conn:
         row = conn.execute(
             text("SELECT id FROM contractors WHERE name=:name"),
             {"name": name}
@@ -62,7 +60,7 @@ def get_contractor_name(contractor_id):
     """Get contractor name by ID."""
     if not contractor_id:
         return None
-    with engine.begin() as conn:
+    with get_sqlalchemy_engine().begin() as conn:
         row = conn.execute(
             text("SELECT name FROM contractors WHERE id=:contractor_id"),
             {"contractor_id": contractor_id}
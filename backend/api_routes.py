@@ -1,16 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Response
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import sys
 import os
 sys.path.append('..')
-from db_utils import get_sqlalchemy_engine
-
-def _is_sqlite():
-    """Check if using SQLite database"""
-    engine = get_sqlalchemy_engine()
-    return engine.dialect.name == "sqlite"
+import async_db
+from backend.auth import authenticate_user, create_access_token, get_current_user
 
 router = APIRouter()
 
@@ -41,12 +37,12 @@ class IncidentReportCreate(BaseModel):
 # Auth Endpoints
 @router.post("/auth/login", response_model=LoginResponse)
 async def login(request: LoginRequest):
-    user = authenticate_user(request.contractor, request.username, request.password)
+    user = await authenticate_user(request.contractor, request.username, request.password)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     access_token = create_access_token(
-        data={"sub": user["username"], "role": user["role"], "contractor_id": user["contractor_id"]}
+        data={"sub": user["username"], "role": user["role"], "contractor": user["contractor"], "contractor_id": user["contractor_id"]}
     )
     
     return {
@@ -65,119 +61,52 @@ async def create_incident(
     incident: IncidentReportCreate,
     current_user: dict = Depends(get_current_user)
 ):
-    engine = get_sqlalchemy_engine()
-    with engine.begin() as conn:
-        if _is_sqlite():
-            query = """
-                INSERT INTO incident_reports 
-                (incident_type, patrol_car, incident_date, incident_time, caller, phone_number, 
-                 location, bound, chainage, description, uploaded_by, contractor_id, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """
-        else:
-            query = """
-                INSERT INTO incident_reports 
-                (incident_type, patrol_car, incident_date, incident_time, caller, phone_number, 
-                 location, bound, chainage, description, uploaded_by, contractor_id, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-            """
-        
-        result = conn.execute(
-            query,
-            (
-                incident.incident_type,
-                incident.patrol_car,
-                incident.incident_date,
-                incident.incident_time,
-                incident.caller,
-                incident.phone_number,
-                incident.location,
-                incident.bound,
-                incident.chainage,
-                incident.description,
-                current_user["sub"],
-                current_user["contractor_id"],
-                datetime.now()
-            )
-        )
-        if _is_sqlite():
-            incident_id = result.lastrowid
-        else:
-            incident_id = result.fetchone()[0]
-        
+    incident_id = await async_db.create_incident(
+        incident.model_dump(), uploaded_by=current_user["sub"], contractor_id=current_user["contractor_id"]
+    )
     return {"id": incident_id, "message": "Incident report created successfully"}
 
 @router.get("/incidents")
 async def get_incidents(
-    limit: int = 50,
+    response: Response,
+    limit: int = Query(50, ge=1, le=async_db.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    engine = get_sqlalchemy_engine()
-    with engine.begin() as conn:
-        param_marker = "?" if _is_sqlite() else "%s"
-        query = f"""
-            SELECT id, incident_type, patrol_car, incident_date, incident_time, 
-                   location, description, created_at
-            FROM incident_reports
-            WHERE contractor_id = {param_marker}
-            ORDER BY created_at DESC
-            LIMIT {param_marker}
-        """
-        result = conn.execute(query, (current_user["contractor_id"], limit))
-        incidents = []
-        for row in result:
-            incidents.append({
-                "id": row[0],
-                "incident_type": row[1],
-                "patrol_car": row[2],
-                "incident_date": str(row[3]),
-                "incident_time": str(row[4]),
-                "location": row[5],
-                "description": row[6],
-                "created_at": str(row[7])
-            })
+    try:
+        rows, next_cursor = await async_db.incident_page(
+            current_user["contractor_id"], limit, cursor, start_date, end_date
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    incidents = []
+    for row in rows:
+        incidents.append({
+            "id": row["id"],
+            "incident_type": row["incident_type"],
+            "patrol_car": row["patrol_car"],
+            "incident_date": str(row["incident_date"]),
+            "incident_time": str(row["incident_time"]),
+            "location": row["location"],
+            "description": row["description"],
+            "created_at": str(row["created_at"])
+        })
     
     return incidents
 
 # Dashboard Stats
 @router.get("/dashboard/stats")
 async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
-    engine = get_sqlalchemy_engine()
-    with engine.begin() as conn:
-        param_marker = "?" if _is_sqlite() else "%s"
-        
-        # Get incident count
-        result = conn.execute(
-            f"SELECT COUNT(*) FROM incident_reports WHERE contractor_id = {param_marker}",
-            (current_user["contractor_id"],)
-        )
-        incident_count = result.fetchone()[0]
-        
-        # Get idle reports count
-        result = conn.execute(
-            f"SELECT COUNT(*) FROM idle_reports WHERE contractor_id = {param_marker}",
-            (current_user["contractor_id"],)
-        )
-        idle_count = result.fetchone()[0]
-        
-        # Get breaks count
-        result = conn.execute(
-            f"SELECT COUNT(*) FROM breaks WHERE contractor_id = {param_marker}",
-            (current_user["contractor_id"],)
-        )
-        breaks_count = result.fetchone()[0]
-        
-        # Get active vehicles count
-        result = conn.execute(
-            f"SELECT COUNT(DISTINCT vehicle) FROM patrol_logs WHERE vehicle_id IN (SELECT id FROM vehicles WHERE contractor = {param_marker})",
-            (current_user.get("contractor", ""),)
-        )
-        vehicles_count = result.fetchone()[0] or 8
-    
-    return {
-        "incidents": incident_count,
-        "idle_reports": idle_count,
-        "breaks": breaks_count,
-        "vehicles": vehicles_count
-    }
+    """
+    Report counts for the caller's contractor, cached per API process.
+
+    Writes made through async_db (this API) drop the cached entry at once.
+    Writes from the Streamlit app, migrations or other workers go through
+    db_utils in another process and cannot reach this cache, so for them
+    DASHBOARD_CACHE_TTL_SECONDS (default 5s) is the only bound on staleness.
+    """
+    return await async_db.dashboard_stats(current_user["contractor_id"], current_user.get("contractor", ""))
@@ -4,10 +4,11 @@ from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import sys
 sys.path.append('..')
-from db_utils import get_sqlalchemy_engine
+import async_db
 
 # JWT Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
@@ -33,40 +34,22 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def authenticate_user(contractor: str, username: str, password: str):
-    engine = get_sqlalchemy_engine()
-    with engine.begin() as conn:
-        # Get contractor_id
-        result = conn.execute(
-            "SELECT id FROM contractors WHERE name = %s" if not os.getenv("DATABASE_URL", "").startswith("sqlite") else "SELECT id FROM contractors WHERE name = ?",
-            (contractor,)
-        )
-        contractor_row = result.fetchone()
-        if not contractor_row:
-            return None
-        
-        contractor_id = contractor_row[0]
-        
-        # Get user
-        result = conn.execute(
-            "SELECT id, username, password_hash, role, contractor_id FROM users WHERE contractor_id = %s AND username = %s" if not os.getenv("DATABASE_URL", "").startswith("sqlite") else "SELECT id, username, password_hash, role, contractor_id FROM users WHERE contractor_id = ? AND username = ?",
-            (contractor_id, username)
-        )
-        user = result.fetchone()
-        
-        if not user:
-            return None
-        
-        if not verify_password(password, user[2]):
-            return None
-        
-        return {
-            "id": user[0],
-            "username": user[1],
-            "role": user[3],
-            "contractor": contractor,
-            "contractor_id": user[4]
-        }
+async def authenticate_user(contractor: str, username: str, password: str):
+    user = await async_db.get_login_user(contractor, username)
+    if not user:
+        return None
+
+    # bcrypt is deliberately slow; verify off the event loop
+    if not await run_in_threadpool(verify_password, password, user["password_hash"]):
+        return None
+
+    return {
+        "id": user["id"],
+        "username": user["username"],
+        "role": user["role"],
+        "contractor": contractor,
+        "contractor_id": user["contractor_id"]
+    }
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     credentials_exception = HTTPException(
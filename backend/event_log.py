@@ -0,0 +1,270 @@
+"""
+Append-only event log behind /api/events/batch.
+
+Events go into a SQLite table in WAL mode instead of one JSON file rewritten
+per request:
+- each batch is a single transaction, so an append is atomic and costs
+  O(batch) no matter how many events are already stored;
+- concurrent requests (threads or worker processes) serialize on SQLite's
+  write lock instead of racing on read-modify-write of a shared file;
+- with synchronous=NORMAL a commit is a WAL append and fsync happens once per
+  checkpoint, batching the disk flushes of many ingests;
+- readers page by offset (the append sequence) or ingest time without
+  blocking writers.
+
+Events carry a client-generated id so offline queues can replay a batch
+safely. ``event_ids`` is the dedup index over the last
+EVENT_DEDUP_WINDOW_HOURS; an in-memory bloom filter in front of it means an
+id that was never seen skips the lookup, and only probable repeats pay for
+the exact check. A replayed event is reported as a duplicate and not written.
+"""
+import datetime
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+EVENT_LOG_DB = os.getenv("EVENT_LOG_DB", "events_log.db")
+# Legacy JSON-array store; imported into the event log once, on first use
+EVENT_STORE_FILE = os.getenv("EVENT_STORE_FILE", "events_store.json")
+
+# How long an event id is remembered for dedup; covers a device that stays
+# offline for a whole shift (or weekend) and replays its queue afterwards
+EVENT_DEDUP_WINDOW_HOURS = float(os.getenv("EVENT_DEDUP_WINDOW_HOURS", "72"))
+# Expected ids per window and target false-positive rate of the bloom filter
+EVENT_DEDUP_CAPACITY = int(os.getenv("EVENT_DEDUP_CAPACITY", "1000000"))
+EVENT_DEDUP_FP_RATE = 0.01
+# Expired ids are pruned (and the bloom filter rebuilt) at most this often
+_DEDUP_PRUNE_INTERVAL_SECONDS = 600
+
+# Page size for /api/events reads
+DEFAULT_READ_LIMIT = 500
+MAX_READ_LIMIT = 5000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL,
+    device_id TEXT,
+    event TEXT NOT NULL,
+    patrol_id TEXT,
+    timestamp TEXT,
+    location TEXT,
+    meta TEXT,
+    ingested_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_ingested_at ON events (ingested_at);
+CREATE TABLE IF NOT EXISTS event_ids (
+    id TEXT PRIMARY KEY,
+    seq INTEGER,
+    seen_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_event_ids_seen_at ON event_ids (seen_at);
+"""
+
+_INSERT = """
+    INSERT INTO events (id, device_id, event, patrol_id, timestamp, location, meta, ingested_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Claims the id; ignored (rowcount 0) if any process already has it
+_CLAIM_ID = "INSERT OR IGNORE INTO event_ids (id, seq, seen_at) VALUES (?, NULL, ?)"
+
+_COLUMNS = "seq, id, device_id, event, patrol_id, timestamp, location, meta, ingested_at"
+
+
+def normalize_time(value):
+    """ISO-8601 string in the form ingested_at is stored in (ValueError if unparsable)"""
+    return datetime.datetime.fromisoformat(value).isoformat()
+
+
+class BloomFilter:
+    """Fixed-size bloom filter over strings (no false negatives, ~fp_rate false positives)"""
+
+    def __init__(self, capacity, fp_rate=EVENT_DEDUP_FP_RATE):
+        bits = max(8, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.size = bits
+        self.hashes = max(1, round(bits / capacity * math.log(2)))
+        self._bits = bytearray((bits + 7) // 8)
+
+    def _positions(self, key):
+        # Double hashing: h1 + i*h2 from one 128-bit digest
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class EventLog:
+    """SQLite-backed append-only log; one instance per process is enough"""
+
+    def __init__(self, path=EVENT_LOG_DB, dedup_window_hours=EVENT_DEDUP_WINDOW_HOURS):
+        self.path = path
+        self.dedup_window = datetime.timedelta(hours=dedup_window_hours)
+        self._lock = threading.Lock()
+        # Autocommit mode; append() opens its own write transaction
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._last_prune = 0.0
+        self._prune_expired_ids()
+
+    def _prune_expired_ids(self):
+        """Drop ids older than the dedup window and rebuild the bloom filter from the rest"""
+        cutoff = (datetime.datetime.utcnow() - self.dedup_window).isoformat()
+        self._conn.execute("DELETE FROM event_ids WHERE seen_at < ?", (cutoff,))
+        bloom = BloomFilter(EVENT_DEDUP_CAPACITY)
+        for (event_id,) in self._conn.execute("SELECT id FROM event_ids"):
+            bloom.add(event_id)
+        self._bloom = bloom
+        self._last_prune = time.monotonic()
+
+    def _seen_offset(self, cur, event_id):
+        """Exact dedup check: (True, offset of the first copy) if the id is in the window"""
+        row = cur.execute("SELECT seq FROM event_ids WHERE id = ?", (event_id,)).fetchone()
+        return (True, row[0]) if row else (False, None)
+
+    def append(self, entries):
+        """Atomically append event dicts, skipping ids already seen in the dedup window.
+
+        Returns one (status, offset) per entry: ("accepted", new offset) or
+        ("duplicate", offset of the copy stored earlier).
+        """
+        rows = [
+            (
+                entry["id"],
+                entry.get("device_id"),
+                entry["event"],
+                entry.get("patrol_id"),
+                entry.get("timestamp"),
+                json.dumps(entry.get("location"), default=str),
+                json.dumps(entry.get("meta"), default=str),
+                entry["ingested_at"],
+            )
+            for entry in entries
+        ]
+        results = []
+        with self._lock:
+            if time.monotonic() - self._last_prune > _DEDUP_PRUNE_INTERVAL_SECONDS:
+                self._prune_expired_ids()
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                added = []
+                for row in rows:
+                    event_id = row[0]
+                    # Bloom miss: never seen by this process, go straight to the claim
+                    if event_id in self._bloom:
+                        seen, offset = self._seen_offset(cur, event_id)
+                        if seen:
+                            results.append(("duplicate", offset))
+                            continue
+                    cur.execute(_CLAIM_ID, (event_id, row[-1]))
+                    if cur.rowcount == 0:
+                        # Claimed by another worker process since our filter was built
+                        results.append(("duplicate", self._seen_offset(cur, event_id)[1]))
+                        continue
+                    cur.execute(_INSERT, row)
+                    offset = cur.lastrowid
+                    cur.execute("UPDATE event_ids SET seq = ? WHERE id = ?", (offset, event_id))
+                    results.append(("accepted", offset))
+                    added.append(event_id)
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+            finally:
+                cur.close()
+            # Only after commit, so a rolled-back batch leaves no false "seen" bits
+            for event_id in added:
+                self._bloom.add(event_id)
+        return results
+
+    def read(self, offset=0, limit=DEFAULT_READ_LIMIT, since=None, until=None):
+        """Events from ``offset`` on (optionally ingested in [since, until)), oldest first.
+
+        Returns (events, next_offset); pass next_offset back to continue, it
+        stays at ``offset`` when there is nothing newer yet.
+        """
+        conditions = ["seq >= ?"]
+        params = [offset]
+        if since:
+            conditions.append("ingested_at >= ?")
+            params.append(since)
+        if until:
+            conditions.append("ingested_at < ?")
+            params.append(until)
+        params.append(limit)
+        query = f"SELECT {_COLUMNS} FROM events WHERE {' AND '.join(conditions)} ORDER BY seq LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        events = [
+            {
+                "offset": seq,
+                "id": event_id,
+                "device_id": device_id,
+                "event": event,
+                "patrol_id": patrol_id,
+                "timestamp": timestamp,
+                "location": json.loads(location) if location else None,
+                "meta": json.loads(meta) if meta else None,
+                "ingested_at": ingested_at,
+            }
+            for seq, event_id, device_id, event, patrol_id, timestamp, location, meta, ingested_at in rows
+        ]
+        next_offset = events[-1]["offset"] + 1 if events else offset
+        return events, next_offset
+
+    def import_json_store(self, json_path):
+        """One-time move of a legacy JSON-array event store into the log.
+
+        The file is renamed to ``<name>.imported`` afterwards so it is never
+        imported twice. Returns the number of events imported.
+        """
+        if not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                store = json.load(f)
+        except Exception:
+            store = []
+        if store:
+            now = datetime.datetime.utcnow().isoformat()
+            self.append([dict(entry, ingested_at=entry.get("ingested_at") or now) for entry in store])
+        os.replace(json_path, json_path + ".imported")
+        return len(store)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_event_log = None
+_event_log_lock = threading.Lock()
+
+
+def get_event_log(legacy_store=None):
+    """The process-wide event log, opened (and ``legacy_store`` imported) on first use"""
+    global _event_log
+    if _event_log is None:
+        with _event_log_lock:
+            if _event_log is None:
+                log = EventLog()
+                if legacy_store:
+                    imported = log.import_json_store(legacy_store)
+                    if imported:
+                        print(f"Imported {imported} events from {legacy_store}")
+                _event_log = log
+    return _event_log
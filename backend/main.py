@@ -2,8 +2,8 @@ import os
 import json
 import uuid
 import datetime
-from typing import List
-from fastapi import FastAPI, HTTPException, Depends, Header, Request
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 # dynamic import of python-dotenv to avoid static editor/lint errors when not installed
@@ -16,12 +16,18 @@ try:
 except Exception:
     # dotenv not available; environment variables should be provided by the runtime environment.
     pass
+# After dotenv, so EVENT_LOG_DB / EVENT_STORE_FILE from .env are picked up
+try:
+    from backend.event_log import (
+        DEFAULT_READ_LIMIT, EVENT_STORE_FILE, MAX_READ_LIMIT, get_event_log, normalize_time,
+    )
+except ImportError:
+    # Run as a script from inside backend/
+    from event_log import DEFAULT_READ_LIMIT, EVENT_STORE_FILE, MAX_READ_LIMIT, get_event_log, normalize_time
 
 API_TOKEN = os.getenv("API_TOKEN", "replace_with_device_token")
 S3_BUCKET = os.getenv("S3_BUCKET")
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
-EVENT_STORE_FILE = os.getenv("EVENT_STORE_FILE", "events_store.json")
-
 app = FastAPI(title="VTS Backend - Presign & Batch Ingest")
 
 # CORS Configuration
@@ -31,6 +37,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # keyset pagination cursor on list endpoints
 )
 
 # Include API routes
@@ -40,6 +47,24 @@ try:
 except ImportError:
     print("Warning: Could not import API routes. Auth endpoints may not be available.")
 
+@app.on_event("startup")
+def initialize_database():
+    # Schema bootstrap plus the vehicle_last_position backfill the dashboard counts from
+    try:
+        from db_utils import bootstrap_database, ensure_vehicle_last_position_once
+    except ImportError:
+        return
+    bootstrap_database()
+    ensure_vehicle_last_position_once()
+
+@app.on_event("shutdown")
+async def close_database():
+    try:
+        from async_db import dispose_async_engine
+    except ImportError:
+        return
+    await dispose_async_engine()
+
 def verify_token(authorization: str = Header(None)):
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing Authorization")
@@ -50,6 +75,13 @@ def verify_token(authorization: str = Header(None)):
         raise HTTPException(status_code=401, detail="Invalid token")
     return token
 
+# Offline queue replay (POST /api/sync/events), into the same event log; device token required
+try:
+    from backend.queue_sync import router as sync_router
+    app.include_router(sync_router, dependencies=[Depends(verify_token)])
+except ImportError:
+    print("Warning: Could not import queue sync routes. /api/sync/events will not be available.")
+
 # Replace static boto3 import with dynamic import to avoid editor diagnostics when package not installed
 try:
     import importlib
@@ -61,6 +93,8 @@ except Exception:
 
 # Models
 class EventItem(BaseModel):
+    # Client-generated id, stable across retries of the same queued event
+    event_id: str | None = None
     patrol_id: str | None = None
     event: str
     timestamp: str | None = None
@@ -107,45 +141,51 @@ def presign_upload(filename: str, token: str = Depends(verify_token)):
 def ingest_batch(payload: BatchPayload, token: str = Depends(verify_token)):
     """
     Accepts a batch of events (queued from mobile when offline).
-    Stores to a local JSON file (append). Adjust to use DB in production.
+    Appends them to the event log in one atomic write; each result carries
+    the event's offset for /api/events reads. Events whose event_id was
+    already ingested come back as "duplicate" and are not stored again, so
+    a client can resend its whole queue after a lost response.
     """
-    out = []
     timestamp = datetime.datetime.utcnow().isoformat()
-    store = []
-    # read existing
-    if os.path.exists(EVENT_STORE_FILE):
-        try:
-            with open(EVENT_STORE_FILE, "r", encoding="utf-8") as f:
-                store = json.load(f)
-        except Exception:
-            store = []
+    entries = []
     for ev in payload.events:
-        entry = {
-            "id": uuid.uuid4().hex,
+        entries.append({
+            "id": ev.event_id or uuid.uuid4().hex,
             "device_id": payload.device_id,
             "event": ev.event,
             "patrol_id": ev.patrol_id,
-            "timestamp": ev.timestamp or datetime.datetime.utcnow().isoformat(),
+            "timestamp": ev.timestamp or timestamp,
             "location": ev.location,
             "meta": ev.meta,
             "ingested_at": timestamp
-        }
-        store.append(entry)
-        out.append({"ok": True, "id": entry["id"]})
-    # write back
-    with open(EVENT_STORE_FILE, "w", encoding="utf-8") as f:
-        json.dump(store, f, indent=2, default=str)
-    return {"ok": True, "ingested": len(out), "results": out}
+        })
+    results = get_event_log(EVENT_STORE_FILE).append(entries)
+    out = [
+        {"ok": True, "id": entry["id"], "status": status, "offset": offset}
+        for entry, (status, offset) in zip(entries, results)
+    ]
+    accepted = sum(1 for r in out if r["status"] == "accepted")
+    return {"ok": True, "ingested": accepted, "duplicates": len(out) - accepted, "results": out}
 
 @app.get("/api/events")
-def list_events(token: str = Depends(verify_token)):
-    if os.path.exists(EVENT_STORE_FILE):
-        with open(EVENT_STORE_FILE, "r", encoding="utf-8") as f:
-            try:
-                return {"events": json.load(f)}
-            except Exception:
-                return {"events": []}
-    return {"events": []}
+def list_events(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_READ_LIMIT, ge=1, le=MAX_READ_LIMIT),
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    token: str = Depends(verify_token)
+):
+    """
+    Events in append order starting at ``offset``, optionally limited to an
+    ingest-time range [since, until). Continue from ``next_offset``.
+    """
+    try:
+        since = normalize_time(since) if since else None
+        until = normalize_time(until) if until else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since/until must be ISO-8601 timestamps")
+    events, next_offset = get_event_log(EVENT_STORE_FILE).read(offset, limit, since, until)
+    return {"events": events, "next_offset": next_offset}
 
 # --- Convenience runner: start backend + Streamlit UI together ----------------
 if __name__ == "__main__":
@@ -11,11 +11,13 @@ class PresignRequest(BaseModel):
     content_type: str = "image/jpeg"
 
 def get_s3_client():
+    # S3_ENDPOINT_URL points the client at an S3-compatible server such as MinIO
     return boto3.client(
         "s3",
         aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
         aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-        region_name=os.getenv("AWS_REGION")
+        region_name=os.getenv("AWS_REGION"),
+        endpoint_url=os.getenv("S3_ENDPOINT_URL") or None
     )
 
 @router.post("/api/s3/presign")
@@ -1,19 +1,41 @@
+import datetime
+import uuid
+
 from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel
 from typing import List
 
+try:
+    from backend.event_log import EVENT_STORE_FILE, get_event_log
+except ImportError:
+    from event_log import EVENT_STORE_FILE, get_event_log
+
 router = APIRouter()
 
 class QueuedEvent(BaseModel):
     endpoint: str
     payload: dict
+    # Client-generated id, reused when the queue is replayed
+    id: str | None = None
 
 @router.post("/api/sync/events")
 def sync_events(events: List[QueuedEvent]):
-    # Example: iterate and process events (or store for async processing)
-    processed = []
-    for e in events:
-        # validate endpoint and payload, e.g. only allow specific endpoints like /patrols/checkin or /incidents
-        # For demo, just echo back
-        processed.append({"endpoint": e.endpoint, "status": "received"})
+    # Record queued events in the event log; replays of an id already seen are skipped
+    # validate endpoint and payload, e.g. only allow specific endpoints like /patrols/checkin or /incidents
+    timestamp = datetime.datetime.utcnow().isoformat()
+    entries = [
+        {
+            "id": e.id or uuid.uuid4().hex,
+            "event": e.endpoint,
+            "meta": e.payload,
+            "timestamp": timestamp,
+            "ingested_at": timestamp,
+        }
+        for e in events
+    ]
+    results = get_event_log(EVENT_STORE_FILE).append(entries)
+    processed = [
+        {"id": entry["id"], "endpoint": e.endpoint, "status": status}
+        for e, entry, (status, _offset) in zip(events, entries, results)
+    ]
     return {"ok": True, "processed": processed}
@@ -13,6 +13,7 @@ import io
 import os
 import subprocess
 from db_utils import get_sqlalchemy_engine, DATABASE_URL
+from blob_store import BLOB_STORE_DIR, backup_local_blobs
 
 def backup_management_page():
     """Backup management page for resident engineer"""
@@ -406,7 +407,7 @@ def backup_management_page():
                             st.warning("Database file not found")
 
                         # Images backup
-                        if os.path.exists(IMAGES_DIR):
+                        if os.path.exists(IMAGES_DIR) or os.path.exists(BLOB_STORE_DIR):
                             img_backup = f'uploaded_images_backup_{timestamp}.zip'
                             img_path = os.path.join(BACKUP_DIR, img_backup)
                             with zipfile.ZipFile(img_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
@@ -415,6 +416,8 @@ def backup_management_page():
                                         file_path = os.path.join(root, file)
                                         arcname = os.path.relpath(file_path, IMAGES_DIR)
                                         zipf.write(file_path, arcname)
+                                # Incident images saved to the local blob store
+                                backup_local_blobs(zipf)
                             st.info(f"✅ Images backup created: {img_backup}")
                         else:
                             st.warning("Images directory not found")
@@ -533,7 +536,7 @@ def backup_management_page():
 
                         # Images backup
                         images_backup = None
-                        if os.path.exists(IMAGES_DIR):
+                        if os.path.exists(IMAGES_DIR) or os.path.exists(BLOB_STORE_DIR):
                             img_backup = f'uploaded_images_backup_{timestamp}.zip'
                             img_path = os.path.join(BACKUP_DIR, img_backup)
                             with zipfile.ZipFile(img_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
@@ -542,6 +545,8 @@ def backup_management_page():
                                         file_path = os.path.join(root, file)
                                         arcname = os.path.relpath(file_path, IMAGES_DIR)
                                         zipf.write(file_path, arcname)
+                                # Incident images saved to the local blob store
+                                backup_local_blobs(zipf)
                             st.info(f"✅ Images backup created: {img_backup}")
                             images_backup = img_path
 
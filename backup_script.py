@@ -40,6 +40,8 @@ except ImportError:
     print("Google API libraries not installed. Install with: pip install google-api-python-client google-auth-httplib2 google-auth-oauthlib")
     GOOGLE_API_AVAILABLE = False
 
+from blob_store import BLOB_STORE_DIR, backup_local_blobs
+
 # Configuration
 DB_PATH = 'vts_database.db'
 IMAGES_DIR = 'uploaded_accident_images'
@@ -214,9 +216,9 @@ def create_database_backup():
     return backup_path
 
 def create_images_backup():
-    """Create a compressed backup of uploaded images"""
-    if not os.path.exists(IMAGES_DIR):
-        logging.warning(f"Images directory {IMAGES_DIR} not found")
+    """Create a compressed backup of uploaded images and the local blob store (incident images)"""
+    if not os.path.exists(IMAGES_DIR) and not os.path.exists(BLOB_STORE_DIR):
+        logging.warning(f"Neither {IMAGES_DIR} nor {BLOB_STORE_DIR} found")
         return None
 
     # Create backups directory if it doesn't exist
@@ -234,8 +236,9 @@ def create_images_backup():
                 file_path = os.path.join(root, file)
                 arcname = os.path.relpath(file_path, IMAGES_DIR)
                 zipf.write(file_path, arcname)
+        blobs = backup_local_blobs(zipf)
 
-    logging.info(f"Images backup created: {backup_path}")
+    logging.info(f"Images backup created: {backup_path} ({blobs} incident image blobs)")
     return backup_path
 
 def upload_to_google_drive(file_path, service):
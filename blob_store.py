@@ -0,0 +1,203 @@
+# blob_store.py - Content-addressed storage for image bytes
+"""
+Image bytes live outside the database, keyed by their SHA-256.
+
+The database keeps only metadata and the key (``incident_images.blob_key``),
+so backups, migrations and search queries no longer move image payloads.
+Identical uploads share one object.
+
+Backends, picked with BLOB_STORE:
+- ``local`` (default): files under BLOB_STORE_DIR, sharded by key prefix;
+- ``s3``: S3_BUCKET / S3_PREFIX through backend/presign.py's client. Set
+  S3_ENDPOINT_URL to point it at MinIO or another S3-compatible server.
+
+Hosts with an ephemeral filesystem (Render) must use ``s3``, or point
+BLOB_STORE_DIR at a persistent disk; get_blob_store() refuses the default
+local directory there. Local blobs are included in the images backup zip
+(backup_local_blobs / restore_local_blobs).
+
+Move rows that still hold inline bytes with ``python blob_store.py migrate``.
+"""
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+
+BLOB_STORE = os.getenv("BLOB_STORE", "local").lower()
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "blob_store")
+
+# Folder the local blobs take inside an images backup zip
+BACKUP_ARCHIVE_PREFIX = "blob_store/"
+
+
+def blob_key(data: bytes) -> str:
+    """Content address of ``data`` (hex SHA-256)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class LocalBlobStore:
+    """Blobs as files under ``root``, at <root>/<key[:2]>/<key[2:4]>/<key>"""
+
+    def __init__(self, root=BLOB_STORE_DIR):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def put(self, data, content_type=None):
+        """Store ``data`` unless an identical blob is already there; returns its key"""
+        key = blob_key(data)
+        path = self._path(key)
+        if os.path.exists(path):
+            return key
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a reader never sees a partial file under the key
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return key
+
+    def get(self, key):
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def delete(self, key):
+        if self.exists(key):
+            os.remove(self._path(key))
+
+
+class S3BlobStore:
+    """Blobs as objects <S3_PREFIX>blobs/<key> in an S3-compatible bucket"""
+
+    def __init__(self, bucket=None, prefix=None, client=None):
+        self.bucket = bucket or os.getenv("S3_BUCKET")
+        if not self.bucket:
+            raise RuntimeError("S3_BUCKET not configured")
+        self.prefix = os.getenv("S3_PREFIX", "") if prefix is None else prefix
+        if client is None:
+            # The client comes from backend/presign.py, which needs boto3
+            try:
+                import boto3
+            except ImportError as e:
+                raise RuntimeError("BLOB_STORE=s3 needs boto3 (pip install boto3)") from e
+            try:
+                from backend.presign import get_s3_client
+            except ImportError:
+                from presign import get_s3_client
+            client = get_s3_client()
+        self.client = client
+
+    def _object_key(self, key):
+        return f"{self.prefix}blobs/{key}"
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put(self, data, content_type=None):
+        """Upload ``data`` unless an identical object exists; returns its key"""
+        key = blob_key(data)
+        if not self.exists(key):
+            extra = {"ContentType": content_type} if content_type else {}
+            self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data, **extra)
+        return key
+
+    def get(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))["Body"].read()
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def presigned_get_url(self, key, expires_in=3600):
+        """Time-limited download URL, so clients can fetch the bytes straight from S3"""
+        return self.client.generate_presigned_url(
+            ClientMethod="get_object",
+            Params={"Bucket": self.bucket, "Key": self._object_key(key)},
+            ExpiresIn=expires_in,
+        )
+
+
+_blob_store = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    """The process-wide store for the configured BLOB_STORE backend"""
+    global _blob_store
+    if _blob_store is None:
+        with _blob_store_lock:
+            if _blob_store is None:
+                if BLOB_STORE == "s3":
+                    _blob_store = S3BlobStore()
+                elif BLOB_STORE == "local":
+                    if os.getenv("RENDER") and not os.getenv("BLOB_STORE_DIR"):
+                        raise RuntimeError(
+                            "BLOB_STORE=local on Render would lose images on every deploy; "
+                            "set BLOB_STORE=s3 or BLOB_STORE_DIR to a persistent disk"
+                        )
+                    _blob_store = LocalBlobStore()
+                else:
+                    raise RuntimeError(f"Unknown BLOB_STORE {BLOB_STORE!r} (expected 'local' or 's3')")
+    return _blob_store
+
+
+def backup_local_blobs(zipf, root=BLOB_STORE_DIR):
+    """Add the local blob files to an open ZipFile under BACKUP_ARCHIVE_PREFIX; returns the count"""
+    if BLOB_STORE != "local" or not os.path.isdir(root):
+        return 0
+    count = 0
+    for dirpath, _dirs, files in os.walk(root):
+        for name in files:
+            if name.endswith(".tmp"):
+                continue
+            file_path = os.path.join(dirpath, name)
+            arcname = BACKUP_ARCHIVE_PREFIX + os.path.relpath(file_path, root).replace(os.sep, "/")
+            zipf.write(file_path, arcname)
+            count += 1
+    return count
+
+
+def restore_local_blobs(zipf, root=BLOB_STORE_DIR):
+    """Put the blobs of a backup zip back under ``root``; returns the count.
+
+    Blobs are immutable and content-addressed, so ones already present are
+    left as they are.
+    """
+    store = LocalBlobStore(root)
+    count = 0
+    for name in zipf.namelist():
+        key = name[len(BACKUP_ARCHIVE_PREFIX):].rsplit("/", 1)[-1]
+        if not name.startswith(BACKUP_ARCHIVE_PREFIX) or not key or store.exists(key):
+            continue
+        data = zipf.read(name)
+        if blob_key(data) != key:
+            print(f"⚠️ Skipped corrupt blob {name} in backup")
+            continue
+        store.put(data)
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["migrate"]:
+        print("Usage: python blob_store.py migrate")
+        sys.exit(1)
+    from db_utils import move_incident_images_to_blob_store
+    moved = move_incident_images_to_blob_store()
+    print(f"Moved {moved} incident images into the {BLOB_STORE} blob store")
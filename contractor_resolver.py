@@ -0,0 +1,89 @@
+# contractor_resolver.py - Cached vehicle -> contractor lookup for idle file parsing
+import threading
+import time
+
+from sqlalchemy import text
+
+from db_utils import get_sqlalchemy_engine
+from plate_utils import extract_license_plate, normalize_plates
+
+# Seconds a loaded vehicles->contractors mapping stays valid
+VEHICLE_CONTRACTOR_TTL = 300
+
+_cache = {"mapping": None, "loaded_at": 0.0}
+_lock = threading.Lock()
+
+
+def _compact(plate):
+    """Plate key used for matching: upper case with spaces and dashes removed"""
+    return plate.replace(' ', '').replace('-', '').upper()
+
+
+def _load_mapping():
+    """Load every vehicle plate with its contractor id in a single query"""
+    engine = get_sqlalchemy_engine()
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT v.plate_number, c.id
+            FROM vehicles v
+            JOIN contractors c ON c.name = v.contractor
+            ORDER BY v.id
+        """)).fetchall()
+
+    mapping = {}
+    for plate_number, contractor_id in rows:
+        if plate_number:
+            # Keep the first vehicle for a plate, like the old LIMIT-less fetchone()
+            mapping.setdefault(_compact(plate_number), contractor_id)
+    return mapping
+
+
+def get_vehicle_contractor_map():
+    """Return the normalized-plate -> contractor_id dict, reloading it after the TTL"""
+    with _lock:
+        mapping = _cache["mapping"]
+        if mapping is not None and time.monotonic() - _cache["loaded_at"] < VEHICLE_CONTRACTOR_TTL:
+            return mapping
+        try:
+            mapping = _load_mapping()
+        except Exception as e:
+            # Don't cache failures - e.g. the vehicles table may not exist yet
+            print(f"Warning: could not load vehicle contractors: {e}")
+            return {}
+        _cache["mapping"] = mapping
+        _cache["loaded_at"] = time.monotonic()
+        return mapping
+
+
+def invalidate_vehicle_contractor_cache():
+    """Drop the cached mapping so the next lookup re-reads vehicles"""
+    with _lock:
+        _cache["mapping"] = None
+        _cache["loaded_at"] = 0.0
+
+
+def _lookup(mapping, plate):
+    key = _compact(plate)
+    contractor_id = mapping.get(key)
+    if contractor_id is None and key:
+        # Same fallback as the old LIKE '%plate%' query, but over the in-memory keys
+        for vehicle_key, vehicle_contractor in mapping.items():
+            if key in vehicle_key:
+                return vehicle_contractor
+    return contractor_id
+
+
+def resolve_contractor_id(vehicle_string):
+    """Get contractor_id from vehicle string (may contain plate + contractor name)"""
+    plate = extract_license_plate(vehicle_string)
+    if not plate:
+        return None
+    return _lookup(get_vehicle_contractor_map(), plate)
+
+
+def resolve_contractor_ids(vehicles):
+    """Resolve a whole column of vehicle strings to contractor ids with one mapping load"""
+    plates = normalize_plates(vehicles)
+    mapping = get_vehicle_contractor_map()
+    resolved = {plate: _lookup(mapping, plate) for plate in plates.dropna().unique()}
+    return plates.map(resolved)
@@ -1,10 +1,16 @@
 """
-Copy non-binary tables from local SQLite `vts_database.db` to a target PostgreSQL database.
-Skips image/blob tables (`incident_images`, `accident_reports_images`).
+Copy tables from local SQLite `vts_database.db` to a target PostgreSQL database.
+`incident_images` is copied as metadata only: inline image bytes are put in the
+blob store (BLOB_STORE, see blob_store.py) on the way and only their blob_key is
+copied, so point BLOB_STORE at the store the target deployment reads.
+Skips `accident_reports_images`.
 Usage: adjust TARGET_URL below and run: python copy_sqlite_to_postgres.py
 """
 from sqlalchemy import create_engine, MetaData, Table, select, text
 from sqlalchemy.exc import SQLAlchemyError
+from blob_store import BLOB_STORE, get_blob_store
+from db_utils import ensure_incident_image_blob_columns
+import mimetypes
 import os
 import sys
 
@@ -21,7 +27,23 @@ if "sslmode" not in TARGET_URL:
 
 SQLITE_URL = "sqlite:///vts_database.db"
 SCHEMA_FILE = "schema.sql"
-SKIP_TABLES = {"incident_images", "accident_reports_images"}
+SKIP_TABLES = {"accident_reports_images"}
+# Tables whose inline bytes move to the blob store: table -> (bytes column, name column)
+BLOB_TABLES = {"incident_images": ("image_data", "image_name")}
+
+def _move_to_blob_store(data, bytes_column, name_column):
+    """Swap a row's inline bytes for a blob_key (plus content_type/size_bytes)"""
+    payload = data.get(bytes_column)
+    if payload is None or data.get("blob_key"):
+        data[bytes_column] = None
+        return data
+    payload = bytes(payload)
+    content_type = data.get("content_type") or mimetypes.guess_type(data.get(name_column) or "")[0]
+    data["blob_key"] = get_blob_store().put(payload, content_type=content_type)
+    data["content_type"] = content_type
+    data["size_bytes"] = len(payload)
+    data[bytes_column] = None
+    return data
 
 def _mask(url: str) -> str:
     if not url:
@@ -79,6 +101,8 @@ if os.path.exists(SCHEMA_FILE):
                 for stmt in filtered:
                     conn.execute(text(stmt))
             print("✅ Executed schema statements on Postgres (filtered)")
+            # An incident_images table created before the blob store lacks its columns
+            ensure_incident_image_blob_columns(pg_engine)
         except SQLAlchemyError as e:
             print("Error applying schema to Postgres:", e)
             sys.exit(4)
@@ -142,6 +166,8 @@ for s_table in s_meta.sorted_tables:
                 for k, v in list(data.items()):
                     if isinstance(v, memoryview):
                         data[k] = bytes(v)
+                if tname in BLOB_TABLES:
+                    data = _move_to_blob_store(data, *BLOB_TABLES[tname])
                 # Execute insert (do nothing on conflict by primary key)
                 ins = insert(p_table).values(**data)
                 try:
@@ -156,5 +182,4 @@ for s_table in s_meta.sorted_tables:
         print(f"  ❌ Transaction failure while inserting into {tname}:", e)
         continue
 
-print("Migration complete. Note: image tables were skipped.")
-print("If you need images migrated, we can add a binary-safe path using psycopg2 and bytea inserts.")
+print(f"Migration complete. Incident image bytes were written to the {BLOB_STORE} blob store.")
@@ -1,14 +1,22 @@
 # db_utils.py - Cleaned SQLite/PostgreSQL version
-from sqlalchemy import create_engine, text
+from sqlalchemy import bindparam, create_engine, inspect, text
+from sqlalchemy.pool import QueuePool
+import base64
 import bcrypt
+import json
+import mimetypes
 import pandas as pd
 import streamlit as st
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, timezone
 import os
 import sqlite3
+import threading
+import time
 import traceback
 import urllib.parse
-from sqlalchemy.exc import ArgumentError
+from sqlalchemy.exc import ArgumentError, TimeoutError as PoolTimeoutError
+from blob_store import get_blob_store
 
 # ------------------- SQLITE DATETIME ADAPTER -------------------
 def adapt_datetime(dt):
@@ -78,18 +86,90 @@ def _mask_db_url(url: str) -> str:
         return (url[:30] + "...") if len(url) > 30 else url
 
 
-# Print masked DATABASE_URL at startup to aid debugging (safe to log)
-print(f"DATABASE_URL (masked): {_mask_db_url(DATABASE_URL)}")
+# ------------------- CONNECTION POOL -------------------
+# One engine (and pool) per process, shared by every Streamlit session and API request.
+# Sessions hold a connection only for the duration of a query, so the pool is
+# sized for concurrent queries, not concurrent users.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds to wait for a free connection before failing (fail fast instead of stalling)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Seconds before a pooled connection is replaced (below typical server/proxy idle cutoffs)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Per-statement limit on PostgreSQL in milliseconds (0 disables)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how often and how long callers wait for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics_lock = threading.Lock()
+        self._metrics = {"checkouts": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0, "timeouts": 0}
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            with self._metrics_lock:
+                self._metrics["timeouts"] += 1
+            raise
+        waited = time.perf_counter() - started
+        with self._metrics_lock:
+            self._metrics["checkouts"] += 1
+            self._metrics["wait_seconds_total"] += waited
+            self._metrics["wait_seconds_max"] = max(self._metrics["wait_seconds_max"], waited)
+        return connection
+
+    def recreate(self):
+        # pool_pre_ping / invalidation rebuilds the pool; keep counting on the new one
+        pool = super().recreate()
+        pool._metrics_lock = self._metrics_lock
+        pool._metrics = self._metrics
+        return pool
+
+    def metrics(self):
+        with self._metrics_lock:
+            snapshot = dict(self._metrics)
+        checkouts = snapshot["checkouts"]
+        snapshot["wait_seconds_avg"] = snapshot["wait_seconds_total"] / checkouts if checkouts else 0.0
+        snapshot.update({
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "idle": self.checkedin(),
+            "overflow": self.overflow(),
+            "max_overflow": self._max_overflow,
+            "timeout": self._timeout,
+        })
+        return snapshot
+
+
+def _pool_options():
+    return {
+        "poolclass": MeteredQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+def _sqlite_engine():
+    return create_engine(
+        "sqlite:///vts_database.db",
+        connect_args={"check_same_thread": False},
+        **_pool_options()
+    )
 
 # ------------------- ENGINE CREATION (ONLY ONCE) -------------------
 def create_db_engine():
     # If no DATABASE_URL provided, use local SQLite
     if not DATABASE_URL:
         print("No DATABASE_URL found — using local SQLite: vts_database.db")
-        return create_engine(
-            "sqlite:///vts_database.db",
-            connect_args={"check_same_thread": False}
-        )
+        return _sqlite_engine()
 
     # Attempt to connect to PostgreSQL
     print(f"Attempting to connect to database: {_mask_db_url(DATABASE_URL)}")
@@ -108,15 +188,14 @@ def create_db_engine():
     if not has_sslmode_in_url:
         connect_args["sslmode"] = "require"
 
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+
     try:
         engine = create_engine(
             DATABASE_URL,
-            pool_pre_ping=True,
-            pool_size=3,
-            max_overflow=7,
-            pool_timeout=30,
-            pool_recycle=3600,
-            connect_args=connect_args
+            connect_args=connect_args,
+            **_pool_options()
         )
 
         # Test connection
@@ -135,39 +214,145 @@ def create_db_engine():
             print(f"Database connection failed: {e}")
 
         print("Falling back to local SQLite: vts_database.db")
-        return create_engine(
-            "sqlite:///vts_database.db",
-            connect_args={"check_same_thread": False}
-        )
+        return _sqlite_engine()
 
-engine = create_db_engine()
+# Created on first use so importing this module never touches the database
+_engine = None
+_engine_lock = threading.Lock()
 
 # ------------------- HELPER FUNCTIONS -------------------
 def get_sqlalchemy_engine():
-    """Get the SQLAlchemy engine instance"""
-    return engine
+    """Get the SQLAlchemy engine instance, creating it on first use"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                # Print masked DATABASE_URL once per process to aid debugging (safe to log)
+                print(f"DATABASE_URL (masked): {_mask_db_url(DATABASE_URL)}")
+                _engine = create_db_engine()
+    return _engine
+
+def __getattr__(name):
+    # Keeps `from db_utils import engine` working without an import-time engine
+    if name == "engine":
+        return get_sqlalchemy_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def get_connection():
-    """Get a raw database connection"""
-    return engine.raw_connection()
+    """Get a raw pooled connection; the caller must close() it to return it to the pool.
+
+    Prefer db_cursor(), which does that even when the query fails.
+    """
+    return get_sqlalchemy_engine().raw_connection()
+
+def param_marker(bind=None):
+    """DB-API placeholder for raw cursor SQL: '?' on SQLite, '%s' on PostgreSQL"""
+    return "?" if (bind or get_sqlalchemy_engine()).dialect.paramstyle == "qmark" else "%s"
+
+@contextmanager
+def db_cursor(commit=False, bind=None):
+    """Raw DB-API cursor on a pooled connection.
+
+    The connection goes back to the pool on exit, including when the body
+    raises (the transaction is rolled back). With ``commit`` the work is
+    committed when the body completes.
+    """
+    conn = (bind or get_sqlalchemy_engine()).raw_connection()
+    try:
+        cur = conn.cursor()
+        try:
+            yield cur
+            if commit:
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+    finally:
+        conn.close()
+
+def pool_metrics(bind=None):
+    """Checkout/wait counters and current usage of the shared connection pool"""
+    pool = (bind or get_sqlalchemy_engine()).pool
+    if isinstance(pool, MeteredQueuePool):
+        return pool.metrics()
+    return {"status": pool.status()}
 
 # ------------------- DATABASE INITIALIZATION -------------------
-def init_database():
-    """Initialize database tables if they don't exist"""
+# Bump when schema.sql gains tables or indexes that existing databases must pick up;
+# bootstrap_database() re-applies the schema once per version, never per import.
+SCHEMA_VERSION = 3
+SCHEMA_VERSION_NAME = "incident_image_blob_keys"
+# schema_version numbers are one sequence shared by every migration that records
+# itself there; take the next free number, and look rows up by name:
+#   1  hot_path_composite_indexes  migrate_indexes.py
+#   2  schema_sql_bootstrap        bootstrap_database (superseded by 3)
+#   3  incident_image_blob_keys    bootstrap_database
+#   4  idle_reports_natural_key    migrate_idle_natural_key.py
+INDEX_MIGRATION_VERSION = 1
+INDEX_MIGRATION_NAME = "hot_path_composite_indexes"
+IDLE_NATURAL_KEY_MIGRATION_VERSION = 4
+IDLE_NATURAL_KEY_MIGRATION_NAME = "idle_reports_natural_key"
+
+# The patrol cars monitored through GPRS: Wizpro (3), Paschal (2) and Avators (3)
+DEFAULT_VEHICLES = [
+    ('KDG 320Z', 'Wizpro'), ('KDS 374F', 'Wizpro'), ('KDK 825Y', 'Wizpro'),
+    ('KDC 873G', 'Paschal'), ('KDD 500X', 'Paschal'),
+    ('KAV 444A', 'Avators'), ('KAV 555A', 'Avators'), ('KAV 666A', 'Avators')
+]
+
+_bootstrapped = False
+_bootstrap_lock = threading.Lock()
+
+
+def _schema_statements(sql):
+    """Split schema SQL into single statements, without comments or trailing semicolons"""
+    statements = []
+    current_stmt = []
+    for line in sql.split('\n'):
+        # Remove comments
+        if '--' in line:
+            line = line[:line.index('--')]
+        line = line.strip()
+
+        if not line:
+            continue
+
+        current_stmt.append(line)
+
+        # A line ending with a semicolon closes the statement
+        if line.endswith(';'):
+            stmt = ' '.join(current_stmt)[:-1].strip()
+            if stmt:
+                statements.append(stmt)
+            current_stmt = []
+    return statements
+
+
+def _execute_schema_statement(conn, stmt):
+    # Savepoint per statement so one failure doesn't abort the rest on PostgreSQL
+    try:
+        with conn.begin_nested():
+            conn.execute(text(stmt))
+    except Exception as e:
+        print(f"Warning: failed to execute statement: {stmt[:80]}... Error: {e}")
+
+
+def init_database(bind=None):
+    """Initialize database tables if they don't exist.
+
+    Returns True when the schema was created (and default users seeded).
+    """
     print("Checking database initialization...")
+    bind = bind or get_sqlalchemy_engine()
 
     try:
-        with engine.begin() as conn:
+        with bind.begin() as conn:
             # Detect SQLite by engine dialect
-            is_sqlite = engine.dialect.name == "sqlite"
-
-            # Check if users table exists
-            if is_sqlite:
-                result = conn.execute(text("SELECT name FROM sqlite_master WHERE type='table' AND name='users'"))
-            else:
-                result = conn.execute(text("SELECT table_name FROM information_schema.tables WHERE table_name='users' AND table_schema='public'"))
+            is_sqlite = bind.dialect.name == "sqlite"
 
-            table_exists = result.fetchone() is not None
+            table_exists = inspect(conn).has_table("users")
 
             if not table_exists:
                 print("Creating database tables...")
@@ -179,34 +364,10 @@ def init_database():
                     cursor.executescript(sql)
                     cursor.close()
                 else:
-                    # PostgreSQL: split SQL by semicolon, remove comments/empty lines, execute each statement
-                    # This ensures CREATE TABLE statements run before INSERT statements
-                    lines = sql.split('\n')
-                    current_stmt = []
-                    
-                    for line in lines:
-                        # Remove comments
-                        if '--' in line:
-                            line = line[:line.index('--')]
-                        line = line.strip()
-                        
-                        if not line:
-                            continue
-                        
-                        current_stmt.append(line)
-                        
-                        # If line ends with semicolon, execute the statement
-                        if line.endswith(';'):
-                            stmt = ' '.join(current_stmt)
-                            stmt = stmt[:-1].strip()  # Remove trailing semicolon
-                            
-                            if stmt:  # Only execute non-empty statements
-                                try:
-                                    conn.execute(text(stmt))
-                                except Exception as e:
-                                    print(f"Warning: failed to execute statement: {stmt[:80]}... Error: {e}")
-                            
-                            current_stmt = []
+                    # PostgreSQL: execute statement by statement, in file order,
+                    # so CREATE TABLE statements run before INSERT statements
+                    for stmt in _schema_statements(sql):
+                        _execute_schema_statement(conn, stmt)
 
                 print("Tables created successfully!")
 
@@ -247,13 +408,99 @@ def init_database():
                 print("Database tables already exist")
 
         print("Database initialization completed successfully")
+        return not table_exists
     except Exception as e:
         print(f"Database initialization failed: {e}")
         raise
 
+
+def schema_version_recorded(conn, name=SCHEMA_VERSION_NAME):
+    """Whether schema_version has a row for migration ``name`` (False if the table is missing)"""
+    if not inspect(conn).has_table("schema_version"):
+        return False
+    return conn.execute(
+        text("SELECT 1 FROM schema_version WHERE name = :name"),
+        {"name": name}
+    ).fetchone() is not None
+
+
+def record_schema_version(conn, version, name):
+    """Record migration ``name`` as ``version``; raises if another migration holds that number"""
+    conn.execute(
+        text("""
+            INSERT INTO schema_version (version, name) VALUES (:version, :name)
+            ON CONFLICT (version) DO NOTHING
+        """),
+        {"version": version, "name": name}
+    )
+    holder = conn.execute(
+        text("SELECT name FROM schema_version WHERE version = :version"), {"version": version}
+    ).scalar()
+    if holder != name:
+        raise RuntimeError(f"schema_version {version} is already recorded for {holder!r}, not {name!r}")
+
+
+def seed_default_vehicles(conn):
+    """Insert the monitored patrol cars, leaving existing plates untouched"""
+    conn.execute(
+        text("""
+            INSERT INTO vehicles (plate_number, contractor)
+            VALUES (:plate_number, :contractor)
+            ON CONFLICT (plate_number) DO NOTHING
+        """),
+        [{"plate_number": plate, "contractor": contractor} for plate, contractor in DEFAULT_VEHICLES]
+    )
+
+
+def bootstrap_database(bind=None):
+    """Bring the database up to SCHEMA_VERSION, at most once per process.
+
+    When the version is already recorded this costs a single schema_version
+    lookup. Otherwise it creates the schema (seeding default users on a fresh
+    database), adds any schema.sql table or index an older database lacks,
+    ensures the default patrol vehicles and records the version. Returns True
+    when this call applied the version.
+    """
+    global _bootstrapped
+    if _bootstrapped:
+        return False
+    with _bootstrap_lock:
+        if _bootstrapped:
+            return False
+        bind = bind or get_sqlalchemy_engine()
+        # Fail at startup, not at the first upload, if images would land on an ephemeral disk
+        get_blob_store()
+
+        with bind.connect() as conn:
+            applied = schema_version_recorded(conn)
+
+        if not applied:
+            init_database(bind)
+            # Older idle_reports need the plate column before the natural-key index can exist;
+            # databases holding duplicate periods get the index from migrate_idle_natural_key.py
+            ensure_idle_report_plate(bind)
+            ensure_incident_image_blob_columns(bind)
+            with open("schema.sql", "r") as f:
+                statements = _schema_statements(f.read())
+            with bind.begin() as conn:
+                # CREATE ... IF NOT EXISTS only; seed INSERTs run when the schema is first created
+                for stmt in statements:
+                    if stmt.upper().startswith("CREATE"):
+                        _execute_schema_statement(conn, stmt)
+                seed_default_vehicles(conn)
+                record_schema_version(conn, SCHEMA_VERSION, SCHEMA_VERSION_NAME)
+            # Imported here: contractor_resolver imports this module
+            from contractor_resolver import invalidate_vehicle_contractor_cache
+            invalidate_vehicle_contractor_cache()
+            print(f"Database schema v{SCHEMA_VERSION} ({SCHEMA_VERSION_NAME}) applied")
+
+        _bootstrapped = True
+        return not applied
+
 # ------------------- USER MANAGEMENT -------------------
 def add_user(username, plain_password, role="contractor", contractor_id=None):
     hashed = bcrypt.hashpw(plain_password.encode(), bcrypt.gensalt()).decode()
+    engine = get_sqlalchemy_engine()
     with engine.begin() as conn:
         is_sqlite = engine.dialect.name == "sqlite"
         if is_sqlite:
@@ -281,7 +528,7 @@ def get_user(username, contractor_id=None):
     if contractor_id:
         query += " AND contractor_id=:contractor_id"
         params["contractor_id"] = contractor_id
-    with engine.begin() as conn:
+    with get_sqlalchemy_engine().begin() as conn:
         row = conn.execute(text(query), params).fetchone()
     return dict(row) if row else None
 
@@ -295,14 +542,14 @@ def get_active_contractor():
     return st.session_state.get("contractor_id")
 
 def get_contractor_id(name):
-    with engine.begin() as conn:
+    with get_sqlalchemy_engine().begin() as conn:
         row = conn.execute(text("SELECT id FROM contractors WHERE name=:name"), {"name": name}).fetchone()
     return row[0] if row else None
 
 def get_contractor_name(contractor_id):
     if not contractor_id:
         return None
-    with engine.begin() as conn:
+    with get_sqlalchemy_engine().begin() as conn:
         row = conn.execute(text("SELECT name FROM contractors WHERE id=:contractor_id"),
                            {"contractor_id": contractor_id}).fetchone()
     return row[0] if row else None
@@ -342,6 +589,7 @@ def save_incident_report(data, uploaded_by="Unknown"):
     contractor_id = get_active_contractor()
     insert_data = {**data, "uploaded_by": uploaded_by, "contractor_id": contractor_id}
 
+    engine = get_sqlalchemy_engine()
     with engine.begin() as conn:
         is_sqlite = engine.dialect.name == "sqlite"
         if is_sqlite:
@@ -389,6 +637,51 @@ def save_incident_report(data, uploaded_by="Unknown"):
 
     return report_id
 
+# ------------------- INCIDENT IMAGES -------------------
+# Image bytes go to the blob store (blob_store.py); incident_images keeps the
+# metadata and the blob_key. image_data is only set on rows written before
+# the blob store, until move_incident_images_to_blob_store() empties it.
+_INCIDENT_IMAGE_BLOB_COLUMNS = [("blob_key", "TEXT"), ("content_type", "TEXT"), ("size_bytes", "INTEGER")]
+
+
+def ensure_incident_image_blob_columns(bind=None):
+    """Add the blob store columns to an older incident_images table (idempotent)"""
+    bind = bind or get_sqlalchemy_engine()
+    with bind.begin() as conn:
+        if not inspect(conn).has_table("incident_images"):
+            return
+        columns = {col["name"] for col in inspect(conn).get_columns("incident_images")}
+        for name, sql_type in _INCIDENT_IMAGE_BLOB_COLUMNS:
+            if name not in columns:
+                conn.execute(text(f"ALTER TABLE incident_images ADD COLUMN {name} {sql_type}"))
+
+
+def _image_content_type(image_bytes, image_name):
+    if image_bytes[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    return mimetypes.guess_type(image_name or "")[0] or "application/octet-stream"
+
+
+def _insert_incident_image(conn, incident_id, image_bytes, image_name):
+    """Put the bytes in the blob store and record the image's metadata row"""
+    content_type = _image_content_type(image_bytes, image_name)
+    key = get_blob_store().put(image_bytes, content_type=content_type)
+    conn.execute(
+        text("INSERT INTO incident_images (incident_id, image_name, blob_key, content_type, size_bytes) VALUES "
+             "(:incident_id, :image_name, :blob_key, :content_type, :size_bytes)"),
+        {"incident_id": incident_id, "image_name": image_name, "blob_key": key,
+         "content_type": content_type, "size_bytes": len(image_bytes)}
+    )
+    return key
+
+
+def load_image_data(blob_key, image_data=None):
+    """Image bytes of an incident_images row: from the blob store, or inline for rows not yet moved"""
+    if blob_key:
+        return get_blob_store().get(blob_key)
+    return bytes(image_data) if image_data is not None else None
+
+
 def save_incident_image(incident_id, image_bytes, image_name, conn=None):
     if isinstance(image_bytes, memoryview):
         image_bytes = bytes(image_bytes)
@@ -396,40 +689,74 @@ def save_incident_image(incident_id, image_bytes, image_name, conn=None):
         image_bytes = bytes(image_bytes)
 
     if conn:
-        conn.execute(
-            text("INSERT INTO incident_images (incident_id, image_data, image_name) VALUES "
-                 "(:incident_id, :image_data, :image_name)"),
-            {"incident_id": incident_id, "image_data": image_bytes, "image_name": image_name}
-        )
+        _insert_incident_image(conn, incident_id, image_bytes, image_name)
     else:
-        with engine.begin() as conn:
-            conn.execute(
-                text("INSERT INTO incident_images (incident_id, image_data, image_name) VALUES "
-                     "(:incident_id, :image_data, :image_name)"),
-                {"incident_id": incident_id, "image_data": image_bytes, "image_name": image_name}
-            )
+        with get_sqlalchemy_engine().begin() as conn:
+            _insert_incident_image(conn, incident_id, image_bytes, image_name)
 
 def get_incident_images(report_id, only_meta=False):
-    with engine.begin() as conn:
+    with get_sqlalchemy_engine().begin() as conn:
         if only_meta:
             rows = conn.execute(
-                text("SELECT id, image_name FROM incident_images WHERE incident_id=:incident_id"),
+                text("SELECT id, image_name, blob_key, content_type, size_bytes FROM incident_images "
+                     "WHERE incident_id=:incident_id"),
                 {"incident_id": report_id}
             ).mappings().all()
         else:
+            # Inline bytes are only read for rows that predate the blob store
             rows = conn.execute(
-                text("SELECT id, image_name, image_data FROM incident_images WHERE incident_id=:incident_id"),
+                text("SELECT id, image_name, blob_key, content_type, "
+                     "CASE WHEN blob_key IS NULL THEN image_data END AS image_data "
+                     "FROM incident_images WHERE incident_id=:incident_id"),
                 {"incident_id": report_id}
             ).mappings().all()
-            # Ensure proper bytes
-            processed_rows = []
-            for r in rows:
-                row_dict = dict(r)
-                if row_dict.get("image_data") is not None:
-                    row_dict["image_data"] = bytes(row_dict["image_data"])
-                processed_rows.append(row_dict)
-            return processed_rows
-    return rows
+    if only_meta:
+        return rows
+    # Ensure proper bytes
+    processed_rows = []
+    for r in rows:
+        row_dict = dict(r)
+        row_dict["image_data"] = load_image_data(row_dict["blob_key"], row_dict["image_data"])
+        processed_rows.append(row_dict)
+    return processed_rows
+
+
+def move_incident_images_to_blob_store(bind=None, batch_size=50):
+    """Move inline incident_images.image_data into the blob store, batch by batch.
+
+    Each batch is its own transaction: blobs are stored first, then the rows
+    get their blob_key and lose the inline bytes, so an interrupted run can
+    simply be started again. Returns the number of images moved.
+    """
+    bind = bind or get_sqlalchemy_engine()
+    ensure_incident_image_blob_columns(bind)
+    row_id = row_id_column(bind)
+    moved = 0
+    while True:
+        with bind.begin() as conn:
+            rows = conn.execute(
+                text(f"SELECT {row_id} AS row_id, image_name, image_data FROM incident_images "
+                     "WHERE blob_key IS NULL AND image_data IS NOT NULL LIMIT :limit"),
+                {"limit": batch_size}
+            ).mappings().all()
+            if not rows:
+                return moved
+            updates = []
+            for row in rows:
+                image_bytes = bytes(row["image_data"])
+                content_type = _image_content_type(image_bytes, row["image_name"])
+                updates.append({
+                    "row_id": row["row_id"],
+                    "blob_key": get_blob_store().put(image_bytes, content_type=content_type),
+                    "content_type": content_type,
+                    "size_bytes": len(image_bytes),
+                })
+            conn.execute(
+                text("UPDATE incident_images SET blob_key = :blob_key, content_type = :content_type, "
+                     f"size_bytes = :size_bytes, image_data = NULL WHERE {row_id} = :row_id"),
+                updates
+            )
+            moved += len(updates)
 
 def get_recent_incident_reports(limit=20):
     """Fetch recent incident reports with contractor information"""
@@ -448,7 +775,7 @@ def get_recent_incident_reports(limit=20):
     
     query += " ORDER BY ir.created_at DESC LIMIT :limit"
     
-    df = pd.read_sql_query(text(query), engine, params=params)
+    df = pd.read_sql_query(text(query), get_sqlalchemy_engine(), params=params)
     return df
 
 def save_incident_with_images(data, uploaded_by="Unknown", image_files=None):
@@ -467,7 +794,7 @@ def save_incident_with_images(data, uploaded_by="Unknown", image_files=None):
     # Then save images (if any)
     if image_files:
         try:
-            with engine.begin() as conn:
+            with get_sqlalchemy_engine().begin() as conn:
                 for img in image_files:
                     img_name = None
                     img_bytes = None
@@ -496,10 +823,7 @@ def save_incident_with_images(data, uploaded_by="Unknown", image_files=None):
                         print(f"Warning: Could not normalize image {img_name}: {e}")
                         norm_bytes = img_bytes
 
-                    conn.execute(
-                        text("INSERT INTO incident_images (incident_id, image_data, image_name) VALUES (:incident_id, :image_data, :image_name)"),
-                        {"incident_id": report_id, "image_data": norm_bytes, "image_name": img_name or "image.jpg"}
-                    )
+                    _insert_incident_image(conn, report_id, norm_bytes, img_name or "image.jpg")
                     images_saved_count += 1
                     print(f"DEBUG: Saved image '{img_name}' for incident {report_id}")
         except Exception as e:
@@ -528,6 +852,7 @@ def seed_default_users(force: bool = False):
         ('patrol_officer_3', 'Pass@12345', 'Patrol Officer 3', 1, 'patrol'),
     ]
 
+    engine = get_sqlalchemy_engine()
     is_sqlite = engine.dialect.name == "sqlite"
 
     with engine.begin() as conn:
@@ -603,10 +928,397 @@ def seed_default_users(force: bool = False):
 
     print(f"Default users seeded (force={force})")
 
+# ------------------- DATE RANGES -------------------
+def day_range(start_date, end_date):
+    """Half-open bounds [start_date, end_date + 1 day) as 'YYYY-MM-DD' strings.
+
+    Use as ``col >= :range_start AND col < :range_end`` instead of
+    ``DATE(col) BETWEEN ...`` so the (contractor_id, timestamp) indexes apply.
+    Plain date strings compare correctly against both the ' ' and 'T'
+    separated timestamps SQLite ends up holding.
+    """
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+    return start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+# ------------------- KEYSET PAGINATION -------------------
+def row_id_column(bind=None):
+    """Unique row key for keyset ordering: rowid on SQLite, where SERIAL ids stay NULL"""
+    return "rowid" if (bind or get_sqlalchemy_engine()).dialect.name == "sqlite" else "id"
+
+def timestamp_param(bind, value):
+    """Timestamp bind value: strings stay as-is on SQLite (stored as text), anything
+    else becomes a datetime (asyncpg rejects strings for timestamp parameters)"""
+    if value is None or bind.dialect.name == "sqlite":
+        return value
+    return pd.Timestamp(value).to_pydatetime()
+
+def encode_cursor(sort_value, row_id):
+    """Opaque page cursor for the (sort value, row id) of the last row of a page"""
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat(sep=" ")
+    payload = json.dumps([sort_value, int(row_id)])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """(sort value, row id) back from encode_cursor; ValueError if the cursor is malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return sort_value, int(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+# ------------------- PATROL LOGS -------------------
+_last_position_ready = False
+
+_PATROL_LOG_COLUMNS = ["vehicle_id", "timestamp", "latitude", "longitude", "activity", "speed", "status"]
+
+_LAST_POSITION_DDL = """
+    CREATE TABLE IF NOT EXISTS vehicle_last_position (
+        vehicle_id INTEGER PRIMARY KEY,
+        timestamp TIMESTAMP,
+        latitude REAL,
+        longitude REAL,
+        activity TEXT,
+        status TEXT DEFAULT 'offline',
+        speed REAL DEFAULT 0.0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+# Older fixes arriving late never overwrite a newer position
+_LAST_POSITION_UPSERT = """
+    INSERT INTO vehicle_last_position (vehicle_id, timestamp, latitude, longitude, activity, speed, status, updated_at)
+    VALUES (:vehicle_id, :timestamp, :latitude, :longitude, :activity, :speed, :status, CURRENT_TIMESTAMP)
+    ON CONFLICT (vehicle_id) DO UPDATE SET
+        timestamp = excluded.timestamp,
+        latitude = excluded.latitude,
+        longitude = excluded.longitude,
+        activity = excluded.activity,
+        speed = excluded.speed,
+        status = excluded.status,
+        updated_at = excluded.updated_at
+    WHERE vehicle_last_position.timestamp IS NULL
+       OR excluded.timestamp >= vehicle_last_position.timestamp
+"""
+
+
+def ensure_vehicle_last_position(bind=None):
+    """Create vehicle_last_position and backfill it from patrol_logs history.
+
+    Vehicles that already have a row are left alone, so this is idempotent.
+    Returns the number of vehicles backfilled.
+    """
+    bind = bind or get_sqlalchemy_engine()
+    with bind.begin() as conn:
+        conn.execute(text(_LAST_POSITION_DDL))
+        if not inspect(conn).has_table("patrol_logs"):
+            return 0
+        # SERIAL ids stay NULL on SQLite, so tie-break on rowid there
+        row_id = row_id_column(bind)
+        return conn.execute(text(f"""
+            INSERT INTO vehicle_last_position (vehicle_id, timestamp, latitude, longitude, activity, speed, status)
+            SELECT p.vehicle_id, p.timestamp, p.latitude, p.longitude, p.activity, p.speed, p.status
+            FROM patrol_logs p
+            WHERE p.{row_id} IN (
+                SELECT MAX(p2.{row_id})
+                FROM patrol_logs p2
+                JOIN (
+                    SELECT vehicle_id, MAX(timestamp) AS max_ts
+                    FROM patrol_logs
+                    WHERE vehicle_id IS NOT NULL
+                    GROUP BY vehicle_id
+                ) latest ON latest.vehicle_id = p2.vehicle_id AND latest.max_ts = p2.timestamp
+                GROUP BY p2.vehicle_id
+            )
+            ON CONFLICT (vehicle_id) DO NOTHING
+        """)).rowcount
+
+
+def ensure_vehicle_last_position_once(bind=None):
+    global _last_position_ready
+    if _last_position_ready:
+        return
+    backfilled = ensure_vehicle_last_position(bind)
+    if backfilled:
+        print(f"Backfilled last position for {backfilled} vehicles")
+    _last_position_ready = True
+
+
+# Rows per multi-row INSERT, 7 bound parameters each: under SQLite's 999-parameter
+# limit on older builds, and under PostgreSQL's 32767 so a whole bulk upload
+# (api.PATROL_LOG_BULK_MAX_POINTS) is one statement
+_PATROL_LOG_INSERT_ROWS = {"sqlite": 140, "postgresql": 4000}
+
+
+def record_patrol_log(conn, log):
+    """Insert one patrol_logs row and write it through to vehicle_last_position.
+
+    Runs on the caller's connection so both writes share its transaction.
+    ``log`` is a mapping with the patrol_logs columns (status defaults to 'online',
+    speed to 0).
+    """
+    record_patrol_logs(conn, [log])
+
+
+def utc_fix_time(value):
+    """Naive UTC datetime for a patrol fix timestamp (None stays None).
+
+    Offset-aware values (the mobile app's '...Z' fixes) are converted to UTC;
+    naive values are taken to be UTC already.
+    """
+    if value is None:
+        return None
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    return ts.to_pydatetime()
+
+
+def utc_now():
+    """Current time as naive UTC, the form patrol timestamps are stored in"""
+    return utc_fix_time(datetime.now(timezone.utc))
+
+
+def fix_time_param(bind, value):
+    """Bind value for writing or comparing patrol timestamps: naive UTC, as the
+    isoformat text record_patrol_logs stores on SQLite (so text comparisons hold)"""
+    fix_time = utc_fix_time(value)
+    if fix_time is not None and bind.dialect.name == "sqlite":
+        return fix_time.isoformat(timespec="microseconds")
+    return fix_time
+
+
+def record_patrol_logs(conn, logs):
+    """Insert many patrol_logs rows with multi-row INSERTs on the caller's connection.
+
+    vehicle_last_position gets one upsert per vehicle, for its newest fix in
+    ``logs``. Each log is a mapping like record_patrol_log takes; timestamps
+    are stored as naive UTC (see utc_fix_time).
+    """
+    rows = []
+    fix_times = []
+    for log in logs:
+        params = {col: log.get(col) for col in _PATROL_LOG_COLUMNS}
+        params["status"] = params["status"] or "online"
+        params["speed"] = params["speed"] or 0.0
+        fix_time = utc_fix_time(params["timestamp"])
+        if fix_time is not None:
+            # One stored form, so SQLite's text comparisons order fixes correctly
+            params["timestamp"] = fix_time_param(conn, fix_time)
+        rows.append(params)
+        fix_times.append(fix_time)
+
+    chunk_rows = _PATROL_LOG_INSERT_ROWS.get(conn.dialect.name, 140)
+    for start in range(0, len(rows), chunk_rows):
+        chunk = rows[start:start + chunk_rows]
+        values = ", ".join(
+            "(" + ", ".join(f":{col}_{i}" for col in _PATROL_LOG_COLUMNS) + ")"
+            for i in range(len(chunk))
+        )
+        params = {f"{col}_{i}": row[col] for i, row in enumerate(chunk) for col in _PATROL_LOG_COLUMNS}
+        conn.execute(text(f"""
+            INSERT INTO patrol_logs (vehicle_id, timestamp, latitude, longitude, activity, speed, status)
+            VALUES {values}
+        """), params)
+
+    # One upsert per vehicle: ON CONFLICT cannot touch the same row twice in a statement
+    latest = {}
+    for row, fix_time in zip(rows, fix_times):
+        current = latest.get(row["vehicle_id"])
+        if current is None or (fix_time is not None and (current[1] is None or fix_time >= current[1])):
+            latest[row["vehicle_id"]] = (row, fix_time)
+    if latest:
+        conn.execute(text(_LAST_POSITION_UPSERT), [row for row, _ in latest.values()])
+
 # ------------------- IDLE REPORTS -------------------
-def save_idle_report(idle_df, uploaded_by):
-    if idle_df.empty:
+# ------------------- BULK INSERT -------------------
+# Rows per COPY / executemany call when bulk loading
+BULK_BATCH_SIZE = 5000
+
+# SQLAlchemy's SQLite DateTime storage format, kept so bulk rows sort and parse like to_sql ones
+_SQLITE_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def _integral_floats_to_int(df):
+    """Turn float columns holding only whole numbers (e.g. ids with NaN) into Int64.
+
+    COPY rejects '3.0' for an INTEGER column, which is how pandas writes an id
+    column that picked up a NaN.
+    """
+    df = df.copy()
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_float_dtype(values):
+            present = values.dropna()
+            if not present.empty and (present % 1 == 0).all():
+                df[col] = values.astype("Int64")
+    return df
+
+
+def _sqlite_rows(df):
+    """Plain Python tuples for executemany: timestamps as text, NaN/NaT as None"""
+    columns = []
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.infer_dtype(values, skipna=True) in ("datetime", "datetime64", "date"):
+            values = pd.to_datetime(values, errors="coerce")
+            values = values.dt.strftime(_SQLITE_DATETIME_FORMAT)
+        columns.append(values.astype(object).where(values.notna(), None).tolist())
+    return list(zip(*columns))
+
+
+def bulk_insert_dataframe(table, df, batch_size=BULK_BATCH_SIZE, bind=None, skip_conflicts=False):
+    """Insert every row of ``df`` into ``table`` in a single transaction.
+
+    PostgreSQL streams each batch through COPY ... FROM STDIN (CSV); other
+    databases (SQLite) get one executemany per batch. Nothing is committed
+    unless every batch succeeds. ``bind`` defaults to the shared engine.
+
+    With ``skip_conflicts`` rows violating a unique index are skipped instead
+    of failing the load: PostgreSQL copies into a temp table and moves rows
+    over with ON CONFLICT DO NOTHING, SQLite uses INSERT OR IGNORE.
+
+    Returns the number of rows inserted by each batch.
+    """
+    if df.empty:
+        return []
+    bind = bind or get_sqlalchemy_engine()
+    columns = ", ".join(df.columns)
+    conn = bind.raw_connection()
+    try:
+        cur = conn.cursor()
+        counts = []
+        if bind.dialect.name == "postgresql":
+            import io
+
+            target = table
+            if skip_conflicts:
+                target = f"_bulk_{table}"
+                # Only the loaded columns: copying the id default would burn sequence values
+                cur.execute(f"CREATE TEMP TABLE {target} ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA")
+            copy_sql = f"COPY {target} ({columns}) FROM STDIN WITH (FORMAT csv)"
+            prepared = _integral_floats_to_int(df)
+            for start in range(0, len(prepared), batch_size):
+                batch = prepared.iloc[start:start + batch_size]
+                buffer = io.StringIO()
+                batch.to_csv(buffer, index=False, header=False)
+                buffer.seek(0)
+                cur.copy_expert(copy_sql, buffer)
+                if skip_conflicts:
+                    cur.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {target} ON CONFLICT DO NOTHING")
+                    counts.append(cur.rowcount)
+                    cur.execute(f"TRUNCATE {target}")
+                else:
+                    counts.append(len(batch))
+        else:
+            marker = param_marker(bind)
+            verb = "INSERT OR IGNORE" if skip_conflicts else "INSERT"
+            insert_sql = f"{verb} INTO {table} ({columns}) VALUES ({', '.join([marker] * len(df.columns))})"
+            rows = _sqlite_rows(df)
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                cur.executemany(insert_sql, batch)
+                counts.append(cur.rowcount if skip_conflicts else len(batch))
+        conn.commit()
+        cur.close()
+        return counts
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# ------------------- IDLE REPORTS -------------------
+_idle_natural_key_ready = False
+
+
+def idle_report_plates(vehicles):
+    """Natural-key plate for each vehicle string: the normalized plate, else the trimmed string"""
+    from plate_utils import normalize_plates
+
+    vehicles = pd.Series(vehicles)
+    return normalize_plates(vehicles).fillna(vehicles.astype("string").str.strip())
+
+
+def ensure_idle_report_plate(bind=None):
+    """Add and backfill the idle_reports.plate column on older databases. Idempotent.
+
+    Removing periods uploaded more than once and creating the unique
+    (plate, idle_start, idle_end) index is left to migrate_idle_natural_key.py.
+    """
+    bind = bind or get_sqlalchemy_engine()
+    is_sqlite = bind.dialect.name == "sqlite"
+    with bind.begin() as conn:
+        if is_sqlite:
+            columns = [row[1] for row in conn.execute(text("PRAGMA table_info(idle_reports)"))]
+        else:
+            columns = [row[0] for row in conn.execute(text(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = 'idle_reports'"
+            ))]
+        if "plate" not in columns:
+            conn.execute(text("ALTER TABLE idle_reports ADD COLUMN plate TEXT"))
+
+        vehicles = [row[0] for row in conn.execute(text(
+            "SELECT DISTINCT vehicle FROM idle_reports WHERE plate IS NULL AND vehicle IS NOT NULL"
+        ))]
+        if vehicles:
+            plates = idle_report_plates(vehicles)
+            conn.execute(
+                text("UPDATE idle_reports SET plate = :plate WHERE vehicle = :vehicle AND plate IS NULL"),
+                [{"vehicle": v, "plate": p} for v, p in zip(vehicles, plates)]
+            )
+
+
+def idle_report_natural_key_exists(conn):
+    """Whether the unique (plate, idle_start, idle_end) index is in place"""
+    return any(index["name"] == "idx_idle_reports_natural_key" for index in inspect(conn).get_indexes("idle_reports"))
+
+
+def _ensure_idle_natural_key_once(bind=None):
+    global _idle_natural_key_ready
+    if _idle_natural_key_ready:
         return
+    bind = bind or get_sqlalchemy_engine()
+    ensure_idle_report_plate(bind)
+    with bind.connect() as conn:
+        if not idle_report_natural_key_exists(conn):
+            print("⚠️ idle_reports has no natural key yet, so repeated uploads are not skipped; "
+                  "run python migrate_idle_natural_key.py")
+    _idle_natural_key_ready = True
+
+
+def insert_idle_rows(idle_df, skip_duplicates=True, bind=None):
+    """Bulk insert prepared idle_reports rows, keyed on (plate, idle_start, idle_end).
+
+    With ``skip_duplicates`` periods already stored (or repeated in the upload)
+    are skipped rather than inserted again, once the natural-key index exists
+    (migrate_idle_natural_key.py).
+
+    Returns {"inserted": n, "skipped": n, "batches": [rows inserted per batch]}.
+    """
+    if idle_df.empty:
+        return {"inserted": 0, "skipped": 0, "batches": []}
+    _ensure_idle_natural_key_once(bind)
+    idle_df = idle_df.copy()
+    idle_df["plate"] = idle_report_plates(idle_df["vehicle"]).to_numpy()
+    for col in ["idle_start", "idle_end"]:
+        idle_df[col] = pd.to_datetime(idle_df[col], errors="coerce")
+    batches = bulk_insert_dataframe("idle_reports", idle_df, bind=bind, skip_conflicts=skip_duplicates)
+    inserted = sum(batches)
+    return {"inserted": inserted, "skipped": len(idle_df) - inserted, "batches": batches}
+
+
+def save_idle_report(idle_df, uploaded_by, skip_duplicates=True):
+    """Bulk-save idle periods for the active contractor.
+
+    Re-uploading an export is idempotent: periods already stored for the same
+    plate, start and end are skipped. Returns insert_idle_rows' counts.
+    """
+    if idle_df.empty:
+        return {"inserted": 0, "skipped": 0, "batches": []}
     contractor_id = get_active_contractor()
     idle_df = idle_df.copy()
     idle_df.columns = [c.lower() for c in idle_df.columns]
@@ -620,27 +1332,79 @@ def save_idle_report(idle_df, uploaded_by):
     idle_df = idle_df[[c for c in valid_columns if c in idle_df.columns]]
 
     try:
-        idle_df.to_sql("idle_reports", engine, if_exists="append", index=False)
+        return insert_idle_rows(idle_df, skip_duplicates=skip_duplicates)
     except Exception as e:
         print("❌ Error saving idle report:", e)
         traceback.print_exc()
+        return {"inserted": 0, "skipped": 0, "batches": []}
 
-def get_idle_reports(limit=10000):
-    contractor_id = get_active_contractor()
-    query = "SELECT * FROM idle_reports"
-    params = {}
+IDLE_REPORT_COLUMNS = ["vehicle", "plate", "idle_start", "idle_end", "idle_duration_min", "location_address",
+                       "latitude", "longitude", "description", "uploaded_by", "contractor_id", "uploaded_at"]
+IDLE_REPORTS_PAGE_SIZE = 500
+
+def get_idle_reports_page(contractor_id=None, start_date=None, end_date=None, plate=None,
+                          before=None, limit=IDLE_REPORTS_PAGE_SIZE):
+    """One page of idle reports, latest idle_start first, filtered in SQL.
+
+    ``contractor_id`` None means all contractors. ``before`` is the
+    (idle_start, id) of the previous page's last row; ``id`` is the rowid on
+    SQLite, matching delete_idle_reports_by_id.
+    """
+    engine = get_sqlalchemy_engine()
+    row_id = row_id_column(engine)
+    conditions = []
+    params = {"limit": limit}
     if contractor_id:
-        query += " WHERE contractor_id=:contractor_id"
+        conditions.append("contractor_id = :contractor_id")
         params["contractor_id"] = contractor_id
-    query += " ORDER BY uploaded_at DESC LIMIT :limit"
-    params["limit"] = limit
-    df = pd.read_sql_query(text(query), engine, params=params)
-    return df
+    if start_date is not None and end_date is not None:
+        conditions.append("idle_start >= :range_start AND idle_start < :range_end")
+        params["range_start"], params["range_end"] = day_range(start_date, end_date)
+    if plate:
+        conditions.append("plate = :plate")
+        params["plate"] = plate
+    if before is not None:
+        conditions.append(f"(idle_start, {row_id}) < (:before_start, :before_id)")
+        params["before_start"] = timestamp_param(engine, before[0])
+        params["before_id"] = int(before[1])
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""
+        SELECT {row_id} AS id, {', '.join(IDLE_REPORT_COLUMNS)}
+        FROM idle_reports{where}
+        ORDER BY idle_start DESC, {row_id} DESC
+        LIMIT :limit
+    """
+    return pd.read_sql_query(text(query), engine, params=params)
+
+def get_idle_reports(limit=IDLE_REPORTS_PAGE_SIZE):
+    """Latest idle reports of the active contractor (all contractors if none is active)"""
+    return get_idle_reports_page(contractor_id=get_active_contractor(), limit=limit)
+
+def get_idle_report_contractor_ids():
+    """Contractor ids that have idle reports, for filter options"""
+    query = "SELECT DISTINCT contractor_id FROM idle_reports WHERE contractor_id IS NOT NULL ORDER BY contractor_id"
+    with get_sqlalchemy_engine().connect() as conn:
+        return [row[0] for row in conn.execute(text(query))]
 
+def get_idle_report_plate_options(contractor_id=None):
+    """Distinct natural-key plates in idle_reports (optionally for one contractor)"""
+    query = "SELECT DISTINCT plate FROM idle_reports WHERE plate IS NOT NULL"
+    params = {}
+    if contractor_id:
+        query += " AND contractor_id = :contractor_id"
+        params["contractor_id"] = contractor_id
+    with get_sqlalchemy_engine().connect() as conn:
+        return [row[0] for row in conn.execute(text(query + " ORDER BY plate"), params)]
+
+def delete_idle_reports_by_id(ids):
+    """Delete idle_reports rows by id (rowid on SQLite); returns the number of rows deleted"""
+    ids = [int(i) for i in ids]
+    if not ids:
+        return 0
+    engine = get_sqlalchemy_engine()
+    query = text(f"DELETE FROM idle_reports WHERE {row_id_column(engine)} IN :ids").bindparams(
+        bindparam("ids", expanding=True)
+    )
+    with engine.begin() as conn:
+        return conn.execute(query, {"ids": ids}).rowcount
 
-# Automatically initialize database (create tables and seed defaults) on import.
-# Wrap in try/except so imports don't crash if initialization fails in certain environments.
-try:
-    init_database()
-except Exception as e:
-    print(f"Warning: automatic database initialization failed: {e}")
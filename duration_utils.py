@@ -0,0 +1,40 @@
+# duration_utils.py - Column-level parsing of GPS idle/stop durations
+import re
+
+import numpy as np
+import pandas as pd
+
+# One anchored pattern covering every layout the GPS exports use:
+# "HH:MM[:SS]", a plain number of minutes, or "1h 5m 3s" / "12 min" / "45 s" units
+_DURATION_PATTERN = re.compile(r'''
+    ^\s*(?:
+        (?P<clock_h>\d+):(?P<clock_m>\d+)(?::(?P<clock_s>\d+))?
+      | (?P<number>\d+(?:\.\d+)?)\s*$
+      | (?:(?P<h>\d+(?:\.\d+)?)\s*h(?:ours?|rs?)?\s*)?
+        (?:(?P<m>\d+(?:\.\d+)?)\s*m(?:in(?:utes?|s)?)?\s*)?
+        (?:(?P<s>\d+(?:\.\d+)?)\s*s(?:ec(?:onds?|s)?)?)?
+    )
+''', re.IGNORECASE | re.VERBOSE)
+
+
+def parse_durations(values, default=0.0):
+    """Convert a whole column of durations to float minutes in one pass.
+
+    Timedelta columns (and object columns holding timedeltas) go straight
+    through pd.to_timedelta; numbers are taken as minutes; text is matched
+    with a single str.extract. Values that can't be read become ``default``
+    (None keeps them NaN so callers can drop them).
+    """
+    series = pd.Series(values)
+    default = np.nan if default is None else default
+
+    if pd.api.types.infer_dtype(series, skipna=True) in ('timedelta', 'timedelta64'):
+        return (pd.to_timedelta(series).dt.total_seconds() / 60).fillna(default)
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.astype(float).fillna(default)
+
+    parts = series.astype(str).str.extract(_DURATION_PATTERN).astype(float)
+    clock = parts['clock_h'] * 60 + parts['clock_m'] + parts['clock_s'].fillna(0) / 60
+    has_units = parts[['h', 'm', 's']].notna().any(axis=1)
+    units = (parts['h'].fillna(0) * 60 + parts['m'].fillna(0) + parts['s'].fillna(0) / 60).where(has_units)
+    return clock.fillna(parts['number']).fillna(units).fillna(default)
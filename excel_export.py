@@ -0,0 +1,179 @@
+# excel_export.py - Streaming xlsxwriter export for the monthly idle report
+import datetime
+import math
+
+import xlsxwriter
+
+# Cell styles used by the monthly report, keyed by the row kind they format
+STYLES = {
+    'header': {
+        'font_name': 'Arial Narrow', 'font_size': 16,
+        'bold': True, 'align': 'center', 'font_color': 'blue'
+    },
+    'day_total': {
+        'font_name': 'Calisto MT', 'font_size': 12,
+        'font_color': 'red', 'bold': True
+    },
+    'week_total': {
+        'font_name': 'Calisto MT', 'font_size': 12,
+        'font_color': 'red', 'bold': True
+    },
+    'grand': {
+        'font_name': 'Arial Black', 'font_size': 14,
+        'font_color': 'blue', 'bold': True
+    },
+    'percent': {
+        'font_name': 'Arial Black', 'font_size': 14,
+        'font_color': 'blue', 'bold': True
+    },
+    'normal': {'font_size': 12},
+    'summary_header': {
+        'font_name': 'Arial', 'font_size': 10,
+        'bold': True, 'align': 'center', 'text_wrap': True
+    },
+}
+
+DATE_FORMAT = 'yyyy-mm-dd'
+SHEET_NAME_LIMIT = 31
+
+
+def row_style(label):
+    """Pick the style of a monthly-sheet row from the label in its Date column"""
+    label = str(label)
+    if label.startswith("GRAND MONTHLY TOTAL"):
+        return 'grand'
+    if label.startswith("WEEK TOTAL"):
+        return 'week_total'
+    if label.startswith("DAY TOTAL"):
+        return 'day_total'
+    if label.startswith("Week "):
+        return 'header'
+    if label.endswith("Availability (%)"):
+        return 'percent'
+    return 'normal'
+
+
+def clean_sheet_name(name):
+    """Make a vehicle name usable as an Excel worksheet name (must be <= 31 chars)"""
+    name = str(name).replace('"', '').strip()
+    if len(name) > SHEET_NAME_LIMIT:
+        name = name[:SHEET_NAME_LIMIT - 3] + "..."
+    return name
+
+
+class MonthlyReportWriter:
+    """Write the monthly report workbook in a single pass per sheet.
+
+    The workbook runs in xlsxwriter's ``constant_memory`` mode, so each row is
+    flushed to disk as soon as the next one starts and memory stays flat no
+    matter how many vehicles are exported. Format objects are created once per
+    workbook and column widths are tracked while the rows are written.
+    """
+
+    def __init__(self, output):
+        self.workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+        self._formats = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.workbook.close()
+
+    def get_format(self, style, num_format=None):
+        """Return the cached format for a style (and optional number format)"""
+        key = (style, num_format)
+        fmt = self._formats.get(key)
+        if fmt is None:
+            props = dict(STYLES[style])
+            if num_format:
+                props['num_format'] = num_format
+            fmt = self.workbook.add_format(props)
+            self._formats[key] = fmt
+        return fmt
+
+    def _write_cell(self, worksheet, row, col, value, style):
+        """Write one cell and return the display width it needs"""
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            worksheet.write_blank(row, col, None, self.get_format(style))
+            return 0
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            worksheet.write_datetime(row, col, value, self.get_format(style, DATE_FORMAT))
+        else:
+            worksheet.write(row, col, value, self.get_format(style))
+        return len(str(value))
+
+    def write_vehicle_sheet(self, vehicle, export_df):
+        """Write one vehicle's table (as built by create_weekly_table_for_excel)"""
+        worksheet = self.workbook.add_worksheet(clean_sheet_name(vehicle))
+        columns = list(export_df.columns)
+        widths = [len(str(col)) for col in columns]
+
+        for col_num, col_name in enumerate(columns):
+            worksheet.write(0, col_num, col_name, self.get_format('header'))
+
+        date_pos = columns.index('Date') if 'Date' in columns else 0
+        for row_num, values in enumerate(export_df.itertuples(index=False, name=None), start=1):
+            style = row_style(values[date_pos])
+            for col_num, value in enumerate(values):
+                width = self._write_cell(worksheet, row_num, col_num, value, style)
+                if width > widths[col_num]:
+                    widths[col_num] = width
+
+        for col_num, width in enumerate(widths):
+            worksheet.set_column(col_num, col_num, width + 2)
+        return worksheet
+
+    def write_summary_sheet(self, summaries, sheet_name='Summary'):
+        """Write the per-vehicle summary rows followed by a pie chart per vehicle"""
+        worksheet = self.workbook.add_worksheet(sheet_name)
+        columns = []
+        for summary in summaries:
+            columns.extend(key for key in summary if key not in columns)
+
+        for col_num, col_name in enumerate(columns):
+            worksheet.write(0, col_num, col_name, self.get_format('summary_header'))
+        for row_num, summary in enumerate(summaries, start=1):
+            for col_num, col_name in enumerate(columns):
+                value = summary.get(col_name)
+                if value is not None:
+                    worksheet.write(row_num, col_num, value)
+
+        # Set column widths - adjust for many more columns
+        worksheet.set_column(0, 0, 12)  # Vehicle
+        worksheet.set_column(1, 4, 10)  # Week 1 totals
+        worksheet.set_column(5, 8, 10)  # Week 2 totals
+        worksheet.set_column(9, 12, 10) # Week 3 totals
+        worksheet.set_column(13, 16, 10) # Week 4 totals
+        worksheet.set_column(17, 21, 12) # Monthly totals
+
+        # Add pie charts for each vehicle - positioned centrally below the data
+        chart_row = len(summaries) + 2  # Start charts below the data
+
+        for i, summary in enumerate(summaries, start=1):
+            # Create pie chart for time breakdown (Incident, Breaks, Pickups, Unjustified)
+            chart = self.workbook.add_chart({'type': 'pie'})
+            chart.add_series({
+                'name': f'{summary["Vehicle"]} Time Breakdown',
+                'categories': [sheet_name, 0, 4, 0, 7],  # Incident, Breaks, Pickups, Unjustified columns
+                'values': [sheet_name, i, 4, i, 7],      # Data row i, columns 4-7
+                'data_labels': {'percentage': True, 'position': 'outside_end', 'font_size': 10}
+            })
+            chart.set_title({'name': f'{summary["Vehicle"]} Idle Time Breakdown'})
+            chart.set_size({'width': 350, 'height': 250})
+            chart.set_legend({'position': 'bottom'})
+
+            # Position charts in a grid layout (2 charts per row)
+            charts_per_row = 2
+            row_offset = (i - 1) // charts_per_row
+            col_offset = (i - 1) % charts_per_row
+
+            # Column positions: H and P (columns 7 and 15 in Excel)
+            col_positions = ['H', 'P']
+            start_row = chart_row + (row_offset * 20)  # 20 rows spacing between chart rows
+
+            worksheet.insert_chart(f'{col_positions[col_offset]}{start_row}', chart)
+        return worksheet
@@ -2,7 +2,8 @@ import streamlit as st
 import folium
 from streamlit_folium import folium_static
 import pandas as pd
-from db_utils import get_sqlalchemy_engine
+from db_utils import get_sqlalchemy_engine, record_patrol_log, ensure_vehicle_last_position_once, utc_now
+from patrol_log_storage import load_patrol_history, read_points_page, RAW_HISTORY_MAX_DAYS
 from auth_utils import get_active_contractor
 from datetime import datetime, timedelta
 from sqlalchemy import text
@@ -13,6 +14,38 @@ try:
 except ImportError:
     PLOTLY_AVAILABLE = False
 
+def show_hourly_history(hourly_df, plate_number):
+    """Summarise a long or expired time range from the hourly patrol_logs rollups"""
+    st.info(f"📦 Showing hourly summaries: raw GPS points are kept for recent ranges of up to "
+            f"{RAW_HISTORY_MAX_DAYS} days.")
+
+    st.subheader("📊 Tracking Statistics")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Total GPS Points", int(hourly_df['points'].sum()))
+    with col2:
+        st.metric("Distance (km)", f"{hourly_df['distance_km'].sum():.1f}")
+    with col3:
+        st.metric("Max Speed (km/h)", f"{hourly_df['max_speed'].max():.1f}")
+    with col4:
+        st.metric("Idle Time (min)", f"{hourly_df['idle_minutes'].sum():.0f}")
+
+    st.subheader("📈 Hourly Distance and Speed")
+    if PLOTLY_AVAILABLE:
+        fig = px.line(
+            hourly_df,
+            x='bucket_start',
+            y=['distance_km', 'max_speed', 'idle_minutes'],
+            title=f'Hourly Summary for {plate_number}',
+            labels={'bucket_start': 'Hour', 'value': 'Value', 'variable': 'Metric'}
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.line_chart(hourly_df.set_index('bucket_start')[['distance_km', 'max_speed', 'idle_minutes']])
+
+    with st.expander("📋 Hourly Summary Data"):
+        st.dataframe(hourly_df)
+
 def gps_tracking_page():
     st.header("🚗 GPS Vehicle Tracking")
 
@@ -121,16 +154,13 @@ def gps_tracking_page():
             with engine.begin() as conn:
                 conn.execute(text(create_table_query))
 
-            # Check the most recent activation and deactivation records
-            combined_query = """
-                SELECT activity, status, timestamp
-                FROM patrol_logs
-                WHERE vehicle_id = %s
-                AND (activity = 'activated' OR activity = 'deactivated')
-                ORDER BY timestamp DESC
-                LIMIT 10
-            """
-            combined_df = pd.read_sql(combined_query, engine, params=(vehicle_id,))
+            # Check the most recent activation and deactivation records (archived months included)
+            with engine.connect() as conn:
+                combined_df = read_points_page(
+                    conn, vehicle_id, 10,
+                    columns=["activity", "status", "timestamp"],
+                    activities=("activated", "deactivated")
+                )
 
             # Determine current status based on the most recent action
             if not combined_df.empty:
@@ -180,13 +210,11 @@ def gps_tracking_page():
                 if st.button("🟢 Activate GPS Tracking", type="primary"):
                     # Insert activation record
                     try:
+                        ensure_vehicle_last_position_once(engine)
                         with engine.begin() as conn:
-                            conn.execute(text("""
-                                INSERT INTO patrol_logs (vehicle_id, timestamp, latitude, longitude, activity, status, speed)
-                                VALUES (:vehicle_id, :timestamp, :latitude, :longitude, :activity, :status, :speed)
-                            """), {
-                                "vehicle_id": vehicle_id,
-                                "timestamp": datetime.now(),
+                            record_patrol_log(conn, {
+                                "vehicle_id": int(vehicle_id),
+                                "timestamp": utc_now(),
                                 "latitude": -1.2921,  # Nairobi default
                                 "longitude": 36.8219,
                                 "activity": "activated",
@@ -213,13 +241,11 @@ def gps_tracking_page():
                 if st.button("🔴 Deactivate GPS Tracking"):
                     # Insert deactivation record
                     try:
+                        ensure_vehicle_last_position_once(engine)
                         with engine.begin() as conn:
-                            conn.execute(text("""
-                                INSERT INTO patrol_logs (vehicle_id, timestamp, latitude, longitude, activity, status, speed)
-                                VALUES (:vehicle_id, :timestamp, :latitude, :longitude, :activity, :status, :speed)
-                            """), {
-                                "vehicle_id": vehicle_id,
-                                "timestamp": datetime.now(),
+                            record_patrol_log(conn, {
+                                "vehicle_id": int(vehicle_id),
+                                "timestamp": utc_now(),
                                 "latitude": -1.2921,  # Nairobi default
                                 "longitude": 36.8219,
                                 "activity": "deactivated",
@@ -236,12 +262,13 @@ def gps_tracking_page():
                         st.error(f"FATAL DB ERROR: Failed to deactivate GPS tracking: {e}")
                         # Don't rerun on failure
 
-    # Date range selection
+    # Date range selection, in UTC like the stored fixes
+    now = utc_now()
     col1, col2 = st.columns(2)
     with col1:
-        start_date = st.date_input("Start Date", datetime.now().date() - timedelta(days=1))
+        start_date = st.date_input("Start Date (UTC)", now.date() - timedelta(days=1))
     with col2:
-        end_date = st.date_input("End Date", datetime.now().date())
+        end_date = st.date_input("End Date (UTC)", now.date())
 
     if start_date > end_date:
         st.error("Start date cannot be after end date.")
@@ -250,9 +277,9 @@ def gps_tracking_page():
     # Time range
     col3, col4 = st.columns(2)
     with col3:
-        start_time = st.time_input("Start Time", datetime.now().replace(hour=0, minute=0).time())
+        start_time = st.time_input("Start Time (UTC)", now.replace(hour=0, minute=0).time())
     with col4:
-        end_time = st.time_input("End Time", datetime.now().time())
+        end_time = st.time_input("End Time (UTC)", now.time())
 
     # Combine date and time
     start_datetime = datetime.combine(start_date, start_time)
@@ -277,16 +304,10 @@ def gps_tracking_page():
         with engine.begin() as conn:
             conn.execute(text(create_table_query))
 
-        # Now fetch GPS data
-        gps_query = """
-            SELECT timestamp, latitude, longitude, activity, speed
-            FROM patrol_logs
-            WHERE vehicle_id = %s
-            AND timestamp BETWEEN %s AND %s
-            ORDER BY timestamp ASC
-        """
-        gps_df = pd.read_sql(gps_query, engine, params=(vehicle_id, start_datetime, end_datetime))
+        # Now fetch GPS data (hourly rollups for long or expired ranges)
+        resolution, gps_df = load_patrol_history(int(vehicle_id), start_datetime, end_datetime, engine)
     except Exception as e:
+        resolution = "raw"
         if "does not exist" in str(e):
             st.info("Patrol logs table not found. Creating table...")
             # Create the table and return empty dataframe
@@ -315,6 +336,10 @@ def gps_tracking_page():
         st.warning(f"No GPS data found for {actual_plate_number} in the selected time range.")
         return
 
+    if resolution == "1h":
+        show_hourly_history(gps_df, actual_plate_number)
+        return
+
     # Display statistics
     st.subheader("📊 Tracking Statistics")
 
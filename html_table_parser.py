@@ -0,0 +1,84 @@
+# html_table_parser.py - Streaming extraction of table rows from HTML GPS exports
+from html.parser import HTMLParser
+
+# GPS systems often export multi-megabyte HTML tables disguised as .xls;
+# feed them to the parser in slices so rows can be consumed as they complete.
+CHUNK_SIZE = 64 * 1024
+
+_CELL_TAGS = {'td', 'th'}
+
+
+class _TableRowParser(HTMLParser):
+    """Event-driven parser that collects the inner HTML of every table cell, row by row.
+
+    Cell contents keep their inline markup (e.g. the ``<a href=...>`` around a
+    Wizpro stop position) so callers can still pull coordinates out of links.
+    Entities are decoded.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self._row = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'tr':
+            self._close_row()
+            self._row = []
+        elif tag in _CELL_TAGS:
+            self._close_cell()
+            if self._row is None:
+                self._row = []
+            self._cell = []
+        elif self._cell is not None:
+            self._cell.append(self.get_starttag_text())
+
+    def handle_startendtag(self, tag, attrs):
+        if self._cell is not None:
+            self._cell.append(self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        if tag in _CELL_TAGS:
+            self._close_cell()
+        elif tag in ('tr', 'table'):
+            self._close_row()
+        elif self._cell is not None:
+            self._cell.append(f'</{tag}>')
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+    def _close_cell(self):
+        if self._cell is not None:
+            if self._row is None:
+                self._row = []
+            self._row.append(''.join(self._cell))
+            self._cell = None
+
+    def _close_row(self):
+        self._close_cell()
+        if self._row:
+            self.rows.append(self._row)
+        self._row = None
+
+    def close(self):
+        super().close()
+        self._close_row()
+
+
+def iter_table_rows(html_content, chunk_size=CHUNK_SIZE):
+    """Yield the cells (inner HTML strings) of each table row in document order.
+
+    The document is parsed once, in chunks; completed rows are handed out as
+    soon as they are seen instead of being collected up front.
+    """
+    parser = _TableRowParser()
+    for offset in range(0, len(html_content), chunk_size):
+        parser.feed(html_content[offset:offset + chunk_size])
+        if parser.rows:
+            completed, parser.rows = parser.rows, []
+            yield from completed
+    parser.close()
+    yield from parser.rows
@@ -0,0 +1,136 @@
+# idle_classifier.py - Interval-overlap classification of idle periods
+import numpy as np
+import pandas as pd
+
+JUSTIFICATION_COLUMNS = ["Incident", "Breaks", "Pickups", "Unjustified"]
+
+# Open-ended breaks/pickups (no end time yet) overlap everything after their start
+_OPEN_END = np.iinfo(np.int64).max
+
+
+# ------------------- DATETIME HELPERS -------------------
+def parse_datetimes(series, format="ISO8601"):
+    """Parse a whole column of timestamps in one call.
+
+    SQLite hands back ISO strings of varying precision, so try the fast ISO8601
+    path first (or ``format``; None infers it from the first value) and only
+    fall back to per-value inference for the leftovers.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    parsed = pd.to_datetime(series, errors="coerce", format=format)
+    retry = parsed.isna() & series.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(series[retry], errors="coerce", format="mixed")
+    return parsed
+
+
+def _to_ns(values):
+    """Convert a column of timestamps to int64 nanoseconds.
+
+    Returns (ns_array, valid_mask); unparsable values are flagged invalid.
+    Timezone-aware values are converted to naive UTC.
+    """
+    ts = parse_datetimes(pd.Series(values).reset_index(drop=True))
+    if getattr(ts.dt, "tz", None) is not None:
+        ts = ts.dt.tz_convert(None)
+    valid = ts.notna().to_numpy()
+    ns = ts.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    return ns, valid
+
+
+# ------------------- INTERVAL INDEX -------------------
+def build_interval_index(plates, starts, ends, open_ended=False):
+    """Group intervals by plate into sorted start arrays with a running max of ends.
+
+    For each plate the intervals are sorted by start; ``max_end[k]`` holds the
+    latest end among the first ``k + 1`` intervals. An idle period [a, b] then
+    overlaps some interval iff the intervals starting at or before ``b`` reach
+    at least ``a`` - a single searchsorted plus one lookup.
+
+    Returns a dict: plate -> (sorted_starts, max_end).
+    """
+    start_ns, start_ok = _to_ns(starts)
+    end_ns, end_ok = _to_ns(ends)
+    if open_ended:
+        end_ns = np.where(end_ok, end_ns, _OPEN_END)
+        valid = start_ok
+    else:
+        valid = start_ok & end_ok
+
+    plates = pd.Series(plates).reset_index(drop=True)
+    valid &= plates.notna().to_numpy()
+    if not valid.any():
+        return {}
+
+    frame = pd.DataFrame({
+        "plate": plates[valid].to_numpy(),
+        "start": start_ns[valid],
+        "end": end_ns[valid],
+    }).sort_values(["plate", "start"], kind="mergesort")
+
+    index = {}
+    for plate, group in frame.groupby("plate", sort=False):
+        index[plate] = (
+            group["start"].to_numpy(),
+            np.maximum.accumulate(group["end"].to_numpy()),
+        )
+    return index
+
+
+def overlaps_any(index, plates, idle_start_ns, idle_end_ns):
+    """Vectorized overlap test of idle periods against an interval index."""
+    hits = np.zeros(len(idle_start_ns), dtype=bool)
+    if not index:
+        return hits
+
+    plates = pd.Series(plates).reset_index(drop=True)
+    for plate, positions in plates.groupby(plates, sort=False).groups.items():
+        entry = index.get(plate)
+        if entry is None:
+            continue
+        starts, max_end = entry
+        pos = np.asarray(positions)
+        # Number of intervals starting at or before each idle end
+        k = np.searchsorted(starts, idle_end_ns[pos], side="right")
+        has_candidates = k > 0
+        reach = np.where(has_candidates, max_end[np.maximum(k - 1, 0)], np.iinfo(np.int64).min)
+        hits[pos] = has_candidates & (reach >= idle_start_ns[pos])
+    return hits
+
+
+# ------------------- CLASSIFICATION -------------------
+def classify_idle_periods(idle_df, incidents_df, breaks_df, pickups_df, plate_col="plate"):
+    """Split each idle period's duration into Incident/Breaks/Pickups/Unjustified.
+
+    All four frames must carry a normalized plate column (``plate_col``); idle
+    periods are only justified by records of the same vehicle. Precedence is
+    Incident > Breaks > Pickups, and a period matching none is Unjustified.
+
+    Returns a copy of ``idle_df`` with the four breakdown columns added.
+    """
+    result = idle_df.copy()
+    duration = pd.to_numeric(result["idle_duration_min"], errors="coerce").fillna(0).to_numpy(dtype=float)
+
+    idle_start_ns, start_ok = _to_ns(result["idle_start"])
+    idle_end_ns, end_ok = _to_ns(result["idle_end"])
+    idle_ok = start_ok & end_ok
+    idle_plates = result[plate_col].reset_index(drop=True).where(idle_ok)
+
+    sources = [
+        (incidents_df, "response_time", "clearing_time", False),
+        (breaks_df, "break_start", "break_end", True),
+        (pickups_df, "pickup_start", "pickup_end", True),
+    ]
+
+    remaining = np.ones(len(result), dtype=bool)
+    for col, (src, start_col, end_col, open_ended) in zip(JUSTIFICATION_COLUMNS, sources):
+        matched = np.zeros(len(result), dtype=bool)
+        if src is not None and not src.empty and start_col in src.columns and end_col in src.columns:
+            index = build_interval_index(src[plate_col], src[start_col], src[end_col], open_ended=open_ended)
+            matched = overlaps_any(index, idle_plates, idle_start_ns, idle_end_ns) & remaining
+        result[col] = np.where(matched, duration, 0.0)
+        remaining &= ~matched
+
+    result["Unjustified"] = np.where(remaining, duration, 0.0)
+    return result
@@ -0,0 +1,62 @@
+# idle_detection.py - Run-length idle detection over raw GPS speed streams
+import numpy as np
+import pandas as pd
+
+from idle_classifier import parse_datetimes
+
+# A point at or below this speed (km/h) counts as idle; missing speeds count as 0
+IDLE_SPEED_THRESHOLD = 2
+# Idle runs must last longer than this many minutes to be reported
+IDLE_MIN_DURATION = 5
+
+IDLE_RUN_COLUMNS = ['vehicle', 'idle_start', 'idle_end', 'idle_duration_min']
+
+
+def find_idle_runs(df, vehicle_col, time_col, speed_col,
+                   speed_threshold=IDLE_SPEED_THRESHOLD, min_duration=IDLE_MIN_DURATION):
+    """Find idle periods for every vehicle in a point-level GPS frame at once.
+
+    Rows are sorted once by (vehicle, time); a run starts wherever the idle state
+    or the vehicle changes, and each run is reduced to its first/last timestamp
+    with array indexing instead of a per-vehicle loop. Works on uploaded
+    exports and on patrol_logs history alike (timestamps may be datetimes or
+    strings).
+
+    Returns a frame with IDLE_RUN_COLUMNS, one row per run longer than
+    ``min_duration`` minutes, ordered by vehicle then start.
+    """
+    times = parse_datetimes(df[time_col]).to_numpy(dtype='datetime64[ns]')
+    codes, vehicles = pd.factorize(df[vehicle_col], sort=True)
+    speeds = pd.to_numeric(df[speed_col], errors='coerce').fillna(0).to_numpy()
+
+    valid = (codes >= 0) & ~np.isnat(times)
+    codes, times, speeds = codes[valid], times[valid], speeds[valid]
+    if not len(codes):
+        return pd.DataFrame(columns=IDLE_RUN_COLUMNS)
+
+    # One stable sort by (vehicle, time) for the whole frame
+    order = np.lexsort((times, codes))
+    codes, times = codes[order], times[order]
+    is_idle = speeds[order] <= speed_threshold
+
+    # A run starts at an idle point whose predecessor is moving or another vehicle
+    continues = np.zeros(len(codes), dtype=bool)
+    continues[1:] = is_idle[:-1] & (codes[1:] == codes[:-1])
+    run_start = is_idle & ~continues
+
+    # Idle points in order; each run spans from its start to the point before the next run starts
+    idle_pos = np.flatnonzero(is_idle)
+    if not len(idle_pos):
+        return pd.DataFrame(columns=IDLE_RUN_COLUMNS)
+    starts_here = run_start[idle_pos]
+    first = idle_pos[starts_here]
+    last = idle_pos[np.append(starts_here[1:], True)]
+
+    runs = pd.DataFrame({
+        'vehicle': vehicles.take(codes[first]),
+        'idle_start': times[first],
+        'idle_end': times[last],
+    })
+    duration = (runs['idle_end'] - runs['idle_start']).dt.total_seconds() / 60
+    runs['idle_duration_min'] = duration.round(2)
+    return runs[duration > min_duration].reset_index(drop=True)
@@ -0,0 +1,165 @@
+# idle_formats.py - Registry of GPS idle-report formats with single-pass upload detection
+import io
+
+import pandas as pd
+
+# Leading bytes examined to identify the container and sniff HTML exports
+SIGNATURE_BYTES = 16 * 1024
+# Worksheet rows examined for title and header signatures
+HEADER_SCAN_ROWS = 50
+
+_OLE2_MAGIC = b'\xd0\xcf\x11\xe0'
+_ZIP_MAGIC = b'PK\x03\x04'
+_HTML_MARKERS = ('<html', '<meta', '<table', '<!doctype')
+
+_EXCEL_ENGINES = {'xls': 'xlrd', 'xlsx': 'openpyxl'}
+
+_FORMATS = []
+
+
+def sniff_container(head):
+    """Identify an upload from its leading bytes: 'xls', 'xlsx', 'html' or 'unknown'"""
+    if head.startswith(_OLE2_MAGIC):
+        return 'xls'
+    if head.startswith(_ZIP_MAGIC):
+        return 'xlsx'
+    text = head.decode('utf-8', errors='ignore').lower()
+    if any(marker in text for marker in _HTML_MARKERS):
+        return 'html'
+    return 'unknown'
+
+
+class IdleUpload:
+    """An uploaded GPS export, read exactly once.
+
+    Detection and parsing share the same bytes: HTML exports are decoded once,
+    and workbooks are loaded once without headers (with the engine matching
+    their magic bytes) so parsers can pick their header row from memory.
+    """
+
+    def __init__(self, content, name=None):
+        self.content = content
+        self.name = name
+        self.container = sniff_container(content[:SIGNATURE_BYTES])
+        self._text = None
+        self._sheet = None
+        self._head_text = None
+        self._header_cells = None
+
+    @property
+    def is_html(self):
+        return self.container == 'html'
+
+    @property
+    def text(self):
+        """The whole document decoded as text (HTML exports)"""
+        if self._text is None:
+            self._text = self.content.decode('utf-8', errors='ignore')
+        return self._text
+
+    @property
+    def sheet(self):
+        """First worksheet as a raw frame (header=None), loaded on first use"""
+        if self._sheet is None:
+            if self.is_html:
+                raise ValueError("HTML export has no worksheet")
+            engine = _EXCEL_ENGINES.get(self.container)
+            self._sheet = pd.read_excel(io.BytesIO(self.content), header=None, engine=engine)
+        return self._sheet
+
+    @property
+    def head_text(self):
+        """Lower-cased text of the first few KB (HTML) or the first rows (workbooks)"""
+        if self._head_text is None:
+            if self.is_html:
+                head = self.content[:SIGNATURE_BYTES].decode('utf-8', errors='ignore')
+            else:
+                head = ' '.join(self.header_cells_in_order())
+            self._head_text = head.lower()
+        return self._head_text
+
+    @property
+    def header_cells(self):
+        """Distinct stripped cell values in the first rows of the worksheet"""
+        if self._header_cells is None:
+            self._header_cells = set() if self.is_html else set(self.header_cells_in_order())
+        return self._header_cells
+
+    def header_cells_in_order(self):
+        head = self.sheet.head(HEADER_SCAN_ROWS)
+        return [str(cell).strip() for row in head.itertuples(index=False) for cell in row if pd.notna(cell)]
+
+
+def read_upload(uploaded_file):
+    """Read a Streamlit upload (or any binary file object) into an IdleUpload"""
+    uploaded_file.seek(0)
+    return IdleUpload(uploaded_file.read(), getattr(uploaded_file, 'name', None))
+
+
+def find_header_row(sheet, labels, max_rows=HEADER_SCAN_ROWS):
+    """Index of the first row holding any of ``labels`` as a cell value, or None"""
+    labels = set(labels)
+    for row_idx, row in enumerate(sheet.head(max_rows).itertuples(index=False)):
+        if any(isinstance(cell, str) and cell.strip() in labels for cell in row):
+            return row_idx
+    return None
+
+
+def frame_from_header(sheet, header_row):
+    """Split a raw worksheet at ``header_row`` the way read_excel(header=...) would.
+
+    Blank header cells become 'Unnamed: N' and repeated names get '.1', '.2'
+    suffixes, so parsers written against read_excel output keep working.
+    """
+    columns = []
+    seen = {}
+    for idx, value in enumerate(sheet.iloc[header_row]):
+        name = f"Unnamed: {idx}" if pd.isna(value) else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    df = sheet.iloc[header_row + 1:].dropna(how='all').reset_index(drop=True)
+    df.columns = columns
+    return df.infer_objects()
+
+
+class IdleFormat:
+    """One GPS export layout: where it lives, how to recognise it, how to parse it"""
+
+    def __init__(self, name, label, containers, matches, parse):
+        self.name = name
+        self.label = label
+        self.containers = containers
+        self.matches = matches
+        self.parse = parse
+
+    def accepts(self, upload):
+        return upload.container in self.containers and self.matches(upload)
+
+
+def register_format(name, label, containers, matches=None):
+    """Decorator registering ``parse(upload) -> DataFrame`` as an idle-report format.
+
+    Formats are tried in registration order, so register specific vendors
+    before catch-all ones. ``matches(upload)`` should only look at the cheap
+    signature views (head_text / header_cells).
+    """
+    def decorator(parse):
+        _FORMATS.append(IdleFormat(name, label, tuple(containers), matches or (lambda upload: True), parse))
+        return parse
+    return decorator
+
+
+def registered_formats():
+    return list(_FORMATS)
+
+
+def detect_format(upload):
+    """Return the first registered format whose signature accepts the upload, or None"""
+    for idle_format in _FORMATS:
+        if idle_format.accepts(upload):
+            return idle_format
+    return None
@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 import io
 from datetime import timedelta
-from db_utils import save_idle_report, get_idle_reports, get_connection, get_active_contractor, get_contractor_name
+from db_utils import save_idle_report, get_idle_reports, delete_idle_reports_by_id, get_active_contractor, get_contractor_name
 from idle_time_analyzer_page import parse_wizpro_idle, parse_paschal_idle, parse_paschal_idle_report, detect_idle_format
 import re
 
@@ -407,12 +407,7 @@ def display_saved_idle_reports():
             delete_ids = st.multiselect("Select rows to delete (by ID)", df["ID"], key="delete_filter_saved")
             if st.button("🗑 Delete Selected", key="delete_button_saved"):
                 if delete_ids:
-                    conn = get_connection()
-                    cur = conn.cursor()
-                    cur.execute("DELETE FROM idle_reports WHERE id = ANY(%s)", (delete_ids,))
-                    conn.commit()
-                    cur.close()
-                    conn.close()
+                    delete_idle_reports_by_id(delete_ids)
                     st.success(f"✅ Deleted {len(delete_ids)} row(s). Refresh to see changes.")
 
         # Download
@@ -1,7 +1,19 @@
 import streamlit as st
 import pandas as pd
 from datetime import timedelta
-from db_utils import save_idle_report, get_idle_reports, get_connection, get_active_contractor
+from db_utils import (save_idle_report, get_idle_reports_page, get_idle_report_contractor_ids,
+                      get_idle_report_plate_options, delete_idle_reports_by_id, get_active_contractor,
+                      IDLE_REPORTS_PAGE_SIZE)
+from plate_utils import extract_license_plate
+from contractor_resolver import resolve_contractor_id, resolve_contractor_ids
+from html_table_parser import iter_table_rows
+from idle_classifier import parse_datetimes
+from duration_utils import parse_durations
+from idle_detection import IDLE_MIN_DURATION, IDLE_SPEED_THRESHOLD, find_idle_runs
+from idle_formats import (HEADER_SCAN_ROWS, detect_format, find_header_row, frame_from_header,
+                          read_upload, register_format)
+from paschal_parking_analyzer import parse_paschal_parking_excel
+import itertools
 import re
 
 # Reverse geocoder for address conversion
@@ -26,28 +38,6 @@ except ImportError:
     def get_address_from_coords(lat, lon):
         return f"{lat}, {lon}"
 
-def extract_license_plate(vehicle_string):
-    """Extract standardized license plate from vehicle string, normalizing variations"""
-    if not vehicle_string or vehicle_string.lower() in ['unknown', 'unknown vehicle', '']:
-        return None
-    vehicle_string = re.sub(r'[\s\t\n\r"\'-]+', ' ', vehicle_string.strip())
-    plate_pattern = re.search(r'\b([A-Z]{3}\s+\d{3,4}[A-Z]?)\b', vehicle_string.upper())
-    if plate_pattern:
-        plate = plate_pattern.group(1)
-        plate = re.sub(r'\s+', ' ', plate)
-        return plate
-    compact_pattern = re.search(r'\b([A-Z]{3}\d{3,4}[A-Z]?)(?:[A-Z]*)*\b', vehicle_string.upper())
-    if compact_pattern:
-        plate = compact_pattern.group(1)
-        plate = re.sub(r'([A-Z]{3})(\d)', r'\1 \2', plate)
-        return plate
-    fallback_pattern = re.search(r'\b([A-Z]{2,4}\s*\d{1,4}[A-Z]*)\b', vehicle_string.upper())
-    if fallback_pattern:
-        plate = fallback_pattern.group(1)
-        plate = re.sub(r'\s+', ' ', plate).strip()
-        return plate
-    return re.sub(r'[^\w]', '', vehicle_string.upper())
-
 def clean_location_address(address_string):
     """Clean HTML-formatted location addresses to extract readable address only"""
     if not address_string or pd.isna(address_string):
@@ -79,41 +69,7 @@ def clean_location_address(address_string):
 
 def get_contractor_id_from_vehicle(vehicle_string):
     """Get contractor_id from vehicle string (may contain plate + contractor name)"""
-    if not vehicle_string or vehicle_string.lower() in ['unknown', 'unknown vehicle', '']:
-        return None
-    license_plate = extract_license_plate(vehicle_string)
-    if not license_plate:
-        return None
-    normalized_plate = license_plate.replace(' ', '').replace('-', '')
-    try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT contractor FROM vehicles WHERE UPPER(REPLACE(REPLACE(plate_number, ' ', ''), '-', '')) = %s", (normalized_plate,))
-        row = cur.fetchone()
-        if not row:
-            cur.execute("SELECT contractor FROM vehicles WHERE UPPER(REPLACE(REPLACE(plate_number, ' ', ''), '-', '')) LIKE %s", (f'%{normalized_plate}%',))
-            row = cur.fetchone()
-        if not row:
-            cur.execute("SELECT contractor FROM vehicles WHERE plate_number = %s", (license_plate,))
-            row = cur.fetchone()
-        if row:
-            contractor_name = row[0]
-            cur.execute("SELECT id FROM contractors WHERE name = %s", (contractor_name,))
-            contractor_row = cur.fetchone()
-            if contractor_row:
-                contractor_id = contractor_row[0]
-                return contractor_id
-        return None
-    except Exception as e:
-        if "no such table" in str(e).lower() or "does not exist" in str(e).lower():
-            st.warning(f"Database table issue: {e}")
-        return None
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
-    return None
+    return resolve_contractor_id(vehicle_string)
 
 def detect_idle_format(df):
     columns = df.columns.str.strip().str.lower()
@@ -157,14 +113,14 @@ def parse_wizpro_idle(df):
             st.warning(f"⚠️ No records with 'stopped' status found in '{status_col}' column. Available values: {list(unique_statuses)}")
     elif 'idle_duration_min' in df.columns:
         original_count = len(df)
-        df = df[df['idle_duration_min'] > 0]
+        df = df[parse_durations(df['idle_duration_min'], default=None) > 0]
         filtered_count = len(df)
         st.write(f"✅ Filtered Wizpro data: {original_count} → {filtered_count} records with duration > 0")
     else:
         st.warning("⚠️ No 'status' column found in Wizpro file. Available columns: " + ", ".join(df.columns.tolist()))
         st.info("💡 Wizpro files should have a 'Status' column with 'stopped' values for idle records.")
     if 'idle_duration_min' in df.columns:
-        df['idle_duration_min'] = pd.to_numeric(df['idle_duration_min'], errors='coerce')
+        df['idle_duration_min'] = parse_durations(df['idle_duration_min'], default=None)
     for col in ['idle_start', 'idle_end']:
         if col in df.columns:
             df[col] = pd.to_datetime(df[col], dayfirst=True, errors='coerce')
@@ -173,7 +129,7 @@ def parse_wizpro_idle(df):
     if 'location_address' not in df.columns:
         df['location_address'] = None
         st.write("⚠️ No 'stop position' column found in Wizpro file")
-    df['contact_id'] = df['numberplate'].apply(get_contractor_id_from_vehicle)
+    df['contact_id'] = resolve_contractor_ids(df['numberplate'])
     return df[['original_vehicle', 'numberplate', 'idle_start', 'idle_end', 'idle_duration_min', 'location_address', 'latitude', 'longitude', 'contact_id']].dropna(subset=['numberplate', 'idle_start', 'idle_end', 'idle_duration_min'])
 
 def parse_paschal_idle(df):
@@ -208,7 +164,7 @@ def parse_paschal_idle(df):
             'number': 'numberplate'
         })
         df['numberplate'] = vehicle_info if vehicle_info else df.get('numberplate', 'Unknown Vehicle')
-        df['idle_duration_min'] = pd.to_numeric(df['idle_duration_min'], errors='coerce')
+        df['idle_duration_min'] = parse_durations(df['idle_duration_min'], default=None)
         df['idle_start'] = pd.to_datetime(df['idle_start'], dayfirst=True, errors='coerce')
         df['idle_end'] = pd.to_datetime(df['idle_end'], dayfirst=True, errors='coerce')
         df['latitude'], df['longitude'] = None, None
@@ -219,7 +175,7 @@ def parse_paschal_idle(df):
                 if not matches.empty and matches[0].notna().any():
                     df['latitude'] = pd.to_numeric(matches[0], errors='coerce')
                     df['longitude'] = pd.to_numeric(matches[1], errors='coerce')
-        df['contact_id'] = df['numberplate'].apply(get_contractor_id_from_vehicle)
+        df['contact_id'] = resolve_contractor_ids(df['numberplate'])
         return df[['numberplate', 'idle_start', 'idle_end', 'idle_duration_min',
                     'location_address', 'latitude', 'longitude', 'contact_id']].dropna(
                         subset=['idle_start', 'idle_end', 'idle_duration_min']
@@ -228,624 +184,345 @@ def parse_paschal_idle(df):
         st.error(f"Paschal parser failed: {e}")
         return pd.DataFrame()
 
-def parse_html_idle_report(html_content):
-    """Parse HTML idle/parking reports - handles both Wizpro and Paschal HTML formats"""
-    try:
-        st.write("🔍 Analyzing HTML content structure...")
+# Patterns used while scanning HTML idle report cells
+_TIME_PATTERN = re.compile(r'\d{1,2}:\d{2}(?::\d{2})?|\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4}')
+_DURATION_PATTERN = re.compile(r'\d+\s*(?:min|minutes?|hrs?|hours?|s|sec|:)')
+_COORD_PATTERN = re.compile(r'([+-]?\d+\.\d+),\s*([+-]?\d+\.\d+)')
+_HREF_COORD_PATTERN = re.compile(r'q=([+-]?\d+\.\d+),([+-]?\d+\.\d+)')
+_LINK_ADDRESS_PATTERN = re.compile(r'</a>\s*-\s*(.+)')
+_TAG_PATTERN = re.compile(r'<[^>]+>')
+_LEADING_TIME_PATTERN = re.compile(r'^\d{1,2}:\d{2}')
+_NUMBER_PATTERN = re.compile(r'^\d+(\.\d+)?$')
+_BARE_COORD_PATTERN = re.compile(r'^\d+\.\d+,\s*\d+\.\d+$')
+_WORD_PATTERN = re.compile(r'[a-zA-Z]{3,}')
+_VEHICLE_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in [
+    r'<td><strong>Object:</strong></td><td>([^<]+)</td>',
+    r'Object:\s*([^<\n]+)',
+    r'<strong>Object:</strong>\s*([^<\n]+)',
+    r'Vehicle:\s*([^<\n]+)',
+    r'<td[^>]*>Object:</td>\s*<td[^>]*>([^<]+)</td>',
+    r'Object:\s*([A-Z0-9\s\-]+)',  # License plate pattern
+    r'Parking\s*Details\s*\(([^)]+)\)',  # Paschal format: Parking Details(KDC873G)
+    r'ParkingDetails-([A-Z0-9]+)',  # Alternative Paschal format
+    r'([A-Z]{3}\s*\d{1,4}[A-Z]*)-Engine\s*Idle\s*Report',  # KDD 500X-Engine Idle Report
+    r'Engine\s*Idle\s*Report-([A-Z0-9]+)',  # EngineIdleReport-KDD500X
+    r'([A-Z0-9]{3,8})-Engine\s*Idle\s*Report',  # KDD500X-Engine Idle Report (no space)
+]]
+_EMPTY_CELL_VALUES = {'n/a', 'none', ''}
+_IDLE_ROW_INDICATORS = ['stopped', 'idle', 'engine idle', 'parking']
+_HEADER_SCAN_ROWS = 10
+
+
+def _parse_coordinates(text):
+    match = _COORD_PATTERN.search(text)
+    if match:
+        return float(match.group(1)), float(match.group(2))
+    return None, None
+
+
+def _parse_stop_position(raw_address):
+    """Split a Wizpro stop position cell into (address, latitude, longitude)"""
+    if not raw_address or '<a' not in raw_address:
+        return raw_address, None, None
+    # Coordinates live in the map link: q=-1.275198,36.812071&t=m
+    latitude, longitude = None, None
+    coord_match = _HREF_COORD_PATTERN.search(raw_address)
+    if coord_match:
+        latitude = float(coord_match.group(1))
+        longitude = float(coord_match.group(2))
+    # Address follows the link: </a> - Some Road, Nairobi
+    addr_match = _LINK_ADDRESS_PATTERN.search(raw_address)
+    address = addr_match.group(1).strip() if addr_match else raw_address
+    return address, latitude, longitude
+
+
+def _scan_times_and_duration(cells):
+    """First two time-like cells plus the first cell that looks like a duration"""
+    start_time = end_time = duration_text = None
+    for cell in cells:
+        cell_clean = cell.strip()
+        if cell_clean.lower() in _EMPTY_CELL_VALUES:
+            continue
+        if _TIME_PATTERN.search(cell_clean):
+            if not start_time:
+                start_time = cell_clean
+            elif not end_time:
+                end_time = cell_clean
+        lowered = cell_clean.lower()
+        if ('min' in lowered or 's' in lowered) and not duration_text:
+            duration_text = cell_clean
+    return start_time, end_time, duration_text
+
+
+def _find_location_cell(cells):
+    """Address-like text in the columns after status/start/end/duration"""
+    for cell in cells[4:10]:
+        cell_content = cell.strip()
+        # Skip empty cells, times, pure numbers and bare coordinates
+        if (len(cell_content) > 2 and
+                not _LEADING_TIME_PATTERN.match(cell_content) and
+                not _NUMBER_PATTERN.match(cell_content) and
+                not _BARE_COORD_PATTERN.match(cell_content) and
+                _WORD_PATTERN.search(cell_content)):
+            return cell_content
+    return None
+
 
-        # First, try to determine if this is Wizpro or Paschal format by looking for specific patterns
-        is_paschal = False
-        is_wizpro = False
+class _IdleColumns:
+    """Columnar accumulator for parsed idle rows; timestamps and durations are converted once at the end.
 
-        html_lower = html_content.lower()
+    ``fallback_duration`` is used for rows whose duration text reads as zero;
+    with ``positive_only`` rows that still have no duration are dropped.
+    """
 
-        # Check for Wizpro indicators first (status column is a strong Wizpro indicator)
-        wizpro_indicators = ['wizpro', 'stopped', 'stop position', 'idle time', 'status']
-        if any(indicator in html_lower for indicator in wizpro_indicators):
-            is_wizpro = True
-            st.write("📊 Detected Wizpro HTML format (status/stop position indicators)")
+    def __init__(self, with_coordinates, positive_only=False):
+        self.with_coordinates = with_coordinates
+        self.positive_only = positive_only
+        self.columns = {key: [] for key in ['idle_start', 'idle_end', 'idle_duration_min', 'fallback_duration',
+                                            'location_address', 'latitude', 'longitude']}
 
-        # Check for Paschal indicators (only if not Wizpro)
-        if not is_wizpro:
-            paschal_indicators = ['engine idle report', 'engine idle', 'idle report', 'coordinate', 'start time', 'end time', 'stop duration']
-            if any(indicator in html_lower for indicator in paschal_indicators):
-                is_paschal = True
-                st.write("📊 Detected Paschal HTML format (idle report)")
+    def __len__(self):
+        return len(self.columns['idle_start'])
+
+    def add(self, start_time, end_time, duration_text, location_address, latitude=None, longitude=None,
+            fallback_duration=None):
+        self.columns['idle_start'].append(start_time)
+        self.columns['idle_end'].append(end_time)
+        self.columns['idle_duration_min'].append(duration_text)
+        self.columns['fallback_duration'].append(fallback_duration)
+        self.columns['location_address'].append(location_address or None)
+        self.columns['latitude'].append(latitude)
+        self.columns['longitude'].append(longitude)
+
+    def to_frame(self, vehicle):
+        if not len(self):
+            return pd.DataFrame()
+        df = pd.DataFrame(self.columns)
+        minutes = parse_durations(df['idle_duration_min'].astype(object))
+        fallback = df.pop('fallback_duration')
+        if fallback.notna().any():
+            minutes = minutes.where(minutes > 0, parse_durations(fallback.astype(object)))
+        df['idle_duration_min'] = minutes
+        if self.positive_only:
+            df = df[df['idle_duration_min'] > 0].reset_index(drop=True)
+            if df.empty:
+                return pd.DataFrame()
+        df.insert(0, 'vehicle', vehicle)
+        for col in ['idle_start', 'idle_end']:
+            df[col] = parse_datetimes(df[col].astype(object), format=None)
+        if not self.with_coordinates:
+            df = df.drop(columns=['latitude', 'longitude'])
+        return df
+
+
+def _find_wizpro_header(rows):
+    status_col = stop_position_col = duration_col = -1
+    for cells in rows[:5]:  # Check first few rows for headers
+        for col_idx, cell in enumerate(cells):
+            cell_text = cell.strip().lower()
+            if 'status' in cell_text:
+                status_col = col_idx
+                st.write(f"✅ Found 'Status' column at position {col_idx}")
+            elif 'stop position' in cell_text:
+                stop_position_col = col_idx
+                st.write(f"✅ Found 'Stop Position' column at position {col_idx}")
+            elif 'duration' in cell_text:
+                duration_col = col_idx
+    return status_col, stop_position_col, duration_col
+
+
+def _parse_wizpro_html_rows(rows, head, parse_stop_position):
+    """Wizpro HTML: keep 'stopped' rows, falling back to a generic scan without headers"""
+    status_col, stop_position_col, duration_col = _find_wizpro_header(head)
+
+    # If we found the key columns, use positional extraction
+    if status_col >= 0 and stop_position_col >= 0:
+        st.write("🔍 Using column position mapping for Wizpro HTML")
+        records = _IdleColumns(with_coordinates=parse_stop_position)
+        min_cells = max(status_col, stop_position_col)
+        for cells in rows:
+            if len(cells) <= min_cells or cells[status_col].strip().lower() != "stopped":
+                continue
+            raw_address = cells[stop_position_col].strip()
+            if parse_stop_position:
+                address_text, latitude, longitude = _parse_stop_position(raw_address)
+            else:
+                address_text, latitude, longitude = raw_address, None, None
+
+            start_time, end_time, duration_text = _scan_times_and_duration(cells)
+            if 0 <= duration_col < len(cells):
+                # The mapped column beats guessing ('Stopped' also contains an 's')
+                duration_text = cells[duration_col].strip() or None
+            if start_time and end_time:
+                records.add(start_time, end_time, duration_text, address_text, latitude, longitude)
+        return records
+
+    # Fallback: generic parsing if column headers not found
+    st.write("⚠️ Column headers not found, using generic parsing")
+    records = _IdleColumns(with_coordinates=False, positive_only=True)
+    for cells in rows:
+        # Look for rows that contain idle/stopped information
+        if len(cells) < 4:
+            continue
+        row_text = ' '.join(cells).lower()
+        if not any(indicator in row_text for indicator in _IDLE_ROW_INDICATORS):
+            continue
+
+        start_time = end_time = duration = engine_idle = ""
+        for j, cell in enumerate(cells):
+            cell_clean = cell.strip()
+            if _TIME_PATTERN.search(cell_clean):
+                if not start_time:
+                    start_time = cell_clean
+                elif not end_time:
+                    end_time = cell_clean
+
+            # Look for duration patterns
+            lowered = cell_clean.lower()
+            if 'min' in lowered or 's' in lowered or ':' in cell_clean:
+                if not duration and ('min' in lowered or 's' in lowered):
+                    duration = cell_clean
+                elif not engine_idle and j >= 3:  # Engine idle is usually later columns
+                    engine_idle = cell_clean
+
+        # Use duration if engine_idle not found
+        if not engine_idle:
+            engine_idle = duration
+
+        if engine_idle and engine_idle.lower() not in ['0', '0 s', '0 min', '', 'n/a']:
+            records.add(start_time, end_time, engine_idle, _find_location_cell(cells),
+                        fallback_duration=duration or None)
+    return records
+
+
+def _parse_paschal_html_rows(rows, head):
+    """Paschal HTML idle report: positional columns, or rows carrying coordinates"""
+    records = _IdleColumns(with_coordinates=True)
+    start_time_col = end_time_col = stop_duration_col = coordinate_col = address_col = -1
+
+    # Look for header row
+    for cells in head[:_HEADER_SCAN_ROWS]:
+        for col_idx, cell in enumerate(cells):
+            cell_text = cell.strip().lower()
+            if cell_text == '#':
+                st.write(f"✅ Found '#' column at position {col_idx}")
+            elif 'start time' in cell_text:
+                start_time_col = col_idx
+                st.write(f"✅ Found 'Start Time' column at position {col_idx}")
+            elif 'end time' in cell_text:
+                end_time_col = col_idx
+                st.write(f"✅ Found 'End Time' column at position {col_idx}")
+            elif 'stop duration' in cell_text:
+                stop_duration_col = col_idx
+                st.write(f"✅ Found 'Stop Duration' column at position {col_idx}")
+            elif 'coordinate' in cell_text:
+                coordinate_col = col_idx
+                st.write(f"✅ Found 'Coordinate' column at position {col_idx}")
+            elif 'address' in cell_text and address_col == -1:  # Take first address column
+                address_col = col_idx
+                st.write(f"✅ Found 'Address' column at position {col_idx}")
+
+    # If we found the key columns, use positional extraction
+    if start_time_col >= 0 and end_time_col >= 0 and stop_duration_col >= 0:
+        st.write("🔍 Using column position mapping for Paschal HTML idle report")
+        min_cells = max(start_time_col, end_time_col, stop_duration_col)
+        for cells in rows:
+            if len(cells) <= min_cells:
+                continue
+            start_time = cells[start_time_col].strip()
+            end_time = cells[end_time_col].strip()
+            duration_text = cells[stop_duration_col].strip()
+            if not (start_time and end_time and duration_text):
+                continue
+
+            coordinate_text = cells[coordinate_col].strip() if 0 <= coordinate_col < len(cells) else ""
+            latitude, longitude = _parse_coordinates(coordinate_text)
+
+            # Clean address (remove HTML if present)
+            address_text = cells[address_col].strip() if 0 <= address_col < len(cells) else ""
+            if '<a' in address_text:
+                addr_match = _LINK_ADDRESS_PATTERN.search(address_text)
+                if addr_match:
+                    address_text = addr_match.group(1).strip()
+                else:
+                    address_text = _TAG_PATTERN.sub('', address_text).strip()
+
+            records.add(start_time, end_time, duration_text, address_text, latitude, longitude)
+        return records
+
+    # Fallback: generic parsing if column headers not found
+    st.write("⚠️ Column headers not found, using generic parsing for Paschal idle report")
+    for cells in rows:
+        # Look for rows with coordinate data (indicates idle report format)
+        if len(cells) < 5 or any('coordinate' in cell.lower() for cell in cells):
+            continue  # Skip short rows and the header row
+        coordinate_text = next((cell for cell in cells if _COORD_PATTERN.search(cell)), "")
+        if not coordinate_text:
+            continue
+
+        start_time = end_time = duration = address_text = ""
+        for cell in cells:
+            cell_clean = cell.strip()
+            if cell_clean.lower() in _EMPTY_CELL_VALUES:
+                continue
+            if _TIME_PATTERN.search(cell_clean):
+                if not start_time:
+                    start_time = cell_clean
+                elif not end_time:
+                    end_time = cell_clean
+            elif _DURATION_PATTERN.search(cell_clean.lower()):
+                duration = cell_clean
+            # Address: long text that's not a coordinate or a number
+            elif (len(cell_clean) > 5 and
+                  not _COORD_PATTERN.search(cell_clean) and
+                  not cell_clean.isdigit()):
+                address_text = cell_clean
+
+        if start_time and end_time:
+            latitude, longitude = _parse_coordinates(coordinate_text)
+            records.add(start_time, end_time, duration or None, address_text, latitude, longitude)
+    return records
+
+
+def parse_html_idle_report(html_content, html_format='generic'):
+    """Parse HTML idle/parking reports - handles both Wizpro and Paschal HTML formats.
+
+    ``html_format`` is 'wizpro', 'paschal' or 'generic' (unrecognised content, parsed
+    the Wizpro way with stop position coordinates); the format registry picks it.
+    """
+    try:
+        st.write("🔍 Analyzing HTML content structure...")
 
         # Extract vehicle name - try multiple patterns for both formats
         vehicle = "Unknown Vehicle"
-        vehicle_patterns = [
-            r'<td><strong>Object:</strong></td><td>([^<]+)</td>',
-            r'Object:\s*([^<\n]+)',
-            r'<strong>Object:</strong>\s*([^<\n]+)',
-            r'Vehicle:\s*([^<\n]+)',
-            r'<td[^>]*>Object:</td>\s*<td[^>]*>([^<]+)</td>',
-            r'Object:\s*([A-Z0-9\s\-]+)',  # License plate pattern
-            r'Parking\s*Details\s*\(([^)]+)\)',  # Paschal format: Parking Details(KDC873G)
-            r'ParkingDetails-([A-Z0-9]+)',  # Alternative Paschal format
-            r'([A-Z]{3}\s*\d{1,4}[A-Z]*)-Engine\s*Idle\s*Report',  # KDD 500X-Engine Idle Report
-            r'Engine\s*Idle\s*Report-([A-Z0-9]+)',  # EngineIdleReport-KDD500X
-            r'([A-Z0-9]{3,8})-Engine\s*Idle\s*Report',  # KDD500X-Engine Idle Report (no space)
-        ]
-
-        for pattern in vehicle_patterns:
-            vehicle_match = re.search(pattern, html_content, re.IGNORECASE)
+        for pattern in _VEHICLE_PATTERNS:
+            vehicle_match = pattern.search(html_content)
             if vehicle_match:
-                vehicle = vehicle_match.group(1).strip()
                 # Clean up the vehicle name (remove extra spaces, standardize format)
-                vehicle = re.sub(r'\s+', '', vehicle).upper()
+                vehicle = re.sub(r'\s+', '', vehicle_match.group(1).strip()).upper()
                 st.write(f"✅ Extracted vehicle: {vehicle}")
                 break
 
-        # Find all table rows - be more flexible
-        rows = re.findall(r'<tr[^>]*>(.*?)</tr>', html_content, re.DOTALL | re.IGNORECASE)
-        st.write(f"📋 Found {len(rows)} table rows")
-
-        idle_data = []
+        # Stream table rows once; only the first few are buffered for header detection
+        rows = iter_table_rows(html_content)
+        head = list(itertools.islice(rows, _HEADER_SCAN_ROWS))
+        all_rows = itertools.chain(head, rows)
 
-        if is_wizpro:
-            # Handle Wizpro HTML format - look for status column and filter for "stopped"
-            st.write("🔄 Processing Wizpro HTML format...")
-
-            # First, try to identify column positions by looking for headers
-            status_col = -1
-            stop_position_col = -1
-            start_time_col = -1
-            end_time_col = -1
-            duration_col = -1
-
-            # Look for header row
-            for row in rows[:5]:  # Check first few rows for headers
-                cells = re.findall(r'<td[^>]*>(.*?)</td>', row, re.DOTALL | re.IGNORECASE)
-                if not cells:
-                    cells = re.findall(r'<td>(.*?)</td>', row, re.DOTALL | re.IGNORECASE)
-
-                for col_idx, cell in enumerate(cells):
-                    cell_text = cell.strip().lower()
-                    if 'status' in cell_text:
-                        status_col = col_idx
-                        st.write(f"✅ Found 'Status' column at position {col_idx}")
-                    elif 'stop position' in cell_text:
-                        stop_position_col = col_idx
-                        st.write(f"✅ Found 'Stop Position' column at position {col_idx}")
-                    elif 'start' in cell_text and 'time' in cell_text:
-                        start_time_col = col_idx
-                    elif 'end' in cell_text and 'time' in cell_text:
-                        end_time_col = col_idx
-                    elif 'duration' in cell_text:
-                        duration_col = col_idx
-
-            # If we found the key columns, use positional extraction
-            if status_col >= 0 and stop_position_col >= 0:
-                st.write("🔍 Using column position mapping for Wizpro HTML")
-
-                for row in rows:
-                    cells = re.findall(r'<td[^>]*>(.*?)</td>', row, re.DOTALL | re.IGNORECASE)
-                    if not cells:
-                        cells = re.findall(r'<td>(.*?)</td>', row, re.DOTALL | re.IGNORECASE)
-
-                    if len(cells) > max(status_col, stop_position_col):
-                        # Check if status is "stopped"
-                        status_value = cells[status_col].strip().lower() if status_col < len(cells) else ""
-                        if status_value == "stopped":
-                            # Extract stop position for address
-                            address_text = cells[stop_position_col].strip() if stop_position_col < len(cells) else ""
-
-                            # Look for time and duration data in other cells
-                            start_time = None
-                            end_time = None
-                            duration_text = None
-
-                            for cell in cells:
-                                cell_clean = cell.strip()
-                                if not cell_clean or cell_clean.lower() in ['n/a', 'none', '']:
-                                    continue
-
-                                time_match = re.search(r'\d{1,2}:\d{2}(?::\d{2})?|\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4}', cell_clean)
-                                if time_match:
-                                    if not start_time:
-                                        start_time = cell_clean
-                                    elif not end_time:
-                                        end_time = cell_clean
-
-                                # Look for duration
-                                if ('min' in cell_clean.lower() or 's' in cell_clean.lower()) and not duration_text:
-                                    duration_text = cell_clean
-
-                            if start_time and end_time:
-                                idle_min = parse_duration_to_minutes(duration_text) if duration_text else 0
-
-                                idle_data.append({
-                                    'vehicle': vehicle,
-                                    'idle_start': pd.to_datetime(start_time, errors='coerce'),
-                                    'idle_end': pd.to_datetime(end_time, errors='coerce'),
-                                    'idle_duration_min': idle_min,
-                                    'location_address': address_text if address_text else None
-                                })
-            else:
-                # Fallback: generic parsing if column headers not found
-                st.write("⚠️ Column headers not found, using generic parsing")
-
-                for i, row in enumerate(rows):
-                    # Look for rows that contain idle/stopped information
-                    row_text = row.lower()
-
-                    # Check for idle indicators
-                    idle_indicators = ['stopped', 'idle', 'engine idle', 'parking']
-                    has_idle_indicator = any(indicator in row_text for indicator in idle_indicators)
-
-                    if has_idle_indicator and ('<td' in row or 'td>' in row):
-                        # Extract cells - try different patterns
-                        cells = re.findall(r'<td[^>]*>(.*?)</td>', row, re.DOTALL | re.IGNORECASE)
-
-                        # Also try without attributes
-                        if not cells:
-                            cells = re.findall(r'<td>(.*?)</td>', row, re.DOTALL | re.IGNORECASE)
-
-                        if len(cells) >= 4:
-                            # Try to identify columns by content
-                            status = cells[0].strip()
-                            start_time = ""
-                            end_time = ""
-                            duration = ""
-                            engine_idle = ""
-
-                            # Look for time patterns in cells
-                            time_pattern = re.compile(r'\d{1,2}:\d{2}(?::\d{2})?|\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4}')
-
-                            for j, cell in enumerate(cells):
-                                cell_clean = cell.strip()
-                                if time_pattern.search(cell_clean):
-                                    if not start_time:
-                                        start_time = cell_clean
-                                    elif not end_time:
-                                        end_time = cell_clean
-
-                                # Look for duration patterns
-                                if 'min' in cell_clean.lower() or 's' in cell_clean.lower() or ':' in cell_clean:
-                                    if not duration and ('min' in cell_clean.lower() or 's' in cell_clean.lower()):
-                                        duration = cell_clean
-                                    elif not engine_idle and j >= 3:  # Engine idle is usually later columns
-                                        engine_idle = cell_clean
-
-                            # Use duration if engine_idle not found
-                            if not engine_idle:
-                                engine_idle = duration
-
-                            if engine_idle and engine_idle.lower() not in ['0', '0 s', '0 min', '', 'n/a']:
-                                # Parse duration to minutes
-                                idle_min = parse_duration_to_minutes(engine_idle)
-                                if idle_min <= 0 and duration:
-                                    idle_min = parse_duration_to_minutes(duration)
-
-                                # Extract location/address from table cells with coordinate parsing
-                                location_address = None
-                                latitude = None
-                                longitude = None
-
-                                if len(cells) > 4:
-                                    # Look for location in subsequent columns (skip status, start, end, duration)
-                                    for k in range(4, min(len(cells), 10)):  # Check next several columns
-                                        cell_content = cells[k].strip()
-                                        # Skip empty cells, times, and pure numeric cells
-                                        if (cell_content and
-                                            not re.match(r'^\d{1,2}:\d{2}', cell_content) and
-                                            not re.match(r'^\d+(\.\d+)?$', cell_content) and
-                                            not re.match(r'^\d+\.\d+,\s*\d+\.\d+$', cell_content) and  # Skip coordinates
-                                            len(cell_content) > 2):  # Must be reasonably long
-
-                                            # Look for address-like content (contains letters, spaces, commas)
-                                            if re.search(r'[a-zA-Z]{3,}', cell_content):
-                                                location_address = cell_content
-                                                break
-
-                                if idle_min > 0:
-                                    idle_data.append({
-                                        'vehicle': vehicle,
-                                        'idle_start': pd.to_datetime(start_time, errors='coerce'),
-                                        'idle_end': pd.to_datetime(end_time, errors='coerce'),
-                                        'idle_duration_min': idle_min,
-                                        'location_address': location_address
-                                    })
-
-        elif is_paschal:
-            # Handle Paschal HTML format - look for idle report columns
+        if html_format == 'paschal':
             st.write("🔄 Processing Paschal HTML format (idle report)...")
-
-            # First, try to identify column positions by looking for headers
-            serial_col = -1
-            start_time_col = -1
-            end_time_col = -1
-            stop_duration_col = -1
-            coordinate_col = -1
-            address_col = -1
-
-            # Look for header row
-            for row in rows[:10]:  # Check first 10 rows for headers
-                cells = re.findall(r'<td[^>]*>(.*?)</td>', row, re.DOTALL | re.IGNORECASE)
-                if not cells:
-                    cells = re.findall(r'<td>(.*?)</td>', row, re.DOTALL | re.IGNORECASE)
-
-                for col_idx, cell in enumerate(cells):
-                    cell_text = cell.strip().lower()
-                    if cell_text == '#':
-                        serial_col = col_idx
-                        st.write(f"✅ Found '#' column at position {col_idx}")
-                    elif 'start time' in cell_text:
-                        start_time_col = col_idx
-                        st.write(f"✅ Found 'Start Time' column at position {col_idx}")
-                    elif 'end time' in cell_text:
-                        end_time_col = col_idx
-                        st.write(f"✅ Found 'End Time' column at position {col_idx}")
-                    elif 'stop duration' in cell_text:
-                        stop_duration_col = col_idx
-                        st.write(f"✅ Found 'Stop Duration' column at position {col_idx}")
-                    elif 'coordinate' in cell_text:
-                        coordinate_col = col_idx
-                        st.write(f"✅ Found 'Coordinate' column at position {col_idx}")
-                    elif 'address' in cell_text and address_col == -1:  # Take first address column
-                        address_col = col_idx
-                        st.write(f"✅ Found 'Address' column at position {col_idx}")
-
-            # If we found the key columns, use positional extraction
-            if start_time_col >= 0 and end_time_col >= 0 and stop_duration_col >= 0:
-                st.write("🔍 Using column position mapping for Paschal HTML idle report")
-
-                for row in rows:
-                    cells = re.findall(r'<td[^>]*>(.*?)</td>', row, re.DOTALL | re.IGNORECASE)
-                    if not cells:
-                        cells = re.findall(r'<td>(.*?)</td>', row, re.DOTALL | re.IGNORECASE)
-
-                    if len(cells) > max(start_time_col, end_time_col, stop_duration_col):
-                        # Extract data from known column positions
-                        start_time = cells[start_time_col].strip() if start_time_col < len(cells) else ""
-                        end_time = cells[end_time_col].strip() if end_time_col < len(cells) else ""
-                        duration_text = cells[stop_duration_col].strip() if stop_duration_col < len(cells) else ""
-
-                        # Extract coordinates if available
-                        coordinate_text = ""
-                        if coordinate_col >= 0 and coordinate_col < len(cells):
-                            coordinate_text = cells[coordinate_col].strip()
-
-                        # Extract address if available
-                        address_text = ""
-                        if address_col >= 0 and address_col < len(cells):
-                            address_text = cells[address_col].strip()
-
-                        # Parse coordinates
-                        latitude = None
-                        longitude = None
-                        if coordinate_text:
-                            coord_match = re.search(r'([+-]?\d+\.\d+),\s*([+-]?\d+\.\d+)', coordinate_text)
-                            if coord_match:
-                                latitude = float(coord_match.group(1))
-                                longitude = float(coord_match.group(2))
-
-                        # Clean address (remove HTML if present)
-                        clean_address = address_text
-                        if '<a' in address_text:
-                            # Extract address from HTML link
-                            addr_match = re.search(r'</a>\s*-\s*(.+)', address_text)
-                            if addr_match:
-                                clean_address = addr_match.group(1).strip()
-                            else:
-                                # Remove HTML tags
-                                clean_address = re.sub(r'<[^>]+>', '', address_text).strip()
-
-                        if start_time and end_time and duration_text:
-                            idle_min = parse_duration_to_minutes(duration_text)
-
-                            idle_data.append({
-                                'vehicle': vehicle,
-                                'idle_start': pd.to_datetime(start_time, errors='coerce'),
-                                'idle_end': pd.to_datetime(end_time, errors='coerce'),
-                                'idle_duration_min': idle_min,
-                                'location_address': clean_address if clean_address else None,
-                                'latitude': latitude,
-                                'longitude': longitude
-                            })
-            else:
-                # Fallback: generic parsing if column headers not found
-                st.write("⚠️ Column headers not found, using generic parsing for Paschal idle report")
-
-                for i, row in enumerate(rows):
-                    cells = re.findall(r'<td[^>]*>(.*?)</td>', row, re.DOTALL | re.IGNORECASE)
-                    if not cells:
-                        cells = re.findall(r'<td>(.*?)</td>', row, re.DOTALL | re.IGNORECASE)
-
-                    # Look for rows with coordinate data (indicates idle report format)
-                    if len(cells) >= 5:
-                        coordinate_found = any('coordinate' in cell.lower() for cell in cells)
-                        if coordinate_found:
-                            continue  # Skip header row
-
-                        # Look for coordinate pattern in cells
-                        coordinate_text = ""
-                        for cell in cells:
-                            if re.search(r'[+-]?\d+\.\d+,\s*[+-]?\d+\.\d+', cell):
-                                coordinate_text = cell
-                                break
-
-                        if coordinate_text:  # This looks like an idle report row
-                            time_pattern = re.compile(r'\d{1,2}:\d{2}(?::\d{2})?|\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4}')
-                            duration_pattern = re.compile(r'\d+\s*(?:min|minutes?|hrs?|hours?|s|sec|:)')
-
-                            start_time = ""
-                            end_time = ""
-                            duration = ""
-                            address_text = ""
-
-                            # Scan cells for data
-                            for cell in cells:
-                                cell_clean = cell.strip()
-                                if not cell_clean or cell_clean.lower() in ['n/a', 'none', '']:
-                                    continue
-
-                                # Check for time
-                                if time_pattern.search(cell_clean):
-                                    if not start_time:
-                                        start_time = cell_clean
-                                    elif not end_time:
-                                        end_time = cell_clean
-
-                                # Check for duration
-                                elif duration_pattern.search(cell_clean.lower()):
-                                    duration = cell_clean
-
-                                # Check for address (long text that's not coordinate)
-                                elif (len(cell_clean) > 5 and
-                                      not re.search(r'[+-]?\d+\.\d+,\s*[+-]?\d+\.\d+', cell_clean) and
-                                      not time_pattern.search(cell_clean) and
-                                      not duration_pattern.search(cell_clean.lower()) and
-                                      not cell_clean.isdigit()):
-                                    address_text = cell_clean
-
-                            # Parse coordinates
-                            latitude = None
-                            longitude = None
-                            coord_match = re.search(r'([+-]?\d+\.\d+),\s*([+-]?\d+\.\d+)', coordinate_text)
-                            if coord_match:
-                                latitude = float(coord_match.group(1))
-                                longitude = float(coord_match.group(2))
-
-                            if start_time and end_time:
-                                idle_min = parse_duration_to_minutes(duration) if duration else 0
-
-                                idle_data.append({
-                                    'vehicle': vehicle,
-                                    'idle_start': pd.to_datetime(start_time, errors='coerce'),
-                                    'idle_end': pd.to_datetime(end_time, errors='coerce'),
-                                    'idle_duration_min': idle_min,
-                                    'location_address': address_text if address_text else None,
-                                    'latitude': latitude,
-                                    'longitude': longitude
-                                })
-
+            records = _parse_paschal_html_rows(all_rows, head)
         else:
-            # Handle Wizpro HTML format - look for status column and filter for "stopped"
             st.write("🔄 Processing Wizpro HTML format...")
+            records = _parse_wizpro_html_rows(all_rows, head, parse_stop_position=html_format != 'wizpro')
 
-            # First, try to identify column positions by looking for headers
-            status_col = -1
-            stop_position_col = -1
-            start_time_col = -1
-            end_time_col = -1
-            duration_col = -1
-
-            # Look for header row
-            for row in rows[:5]:  # Check first few rows for headers
-                cells = re.findall(r'<td[^>]*>(.*?)</td>', row, re.DOTALL | re.IGNORECASE)
-                if not cells:
-                    cells = re.findall(r'<td>(.*?)</td>', row, re.DOTALL | re.IGNORECASE)
-
-                for col_idx, cell in enumerate(cells):
-                    cell_text = cell.strip().lower()
-                    if 'status' in cell_text:
-                        status_col = col_idx
-                        st.write(f"✅ Found 'Status' column at position {col_idx}")
-                    elif 'stop position' in cell_text:
-                        stop_position_col = col_idx
-                        st.write(f"✅ Found 'Stop Position' column at position {col_idx}")
-                    elif 'start' in cell_text and 'time' in cell_text:
-                        start_time_col = col_idx
-                    elif 'end' in cell_text and 'time' in cell_text:
-                        end_time_col = col_idx
-                    elif 'duration' in cell_text:
-                        duration_col = col_idx
-
-            # If we found the key columns, use positional extraction
-            if status_col >= 0 and stop_position_col >= 0:
-                st.write("🔍 Using column position mapping for Wizpro HTML")
-
-                for row in rows:
-                    cells = re.findall(r'<td[^>]*>(.*?)</td>', row, re.DOTALL | re.IGNORECASE)
-                    if not cells:
-                        cells = re.findall(r'<td>(.*?)</td>', row, re.DOTALL | re.IGNORECASE)
-
-                    if len(cells) > max(status_col, stop_position_col):
-                        # Check if status is "stopped"
-                        status_value = cells[status_col].strip().lower() if status_col < len(cells) else ""
-                        if status_value == "stopped":
-                            # Extract stop position for address with coordinate parsing
-                            raw_address = cells[stop_position_col].strip() if stop_position_col < len(cells) else ""
-                            address_text = None
-                            latitude = None
-                            longitude = None
-
-                            # Parse HTML-formatted address with coordinates
-                            if raw_address and '<a' in raw_address:
-                                # Extract coordinates from href: q=-1.275198,36.812071&t=m
-                                coord_match = re.search(r'q=([+-]?\d+\.\d+),([+-]?\d+\.\d+)', raw_address)
-                                if coord_match:
-                                    latitude = float(coord_match.group(1))
-                                    longitude = float(coord_match.group(2))
-
-                                # Extract address from after </a> -
-                                addr_match = re.search(r'</a>\s*-\s*(.+)', raw_address)
-                                if addr_match:
-                                    address_text = addr_match.group(1).strip()
-                                else:
-                                    address_text = raw_address  # Fallback to raw if parsing fails
-                            else:
-                                address_text = raw_address  # Use as-is if not HTML formatted
-
-                            # Look for time and duration data in other cells
-                            start_time = None
-                            end_time = None
-                            duration_text = None
-
-                            for cell in cells:
-                                cell_clean = cell.strip()
-                                if not cell_clean or cell_clean.lower() in ['n/a', 'none', '']:
-                                    continue
-
-                                time_match = re.search(r'\d{1,2}:\d{2}(?::\d{2})?|\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4}', cell_clean)
-                                if time_match:
-                                    if not start_time:
-                                        start_time = cell_clean
-                                    elif not end_time:
-                                        end_time = cell_clean
-
-                                # Look for duration
-                                if ('min' in cell_clean.lower() or 's' in cell_clean.lower()) and not duration_text:
-                                    duration_text = cell_clean
-
-                            if start_time and end_time:
-                                idle_min = parse_duration_to_minutes(duration_text) if duration_text else 0
-
-                                idle_data.append({
-                                    'vehicle': vehicle,
-                                    'idle_start': pd.to_datetime(start_time, errors='coerce'),
-                                    'idle_end': pd.to_datetime(end_time, errors='coerce'),
-                                    'idle_duration_min': idle_min,
-                                    'location_address': address_text if address_text else None,
-                                    'latitude': latitude,
-                                    'longitude': longitude
-                                })
-            else:
-                # Fallback: generic parsing if column headers not found
-                st.write("⚠️ Column headers not found, using generic parsing")
-
-                for i, row in enumerate(rows):
-                    # Look for rows that contain idle/stopped information
-                    row_text = row.lower()
-
-                    # Check for idle indicators
-                    idle_indicators = ['stopped', 'idle', 'engine idle', 'parking']
-                    has_idle_indicator = any(indicator in row_text for indicator in idle_indicators)
-
-                    if has_idle_indicator and ('<td' in row or 'td>' in row):
-                        # Extract cells - try different patterns
-                        cells = re.findall(r'<td[^>]*>(.*?)</td>', row, re.DOTALL | re.IGNORECASE)
-
-                        # Also try without attributes
-                        if not cells:
-                            cells = re.findall(r'<td>(.*?)</td>', row, re.DOTALL | re.IGNORECASE)
-
-                        if len(cells) >= 4:
-                            # Try to identify columns by content
-                            status = cells[0].strip()
-                            start_time = ""
-                            end_time = ""
-                            duration = ""
-                            engine_idle = ""
-
-                            # Look for time patterns in cells
-                            time_pattern = re.compile(r'\d{1,2}:\d{2}(?::\d{2})?|\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4}')
-
-                            for j, cell in enumerate(cells):
-                                cell_clean = cell.strip()
-                                if time_pattern.search(cell_clean):
-                                    if not start_time:
-                                        start_time = cell_clean
-                                    elif not end_time:
-                                        end_time = cell_clean
-
-                                # Look for duration patterns
-                                if 'min' in cell_clean.lower() or 's' in cell_clean.lower() or ':' in cell_clean:
-                                    if not duration and ('min' in cell_clean.lower() or 's' in cell_clean.lower()):
-                                        duration = cell_clean
-                                    elif not engine_idle and j >= 3:  # Engine idle is usually later columns
-                                        engine_idle = cell_clean
-
-                            # Use duration if engine_idle not found
-                            if not engine_idle:
-                                engine_idle = duration
-
-                            if engine_idle and engine_idle.lower() not in ['0', '0 s', '0 min', '', 'n/a']:
-                                # Parse duration to minutes
-                                idle_min = parse_duration_to_minutes(engine_idle)
-                                if idle_min <= 0 and duration:
-                                    idle_min = parse_duration_to_minutes(duration)
-
-                                # Extract location/address from table cells
-                                location_address = None
-                                if len(cells) > 4:
-                                    # Look for location in subsequent columns (skip status, start, end, duration)
-                                    for k in range(4, min(len(cells), 10)):  # Check next several columns
-                                        cell_content = cells[k].strip()
-                                        # Skip empty cells, times, and pure numeric cells
-                                        if (cell_content and
-                                            not re.match(r'^\d{1,2}:\d{2}', cell_content) and
-                                            not re.match(r'^\d+(\.\d+)?$', cell_content) and
-                                            not re.match(r'^\d+\.\d+,\s*\d+\.\d+$', cell_content) and  # Skip coordinates
-                                            len(cell_content) > 2):  # Must be reasonably long
-
-                                            # Look for address-like content (contains letters, spaces, commas)
-                                            if re.search(r'[a-zA-Z]{3,}', cell_content):
-                                                location_address = cell_content
-                                                break
-
-                                if idle_min > 0:
-                                    idle_data.append({
-                                        'vehicle': vehicle,
-                                        'idle_start': pd.to_datetime(start_time, errors='coerce'),
-                                        'idle_end': pd.to_datetime(end_time, errors='coerce'),
-                                        'idle_duration_min': idle_min,
-                                        'location_address': location_address
-                                    })
-
-        st.write(f"✅ Total idle records found: {len(idle_data)}")
-        return pd.DataFrame(idle_data)
+        df = records.to_frame(vehicle)
+        st.write(f"✅ Total idle records found: {len(df)}")
+        return df
 
     except Exception as e:
         st.error(f"❌ Error parsing HTML: {e}")
         return pd.DataFrame()
 
-def parse_duration_to_minutes(duration_str):
-    if not duration_str or duration_str.lower() in ['n/a', 'none', '']:
-        return 0
-    duration_str = duration_str.strip()
-    time_match = re.match(r'(\d+):(\d+)(?::(\d+))?', duration_str)
-    if time_match:
-        hours = int(time_match.group(1) or 0)
-        minutes = int(time_match.group(2) or 0)
-        seconds = int(time_match.group(3) or 0)
-        return hours * 60 + minutes + seconds / 60
-    hms_match = re.match(r'(?:(\d+)\s*h\s*)?(?:(\d+)\s*m\s*)?(?:(\d+)\s*s)?', duration_str, re.IGNORECASE)
-    if hms_match:
-        hours = int(hms_match.group(1) or 0)
-        minutes = int(hms_match.group(2) or 0)
-        seconds = int(hms_match.group(3) or 0)
-        return hours * 60 + minutes + seconds / 60
-    match = re.match(r'(?:(\d+)\s*h\s*)?(?:(\d+)\s*min\s*)?(?:(\d+)\s*s)?', duration_str, re.IGNORECASE)
-    if match:
-        hours = int(match.group(1) or 0)
-        minutes = int(match.group(2) or 0)
-        seconds = int(match.group(3) or 0)
-        return hours * 60 + minutes + seconds / 60
-    decimal_match = re.match(r'(\d+(?:\.\d+)?)\s*min', duration_str, re.IGNORECASE)
-    if decimal_match:
-        return float(decimal_match.group(1))
-    seconds_match = re.match(r'(\d+)\s*s', duration_str, re.IGNORECASE)
-    if seconds_match:
-        return int(seconds_match.group(1)) / 60
-    try:
-        return float(duration_str)
-    except ValueError:
-        pass
-    return 0
-
 def clean_data(df):
     df = df.dropna(how='all')
     for col in df.columns:
@@ -856,26 +533,104 @@ def clean_data(df):
                 pass
     return df
 
-def find_idle_times(df, vehicle_col, time_col, speed_col, idle_threshold=5):
-    idle_report = []
-    for vehicle_id, group in df.groupby(vehicle_col):
-        group = group.sort_values(time_col).copy()
-        group['speed_val'] = pd.to_numeric(group[speed_col], errors='coerce').fillna(0)
-        group['is_idle'] = (group['speed_val'] <= 2) | group['speed_val'].isna()
-        group['idle_start'] = group[time_col].where(group['is_idle'] & ~group['is_idle'].shift(1, fill_value=False), pd.NaT)
-        group['idle_end'] = group[time_col].where(group['is_idle'] & ~group['is_idle'].shift(-1, fill_value=False), pd.NaT)
-        group['idle_start'] = group['idle_start'].fillna(method='ffill')
-        idle_periods = group.dropna(subset=['idle_end'])
-        for _, row in idle_periods.iterrows():
-            idle_duration = (row['idle_end'] - row['idle_start']).total_seconds() / 60
-            if idle_duration > idle_threshold:
-                idle_report.append({
-                    'vehicle': vehicle_id,
-                    'idle_start': row['idle_start'],
-                    'idle_end': row['idle_end'],
-                    'idle_duration_min': round(idle_duration, 2)
-                })
-    return pd.DataFrame(idle_report)
+def find_idle_times(df, vehicle_col, time_col, speed_col, idle_threshold=IDLE_MIN_DURATION,
+                    speed_threshold=IDLE_SPEED_THRESHOLD):
+    return find_idle_runs(df, vehicle_col, time_col, speed_col,
+                          speed_threshold=speed_threshold, min_duration=idle_threshold)
+
+def _find_object_vehicle(sheet):
+    """Vehicle named on a VTS 'Object: ...' title row, if any"""
+    for cell in sheet.iloc[:HEADER_SCAN_ROWS, 0]:
+        if isinstance(cell, str) and cell.startswith("Object:"):
+            return cell.replace("Object:", "").strip()
+    return None
+
+def parse_vts_idle(df, vehicle=None):
+    """Generic VTS export: a Start/End/Duration table, vehicle from an 'Object' column or title row"""
+    df.columns = df.columns.astype(str).str.strip().str.lower()
+    df = df.rename(columns={
+        'object': 'numberplate',
+        'start': 'idle_start',
+        'start time': 'idle_start',
+        'end': 'idle_end',
+        'end time': 'idle_end',
+        'duration': 'idle_duration_min',
+        'stop duration': 'idle_duration_min',
+        'stop position': 'location_address',
+        'location': 'location_address',
+        'address': 'location_address'
+    })
+    if not {'idle_start', 'idle_end', 'idle_duration_min'}.issubset(df.columns):
+        st.warning("⚠️ No Start/End/Duration columns found in VTS file. Available columns: " + ", ".join(df.columns.tolist()))
+        return pd.DataFrame()
+    if 'numberplate' not in df.columns:
+        df['numberplate'] = vehicle or 'Unknown Vehicle'
+    df['idle_duration_min'] = parse_durations(df['idle_duration_min'], default=None)
+    for col in ['idle_start', 'idle_end']:
+        df[col] = pd.to_datetime(df[col], dayfirst=True, errors='coerce')
+    if 'location_address' not in df.columns:
+        df['location_address'] = None
+    df['latitude'] = None
+    df['longitude'] = None
+    df['contact_id'] = resolve_contractor_ids(df['numberplate'])
+    return df[['numberplate', 'idle_start', 'idle_end', 'idle_duration_min', 'location_address', 'latitude', 'longitude', 'contact_id']].dropna(subset=['numberplate', 'idle_start', 'idle_end', 'idle_duration_min'])
+
+# ------------------- FORMAT REGISTRY -------------------
+# Each GPS export layout registers a cheap signature check and a parser. Uploads
+# are routed to the first matching format, so a new vendor is one more entry here.
+_WIZPRO_HTML_INDICATORS = ['wizpro', 'stopped', 'stop position', 'idle time', 'status']
+_PASCHAL_HTML_INDICATORS = ['engine idle report', 'engine idle', 'idle report', 'coordinate', 'start time', 'end time', 'stop duration']
+_WIZPRO_HEADERS = ["Status", "Stop position"]
+_PASCHAL_HEADERS = ["Stop Duration", "Address"]
+_VTS_HEADERS = ["Start", "End", "Duration", "Start Time", "End Time", "Stop Duration"]
+_SHEET_CONTAINERS = ['xls', 'xlsx', 'unknown']
+
+def _header_scores(upload):
+    cells = upload.header_cells
+    return sum(col in cells for col in _WIZPRO_HEADERS), sum(col in cells for col in _PASCHAL_HEADERS)
+
+def _is_wizpro_sheet(upload):
+    wizpro_score, paschal_score = _header_scores(upload)
+    return wizpro_score > 0 and wizpro_score >= paschal_score
+
+def _is_paschal_sheet(upload):
+    wizpro_score, paschal_score = _header_scores(upload)
+    return paschal_score > wizpro_score
+
+@register_format('wizpro_html', 'Wizpro HTML', ['html'],
+                 lambda upload: any(indicator in upload.head_text for indicator in _WIZPRO_HTML_INDICATORS))
+def _parse_wizpro_html_upload(upload):
+    return parse_html_idle_report(upload.text, 'wizpro')
+
+@register_format('paschal_html', 'Paschal HTML', ['html'],
+                 lambda upload: any(indicator in upload.head_text for indicator in _PASCHAL_HTML_INDICATORS))
+def _parse_paschal_html_upload(upload):
+    return parse_html_idle_report(upload.text, 'paschal')
+
+@register_format('generic_html', 'generic HTML', ['html'])
+def _parse_generic_html_upload(upload):
+    return parse_html_idle_report(upload.text, 'generic')
+
+@register_format('wizpro_xls', 'Wizpro', _SHEET_CONTAINERS, _is_wizpro_sheet)
+def _parse_wizpro_upload(upload):
+    header_row = find_header_row(upload.sheet, _WIZPRO_HEADERS)
+    return parse_wizpro_idle(frame_from_header(upload.sheet, header_row))
+
+@register_format('paschal_idle', 'Paschal idle report', _SHEET_CONTAINERS,
+                 lambda upload: _is_paschal_sheet(upload) and 'coordinate' in upload.head_text)
+def _parse_paschal_idle_upload(upload):
+    return parse_paschal_idle(upload.sheet.copy())
+
+@register_format('paschal_parking', 'Paschal parking', _SHEET_CONTAINERS,
+                 lambda upload: _is_paschal_sheet(upload) or 'parking details' in upload.head_text)
+def _parse_paschal_parking_upload(upload):
+    return parse_paschal_parking_excel(upload.sheet.copy())
+
+@register_format('vts', 'generic VTS', _SHEET_CONTAINERS,
+                 lambda upload: any(col in upload.header_cells for col in _VTS_HEADERS))
+def _parse_vts_upload(upload):
+    header_row = find_header_row(upload.sheet, _VTS_HEADERS)
+    return parse_vts_idle(frame_from_header(upload.sheet, header_row), _find_object_vehicle(upload.sheet))
 
 def idle_time_analyzer_page():
     st.header("🛑 Idle / Parking Analyzer")
@@ -887,140 +642,49 @@ def idle_time_analyzer_page():
     uploaded_file = st.file_uploader("Upload GPS Excel file", type=["xls", "xlsx"])
     if uploaded_file:
         try:
+            # The upload is read once; detection and parsing share the same bytes
             try:
-                df = pd.read_excel(uploaded_file, engine='xlrd')
-                st.info("Excel file (.xls) loaded successfully with xlrd engine.")
-            except Exception as excel_error:
-                try:
-                    df = pd.read_excel(uploaded_file, engine='openpyxl')
-                    st.info("Excel file (.xlsx) loaded successfully with openpyxl engine.")
-                except Exception as excel_error2:
-                    try:
-                        uploaded_file.seek(0)
-                        content = uploaded_file.read(100).decode('utf-8', errors='ignore')
-                        if '<html' in content.lower() or '<meta' in content.lower():
-                            st.info("📄 Detected HTML file (GPS systems sometimes export HTML with .xls extension)")
-                            uploaded_file.seek(0)
-                            html_content = uploaded_file.read().decode('utf-8', errors='ignore')
-                            df = parse_html_idle_report(html_content)
-                            if not df.empty:
-                                st.success(f"Successfully parsed HTML file! Found {len(df)} idle records.")
-                                file_type = "wizpro"
-                                records = []
-                                for _, row in df.iterrows():
-                                    records.append({
-                                        "idle_start": row.get("idle_start"),
-                                        "idle_end": row.get("idle_end"),
-                                        "idle_duration_min": row.get("idle_duration_min"),
-                                        "location_address": row.get("location_address"),
-                                        "vehicle": row.get("vehicle", "Unknown Vehicle"),
-                                        "contractor_id": contractor_id
-                                    })
-                                if not records:
-                                    st.warning("⚠️ No idle records found in HTML file.")
-                                    return
-                                result_df = pd.DataFrame(records)
-                                st.subheader("📋 Extracted Idle Records from HTML")
-                                st.dataframe(result_df)
-                                if st.button("💾 Save to Database"):
-                                    try:
-                                        save_df = result_df.copy()
-                                        save_df = save_df.rename(columns={
-                                            'idle_start': 'idle_start',
-                                            'idle_end': 'idle_end',
-                                            'idle_duration_min': 'idle_duration_min',
-                                            'location_address': 'location_address',
-                                            'vehicle': 'vehicle',
-                                            'contractor_id': 'contractor_id'
-                                        })
-                                        save_df = save_df.dropna(subset=['contractor_id'])
-                                        if not save_df.empty:
-                                            save_idle_report(save_df, st.session_state.get('user_name', 'Unknown'))
-                                            st.success(f"✅ Records saved to database! ({len(save_df)} records)")
-                                        else:
-                                            st.error("❌ No records with valid contractor IDs to save.")
-                                    except Exception as save_error:
-                                        st.error(f"❌ Error saving to database: {save_error}")
-                                return
-                            else:
-                                st.error("❌ Could not parse HTML content. No idle data found.")
-                                return
-                        else:
-                            st.error(f"Failed to read Excel file: {excel_error}")
-                            st.info("Please ensure the file is a valid Excel format (.xls or .xlsx)")
-                            return
-                    except Exception as html_error:
-                        st.error(f"Failed to read file: {excel_error}")
-                        st.info("Please ensure the file is a valid Excel or HTML format")
-                        return
-            st.write(f"File loaded with {len(df)} rows and {len(df.columns)} columns")
-            wizpro_cols = ["Status", "Stop position"]
-            paschal_cols = ["Stop Duration", "Address"]
-            wizpro_score = sum(1 for col in wizpro_cols if col in df.columns)
-            paschal_score = sum(1 for col in paschal_cols if col in df.columns)
-            if wizpro_score >= paschal_score and wizpro_score > 0:
-                file_type = "wizpro"
-                st.info("📊 Detected Wizpro format (Status + Stop position columns)")
-            elif paschal_score > wizpro_score:
-                file_type = "paschal"
-                st.info("📊 Detected Paschal format (Stop Duration + Address columns)")
+                upload = read_upload(uploaded_file)
+                idle_format = detect_format(upload)
+            except Exception as read_error:
+                st.error(f"Failed to read file: {read_error}")
+                st.info("Please ensure the file is a valid Excel or HTML format")
+                return
+            if upload.is_html:
+                st.info("📄 Detected HTML file (GPS systems sometimes export HTML with .xls extension)")
             else:
+                st.write(f"File loaded with {len(upload.sheet)} rows and {len(upload.sheet.columns)} columns")
+            if idle_format is None:
                 st.error("❌ Unknown file format. Expected columns not found.")
                 st.error("For Wizpro: 'Status' and 'Stop position' columns")
                 st.error("For Paschal: 'Stop Duration' and 'Address' columns")
-                st.write("Available columns:", df.columns.tolist())
                 return
-            records = []
-            if file_type == "wizpro":
-                st.info("🔄 Processing Wizpro idle data...")
-                wizpro_df = parse_wizpro_idle(df)
-                if not wizpro_df.empty:
-                    for _, row in wizpro_df.iterrows():
-                        records.append({
-                            "idle_start": row.get("idle_start"),
-                            "idle_end": row.get("idle_end"),
-                            "idle_duration_min": row.get("idle_duration_min"),
-                            "location_address": row.get("location_address"),
-                            "vehicle": row.get("numberplate", "Unknown Vehicle"),
-                            "contractor_id": contractor_id
-                        })
-            elif file_type == "paschal":
-                st.info("🔄 Processing Paschal parking data...")
-                paschal_df = parse_paschal_idle(df)
-                if not paschal_df.empty:
-                    for _, row in paschal_df.iterrows():
-                        records.append({
-                            "idle_start": row.get("idle_start"),
-                            "idle_end": row.get("idle_end"),
-                            "idle_duration_min": row.get("idle_duration_min"),
-                            "location_address": row.get("location_address"),
-                            "vehicle": row.get("numberplate", "Unknown Vehicle"),
-                            "contractor_id": contractor_id
-                        })
-            if not records:
+            st.info(f"📊 Detected {idle_format.label} format")
+            st.info(f"🔄 Processing {idle_format.label} idle data...")
+            df = idle_format.parse(upload)
+            if df.empty:
                 st.warning("⚠️ No idle/parking records found in this file.")
                 st.write("This might be because:")
                 st.write("- Wizpro files need 'Status' = 'stopped' records")
                 st.write("- Paschal files need valid Start/End times")
                 return
-            result_df = pd.DataFrame(records)
+            vehicle_col = 'numberplate' if 'numberplate' in df.columns else 'vehicle'
+            result_df = pd.DataFrame({
+                "idle_start": df["idle_start"],
+                "idle_end": df["idle_end"],
+                "idle_duration_min": df["idle_duration_min"],
+                "location_address": df.get("location_address"),
+                "vehicle": df[vehicle_col] if vehicle_col in df.columns else "Unknown Vehicle",
+                "contractor_id": contractor_id
+            }).reset_index(drop=True)
             st.subheader("📋 Extracted Idle/Parking Records")
             st.dataframe(result_df)
             if st.button("💾 Save to Database"):
                 try:
-                    save_df = result_df.copy()
-                    save_df = save_df.rename(columns={
-                        'idle_start': 'idle_start',
-                        'idle_end': 'idle_end',
-                        'idle_duration_min': 'idle_duration_min',
-                        'location_address': 'location_address',
-                        'vehicle': 'vehicle',
-                        'contractor_id': 'contractor_id'
-                    })
-                    save_df = save_df.dropna(subset=['contractor_id'])
+                    save_df = result_df.dropna(subset=['contractor_id'])
                     if not save_df.empty:
-                        save_idle_report(save_df, st.session_state.get('user_name', 'Unknown'))
-                        st.success(f"✅ Records saved to database! ({len(save_df)} records)")
+                        saved = save_idle_report(save_df, st.session_state.get('user_name', 'Unknown'))
+                        st.success(f"✅ Records saved to database! ({saved['inserted']} new, {saved['skipped']} already uploaded)")
                     else:
                         st.error("❌ No records with valid contractor IDs to save.")
                 except Exception as e:
@@ -1034,56 +698,54 @@ def view_idle_reports_page():
     user_role = st.session_state.get("role", "unknown")
     contractor_id = st.session_state.get("contractor_id")
     if user_role == "re_admin":
-        all_df = get_idle_reports(limit=10000)
-        available_contractors = all_df['contractor_id'].dropna().unique()
-        contractor_options = ["All"] + sorted([str(c) for c in available_contractors])
+        contractor_options = ["All"] + [str(c) for c in get_idle_report_contractor_ids()]
         selected_contractor = st.selectbox("Select Contractor", options=contractor_options, key="contractor_select")
-        if selected_contractor == "All":
-            df = all_df
-        else:
-            df = all_df[all_df['contractor_id'].astype(str) == selected_contractor]
-    else:
-        df = get_idle_reports(limit=10000)
-        if contractor_id:
-            df = df[df['contractor_id'] == contractor_id]
+        contractor_id = None if selected_contractor == "All" else int(selected_contractor)
     st.subheader("Filter Idle Reports")
-    plates_in_data = sorted(set(df['vehicle'].apply(extract_license_plate).dropna().unique()))
-    selected_vehicle = st.selectbox("Vehicle", options=["All"] + plates_in_data, key="vehicle_filter")
-    if selected_vehicle != "All":
-        df['extracted_plate'] = df['vehicle'].apply(extract_license_plate)
-        df = df[df['extracted_plate'] == selected_vehicle]
-        df = df.drop('extracted_plate', axis=1)
+    plate_options = get_idle_report_plate_options(contractor_id)
+    selected_vehicle = st.selectbox("Vehicle", options=["All"] + plate_options, key="vehicle_filter")
+    today = pd.Timestamp.now().date()
+    default_start = today - pd.Timedelta(days=29)
+    default_end = today
+    date_range = st.date_input("Idle Start Date Range", [default_start, default_end], key="date_range")
+    if not date_range or len(date_range) != 2:
+        st.warning("Please select a valid date range to filter reports.")
+        return
+
+    # Keyset pages: the stack holds the (idle_start, id) each visited page starts after
+    filters = (contractor_id, selected_vehicle, tuple(date_range))
+    if st.session_state.get("idle_reports_filters") != filters:
+        st.session_state["idle_reports_filters"] = filters
+        st.session_state["idle_reports_cursors"] = [None]
+    cursors = st.session_state["idle_reports_cursors"]
+    df = get_idle_reports_page(
+        contractor_id=contractor_id,
+        start_date=date_range[0],
+        end_date=date_range[1],
+        plate=None if selected_vehicle == "All" else selected_vehicle,
+        before=cursors[-1],
+    )
+    has_next = len(df) == IDLE_REPORTS_PAGE_SIZE
+    if has_next:
+        next_cursor = (df['idle_start'].iloc[-1], df['id'].iloc[-1])
+    prev_col, page_col, next_col = st.columns([1, 2, 1])
+    if prev_col.button("⬅️ Previous", disabled=len(cursors) == 1, key="idle_reports_prev"):
+        cursors.pop()
+        st.rerun()
+    page_col.caption(f"Page {len(cursors)} · {len(df)} report(s)")
+    if next_col.button("Next ➡️", disabled=not has_next, key="idle_reports_next"):
+        cursors.append(next_cursor)
+        st.rerun()
+
     df['idle_start'] = pd.to_datetime(df['idle_start'], errors='coerce')
     df['uploaded_at'] = pd.to_datetime(df['uploaded_at'], errors='coerce')
-    df = df.dropna(subset=['idle_start'])
     if df.empty:
-        st.warning("No valid idle start dates available to filter.")
-    else:
-        date_min = df['idle_start'].min()
-        date_max = df['idle_start'].max()
-        today = pd.Timestamp.now().date()
-        default_start = today - pd.Timedelta(days=29)
-        default_end = today
-        date_range = st.date_input("Idle Start Date Range", [default_start, default_end], key="date_range")
-        if date_range and len(date_range) == 2:
-            start_dt = pd.to_datetime(date_range[0])
-            end_dt = pd.to_datetime(date_range[1]) + pd.Timedelta(days=1)
-            df = df[(df['idle_start'] >= start_dt) & (df['idle_start'] < end_dt)]
-        else:
-            st.warning("Please select a valid date range to filter reports.")
-        # Filter for recent reports (last 30 days by default)
-        recent_cutoff = pd.Timestamp.now() - pd.Timedelta(days=30)
-        df = df[df['idle_start'] >= recent_cutoff]
+        st.warning("No idle reports match the selected filters.")
     if not df.empty:
         delete_ids = st.multiselect("Select rows to delete (by ID)", df['id'], key="delete_ids")
         if st.button("Delete Selected"):
             if delete_ids:
-                conn = get_connection()
-                cur = conn.cursor()
-                cur.execute("DELETE FROM idle_reports WHERE id = ANY(%s)", (delete_ids,))
-                conn.commit()
-                cur.close()
-                conn.close()
+                delete_idle_reports_by_id(delete_ids)
                 st.success(f"Deleted {len(delete_ids)} row(s). Please refresh to see changes.")
     if not df.empty:
         csv = df.to_csv(index=False).encode('utf-8')
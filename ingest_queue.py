@@ -0,0 +1,335 @@
+# ingest_queue.py - Buffered, batched writes for high-rate ingest endpoints
+"""
+In-process write-behind queue for the FastAPI apps.
+
+Endpoints ``submit()`` a row and answer 202 right away; background workers
+take rows off a bounded asyncio queue and hand them to a batch writer once
+INGEST_BATCH_ROWS rows are waiting or INGEST_FLUSH_MS has passed since the
+first one, so the database sees one multi-row INSERT per batch instead of a
+transaction per GPS fix. A full queue raises QueueFull, which endpoints turn
+into 429 with Retry-After.
+
+With INGEST_SPOOL_DIR set, rows are first appended to a local SQLite file (WAL,
+no fsync per row) and deleted once their batch commits. Each process has its
+own spool file and holds a lock on it while it runs. On start, a process
+writes what its predecessor left in the file, and takes over files whose
+owner is gone (their lock is free). This happens in the background, after
+startup. A row that still fails when written on its own is retried on the
+next start, and after _ROW_ATTEMPTS failures moves to the spool's dead_letter
+table instead.
+"""
+import asyncio
+import glob
+import json
+import os
+import sqlite3
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no leases, so spools of other processes are not taken over
+    fcntl = None
+
+INGEST_QUEUE_MAX = int(os.getenv("INGEST_QUEUE_MAX", "10000"))
+INGEST_BATCH_ROWS = int(os.getenv("INGEST_BATCH_ROWS", "500"))
+INGEST_FLUSH_MS = int(os.getenv("INGEST_FLUSH_MS", "200"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+# Seconds a client is told to wait when the queue is full
+INGEST_RETRY_AFTER_SECONDS = int(os.getenv("INGEST_RETRY_AFTER_SECONDS", "2"))
+# Directory for durable spool files; unset keeps queued rows in memory only
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR")
+
+# Tries (with doubling pauses, ~2 minutes in all) before a failing batch is
+# written row by row and rows that still fail are dropped (left in the spool)
+_BATCH_ATTEMPTS = 6
+_MAX_RETRY_DELAY_SECONDS = 30
+# Seconds shutdown waits for queued rows to be written
+_DRAIN_TIMEOUT_SECONDS = 10
+# A spooled row that failed on its own this many times (once per run) goes to dead_letter
+_ROW_ATTEMPTS = 3
+
+
+class QueueFull(Exception):
+    """The ingest queue is at capacity; retry after ``retry_after`` seconds"""
+
+    def __init__(self, retry_after=INGEST_RETRY_AFTER_SECONDS):
+        super().__init__(f"Ingest queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class _Spool:
+    """Local SQLite file holding rows until their batch is committed"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, item TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        if "attempts" not in [row[1] for row in self._conn.execute("PRAGMA table_info(spool)")]:
+            self._conn.execute("ALTER TABLE spool ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letter ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, item TEXT NOT NULL, error TEXT, "
+            "failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+        )
+
+    def add(self, item):
+        return self._conn.execute("INSERT INTO spool (item) VALUES (?)", (json.dumps(item, default=str),)).lastrowid
+
+    def last_seq(self):
+        return self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM spool").fetchone()[0]
+
+    def pending(self, after=0, upto=None, limit=INGEST_BATCH_ROWS):
+        rows = self._conn.execute(
+            "SELECT seq, item FROM spool WHERE seq > ? AND seq <= ? ORDER BY seq LIMIT ?",
+            (after, upto if upto is not None else self.last_seq(), limit)
+        ).fetchall()
+        return [(seq, json.loads(item)) for seq, item in rows]
+
+    def remove(self, seqs):
+        self._conn.executemany("DELETE FROM spool WHERE seq = ?", [(seq,) for seq in seqs])
+
+    def failed(self, seq):
+        """Count a failed write of row ``seq``; returns its attempts so far"""
+        self._conn.execute("UPDATE spool SET attempts = attempts + 1 WHERE seq = ?", (seq,))
+        return self._conn.execute("SELECT attempts FROM spool WHERE seq = ?", (seq,)).fetchone()[0]
+
+    def take(self, other):
+        """Move the rows left in spool ``other`` into this one, attempts included"""
+        rows = other._conn.execute("SELECT item, attempts FROM spool ORDER BY seq").fetchall()
+        self._conn.executemany("INSERT INTO spool (item, attempts) VALUES (?, ?)", rows)
+        return len(rows)
+
+    def bury(self, items):
+        """Keep (item, error) pairs in dead_letter"""
+        self._conn.executemany(
+            "INSERT INTO dead_letter (item, error) VALUES (?, ?)",
+            [(json.dumps(item, default=str), error) for item, error in items]
+        )
+
+    def dead_letters(self):
+        return [(json.loads(item), error) for item, error in
+                self._conn.execute("SELECT item, error FROM dead_letter ORDER BY seq")]
+
+    def dead_letter_count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+
+    def is_empty(self):
+        return not self.last_seq() and not self.dead_letter_count()
+
+    def close(self):
+        self._conn.close()
+
+
+def _try_lease(path):
+    """Exclusive lock on ``path`` as an open file, or None while another process holds it"""
+    if fcntl is None:
+        return None
+    handle = open(path, "a")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+
+def _remove_spool_files(path):
+    for suffix in ("", "-wal", "-shm", ".lock"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+class IngestQueue:
+    """Bounded queue in front of an async batch writer.
+
+    ``writer`` is a coroutine function taking a list of rows and writing them
+    in one transaction. Call ``start()`` from an app startup handler and
+    ``stop()`` from shutdown.
+    """
+
+    def __init__(self, name, writer, maxsize=INGEST_QUEUE_MAX, batch_rows=INGEST_BATCH_ROWS,
+                 flush_ms=INGEST_FLUSH_MS, workers=INGEST_WORKERS, spool_dir=INGEST_SPOOL_DIR):
+        self.name = name
+        self.writer = writer
+        self.maxsize = maxsize
+        self.batch_rows = batch_rows
+        self.flush_seconds = flush_ms / 1000
+        self.workers = workers
+        self.spool_dir = spool_dir
+        # One spool per process, so workers never replay each other's unwritten rows
+        self.spool_path = os.path.join(spool_dir, f"{name}_spool_{os.getpid()}.db") if spool_dir else None
+        self._queue = None
+        self._spool = None
+        self._lease = None
+        self._tasks = []
+        self.stats = {"submitted": 0, "written": 0, "batches": 0, "rejected": 0, "failed_batches": 0,
+                      "dead_lettered": 0}
+
+    async def start(self):
+        """Start the workers; spooled rows from earlier runs are written in the background"""
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        tasks = []
+        if self.spool_path:
+            self._lease = _try_lease(self.spool_path + ".lock")
+            self._spool = _Spool(self.spool_path)
+            # Rows up to here were left by an earlier process with this pid; later ones are queued too
+            tasks.append(self._replay(self._spool, self._spool.last_seq()))
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks += [asyncio.create_task(task) for task in tasks]
+
+    async def _replay(self, spool, upto):
+        """Write spooled rows up to ``upto``, then take over the spools of processes that are gone"""
+        try:
+            last = 0
+            while True:
+                pending = spool.pending(after=last, upto=upto, limit=self.batch_rows)
+                if not pending:
+                    break
+                await self._flush(pending, spool)
+                last = pending[-1][0]
+            if last:
+                print(f"Replayed spooled {self.name} rows up to #{last}")
+            for path in glob.glob(os.path.join(self.spool_dir, f"{self.name}_spool*.db")):
+                if path != self.spool_path:
+                    await self._adopt(path)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Replaying spooled {self.name} rows failed: {e}")
+
+    async def _adopt(self, path):
+        """Write the rows of another process's spool if its lease is free, then delete it"""
+        lease = _try_lease(path + ".lock")
+        if lease is None:
+            return
+        try:
+            orphan = _Spool(path)
+            try:
+                last = 0
+                while True:
+                    pending = orphan.pending(after=last, limit=self.batch_rows)
+                    if not pending:
+                        break
+                    await self._flush(pending, orphan)
+                    last = pending[-1][0]
+                # Rows that failed again are retried on this process's next start
+                kept = self._spool.take(orphan)
+                dead = orphan.dead_letters()
+                self._spool.bury(dead)
+            finally:
+                orphan.close()
+            _remove_spool_files(path)
+        finally:
+            lease.close()
+        print(f"Took over {os.path.basename(path)}: {kept} {self.name} rows left to retry, "
+              f"{len(dead)} dead letters kept")
+
+    async def stop(self):
+        """Drain what is queued (bounded wait), then stop the workers"""
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), _DRAIN_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                print(f"⚠️ {self._queue.qsize()} {self.name} rows not written at shutdown"
+                      + (" (kept in spool)" if self._spool else ""))
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._spool:
+            empty = self._spool.is_empty()
+            self._spool.close()
+            self._spool = None
+            if empty and self._lease:
+                _remove_spool_files(self.spool_path)
+        if self._lease:
+            self._lease.close()
+            self._lease = None
+
+    def submit(self, item):
+        """Queue one row for writing; raises QueueFull when at capacity"""
+        if self._queue is None:
+            raise RuntimeError(f"{self.name} ingest queue is not started")
+        if self._queue.full():
+            self.stats["rejected"] += 1
+            raise QueueFull()
+        seq = self._spool.add(item) if self._spool else None
+        self._queue.put_nowait((seq, item))
+        self.stats["submitted"] += 1
+
+    def metrics(self):
+        return dict(self.stats, queued=self._queue.qsize() if self._queue else 0, capacity=self.maxsize,
+                    dead_letters=self._spool.dead_letter_count() if self._spool else 0)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_seconds
+            while len(batch) < self.batch_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch, spool=None):
+        """Write one batch, retrying with backoff while the database is unavailable.
+
+        ``spool`` is where the batch's rows are kept (this process's by default).
+        """
+        spool = spool or self._spool
+        rows = [item for _, item in batch]
+        delay = 0.5
+        for attempt in range(1, _BATCH_ATTEMPTS + 1):
+            try:
+                await self.writer(rows)
+                written = batch
+                break
+            except Exception as e:
+                self.stats["failed_batches"] += 1
+                if attempt == _BATCH_ATTEMPTS:
+                    print(f"❌ Writing {len(rows)} {self.name} rows failed {attempt} times, writing them one by one: {e}")
+                    written = await self._write_singly(batch, spool)
+                    break
+                print(f"❌ Writing {len(rows)} {self.name} rows failed, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _MAX_RETRY_DELAY_SECONDS)
+        if spool:
+            spool.remove([seq for seq, _ in written])
+        self.stats["written"] += len(written)
+        self.stats["batches"] += 1
+
+    async def _write_singly(self, batch, spool=None):
+        """Isolate bad rows: write each on its own, return the (seq, row) pairs that went in.
+
+        A failed row stays in the spool for the next start until it has failed
+        _ROW_ATTEMPTS times, then moves to dead_letter. Without a spool it is dropped.
+        """
+        written = []
+        for seq, item in batch:
+            try:
+                await self.writer([item])
+                written.append((seq, item))
+            except Exception as e:
+                if not spool:
+                    print(f"❌ Dropping {self.name} row: {e}")
+                elif spool.failed(seq) >= _ROW_ATTEMPTS:
+                    self._spool.bury([(item, str(e))])
+                    spool.remove([seq])
+                    self.stats["dead_lettered"] += 1
+                    print(f"❌ Moved {self.name} row #{seq} to dead_letter after {_ROW_ATTEMPTS} attempts: {e}")
+                else:
+                    print(f"❌ Writing {self.name} row #{seq} failed, kept in spool for the next start: {e}")
+        return written
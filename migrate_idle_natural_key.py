@@ -0,0 +1,99 @@
+"""
+Idle Report Natural Key Migration
+Gives idle_reports its unique (plate, idle_start, idle_end) key.
+
+This script:
+1. Adds and backfills the plate column on older databases
+2. Reports the periods stored more than once and how many rows would go
+3. With --apply: copies those extra rows into idle_reports_removed_duplicates,
+   deletes them from idle_reports (the first copy of each period stays),
+   creates the unique index and records the migration in schema_version
+
+Usage:
+    python migrate_idle_natural_key.py           # report only, changes nothing but the plate column
+    python migrate_idle_natural_key.py --apply   # back up and remove duplicates, create the index
+"""
+
+import sys
+
+import pandas as pd
+from sqlalchemy import text
+
+from db_utils import (
+    IDLE_NATURAL_KEY_MIGRATION_NAME, IDLE_NATURAL_KEY_MIGRATION_VERSION, ensure_idle_report_plate,
+    get_sqlalchemy_engine, record_schema_version, row_id_column, schema_version_recorded,
+)
+
+BACKUP_TABLE = "idle_reports_removed_duplicates"
+
+
+def _duplicate_condition(row_id):
+    # Every copy of a period but the first one stored
+    return f"""
+        plate IS NOT NULL AND idle_start IS NOT NULL AND idle_end IS NOT NULL
+        AND {row_id} NOT IN (
+            SELECT MIN({row_id}) FROM idle_reports
+            WHERE plate IS NOT NULL AND idle_start IS NOT NULL AND idle_end IS NOT NULL
+            GROUP BY plate, idle_start, idle_end
+        )
+    """
+
+
+def report_duplicates(conn):
+    """Print the periods stored more than once; returns the number of rows that would be removed"""
+    duplicated = pd.read_sql(text("""
+        SELECT plate, idle_start, idle_end, COUNT(*) AS copies
+        FROM idle_reports
+        WHERE plate IS NOT NULL AND idle_start IS NOT NULL AND idle_end IS NOT NULL
+        GROUP BY plate, idle_start, idle_end
+        HAVING COUNT(*) > 1
+        ORDER BY plate, idle_start
+    """), conn)
+    extra = int((duplicated["copies"] - 1).sum()) if not duplicated.empty else 0
+    if extra:
+        print(f"   {len(duplicated)} periods stored more than once; {extra} extra rows would be removed:")
+        print(duplicated.head(20).to_string(index=False))
+        if len(duplicated) > 20:
+            print(f"   ... and {len(duplicated) - 20} more periods")
+    else:
+        print("   no duplicate periods")
+    return extra
+
+
+def migrate_idle_natural_key(apply=False):
+    """Report duplicate idle periods; with ``apply`` back them up, remove them and add the key"""
+    engine = get_sqlalchemy_engine()
+    print(f"Starting idle report natural key migration v{IDLE_NATURAL_KEY_MIGRATION_VERSION} "
+          f"({engine.dialect.name})...")
+
+    print("\n1. Backfilling idle_reports.plate")
+    ensure_idle_report_plate(engine)
+
+    with engine.begin() as conn:
+        if schema_version_recorded(conn, IDLE_NATURAL_KEY_MIGRATION_NAME):
+            print("\n✅ Already applied")
+            return 0
+
+        print("\n2. Duplicate periods")
+        extra = report_duplicates(conn)
+        if not apply:
+            print("\nNothing changed. Re-run with --apply to back up and remove the rows above "
+                  "and create the unique index.")
+            return extra
+
+        print(f"\n3. Moving {extra} rows to {BACKUP_TABLE} and creating the unique index")
+        condition = _duplicate_condition(row_id_column(conn))
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {BACKUP_TABLE} AS SELECT * FROM idle_reports WHERE 1 = 0"))
+        conn.execute(text(f"INSERT INTO {BACKUP_TABLE} SELECT * FROM idle_reports WHERE {condition}"))
+        removed = conn.execute(text(f"DELETE FROM idle_reports WHERE {condition}")).rowcount
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_idle_reports_natural_key ON idle_reports (plate, idle_start, idle_end)"
+        ))
+        record_schema_version(conn, IDLE_NATURAL_KEY_MIGRATION_VERSION, IDLE_NATURAL_KEY_MIGRATION_NAME)
+
+    print(f"\n✅ Removed {removed} duplicate rows (kept in {BACKUP_TABLE}); natural key in place")
+    return removed
+
+
+if __name__ == "__main__":
+    migrate_idle_natural_key(apply="--apply" in sys.argv)
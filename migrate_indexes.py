@@ -0,0 +1,117 @@
+"""
+Index Migration Script
+Creates the composite indexes behind the hot query predicates.
+
+This script:
+1. Creates (IF NOT EXISTS) one index per hot filter on SQLite and PostgreSQL
+2. Records the migration in schema_version (by name, in db_utils' shared sequence)
+3. Prints the query plan of each representative query to confirm the index is used
+"""
+
+from db_utils import (
+    INDEX_MIGRATION_NAME, INDEX_MIGRATION_VERSION, get_sqlalchemy_engine,
+    record_schema_version, schema_version_recorded,
+)
+from sqlalchemy import text
+
+# (index name, table, columns, representative query the index is meant to serve)
+HOT_PATH_INDEXES = [
+    ("idx_idle_reports_contractor_start", "idle_reports", "contractor_id, idle_start",
+     "SELECT id FROM idle_reports WHERE contractor_id = :contractor_id "
+     "AND idle_start >= :range_start AND idle_start < :range_end"),
+    ("idx_patrol_logs_vehicle_timestamp", "patrol_logs", "vehicle_id, timestamp",
+     "SELECT id FROM patrol_logs WHERE vehicle_id = :vehicle_id "
+     "AND timestamp >= :range_start AND timestamp < :range_end"),
+    ("idx_incident_reports_contractor_date", "incident_reports", "contractor_id, incident_date",
+     "SELECT id FROM incident_reports WHERE contractor_id = :contractor_id "
+     "AND incident_date BETWEEN :start_date AND :end_date"),
+    ("idx_breaks_contractor_date", "breaks", "contractor_id, break_date",
+     "SELECT id FROM breaks WHERE contractor_id = :contractor_id "
+     "AND break_date BETWEEN :start_date AND :end_date"),
+    ("idx_pickups_contractor_start", "pickups", "contractor_id, pickup_start",
+     "SELECT id FROM pickups WHERE contractor_id = :contractor_id "
+     "AND pickup_start >= :range_start AND pickup_start < :range_end"),
+    ("idx_incident_images_incident", "incident_images", "incident_id",
+     "SELECT id FROM incident_images WHERE incident_id = :incident_id"),
+]
+
+# Sample values used only to EXPLAIN the representative queries
+_EXPLAIN_PARAMS = {
+    "contractor_id": 1,
+    "vehicle_id": 1,
+    "incident_id": 1,
+    "start_date": "2024-01-01",
+    "end_date": "2024-01-31",
+    "range_start": "2024-01-01",
+    "range_end": "2024-02-01",
+}
+
+
+def _ensure_schema_version_table(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+
+
+def _explain(conn, query, is_sqlite):
+    prefix = "EXPLAIN QUERY PLAN " if is_sqlite else "EXPLAIN "
+    rows = conn.execute(text(prefix + query), _EXPLAIN_PARAMS).fetchall()
+    # SQLite puts the plan text in the last column, PostgreSQL returns one text column
+    return " | ".join(str(row[-1]) for row in rows)
+
+
+def report_index_usage(engine=None):
+    """Print whether each representative hot-path query is planned on its index"""
+    engine = engine or get_sqlalchemy_engine()
+    is_sqlite = engine.dialect.name == "sqlite"
+    with engine.connect() as conn:
+        for index_name, table, columns, query in HOT_PATH_INDEXES:
+            try:
+                plan = _explain(conn, query, is_sqlite)
+            except Exception as e:
+                print(f"   ⚠️ {table}: could not explain query ({e})")
+                continue
+            if index_name in plan:
+                print(f"   ✅ {table} ({columns}) -> {index_name}")
+            else:
+                # PostgreSQL may still prefer a sequential scan on very small tables
+                print(f"   ⚠️ {table} ({columns}) not using {index_name}: {plan}")
+
+
+def migrate_indexes():
+    """Create the hot-path composite indexes and record the migration version"""
+    engine = get_sqlalchemy_engine()
+    print(f"Starting index migration v{INDEX_MIGRATION_VERSION} ({engine.dialect.name})...")
+
+    try:
+        with engine.begin() as conn:
+            _ensure_schema_version_table(conn)
+            for step, (index_name, table, columns, _) in enumerate(HOT_PATH_INDEXES, start=1):
+                print(f"\n{step}. {index_name} ON {table} ({columns})")
+                try:
+                    with conn.begin_nested():
+                        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({columns})"))
+                    print("   ✅ index present")
+                except Exception as e:
+                    # e.g. the table doesn't exist in this deployment
+                    print(f"   ⚠️ skipped: {e}")
+
+            if not schema_version_recorded(conn, INDEX_MIGRATION_NAME):
+                record_schema_version(conn, INDEX_MIGRATION_VERSION, INDEX_MIGRATION_NAME)
+
+        print("\nExpected index usage:")
+        report_index_usage(engine)
+        print("\n✅ Index migration completed successfully!")
+
+    except Exception as e:
+        print(f"\n❌ Index migration failed: {e}")
+        import traceback
+        traceback.print_exc()
+        raise
+
+if __name__ == "__main__":
+    migrate_indexes()
@@ -1,19 +1,27 @@
 import 'dart:convert';
+import 'dart:math';
 import 'package:shared_preferences/shared_preferences.dart';
 import 'package:http/http.dart' as http;
 
 // Minimal offline queue: stores JSON events in SharedPreferences under 'vts_queue'
 class OfflineQueue {
   final String apiBase;
+  final String? token;
   final String queueKey = 'vts_queue';
+  final _random = Random();
 
-  OfflineQueue(this.apiBase);
+  OfflineQueue(this.apiBase, {this.token});
 
   Future<void> enqueueEvent(Map<String, dynamic> event) async {
     final prefs = await SharedPreferences.getInstance();
     final raw = prefs.getString(queueKey);
     List<dynamic> items = raw != null ? jsonDecode(raw) : [];
-    items.add(event);
+    // id is assigned once here and resent on every retry so the server can dedup
+    items.add({
+      ...event,
+      'event_id': event['event_id'] ??
+          '${DateTime.now().microsecondsSinceEpoch}_${_random.nextInt(1 << 32).toRadixString(36)}',
+    });
     await prefs.setString(queueKey, jsonEncode(items));
   }
 
@@ -31,23 +39,30 @@ class OfflineQueue {
   Future<void> flushQueue() async {
     final items = await _getQueue();
     if (items.isEmpty) return;
-    final remaining = <dynamic>[];
-    for (final it in items) {
-      try {
-        final resp = await http.post(
-          Uri.parse('$apiBase/api/events'),
-          headers: {'Content-Type': 'application/json'},
-          body: jsonEncode(it),
-        );
-        if (resp.statusCode != 200 && resp.statusCode != 201) {
-          // keep item for retry
-          remaining.add(it);
-        }
-      } catch (e) {
-        // network error -> keep item
-        remaining.add(it);
+    try {
+      final resp = await http.post(
+        Uri.parse('$apiBase/api/events/batch'),
+        headers: {
+          'Content-Type': 'application/json',
+          if (token != null) 'Authorization': 'Bearer $token',
+        },
+        body: jsonEncode({'events': items}),
+      );
+      if (resp.statusCode != 200 && resp.statusCode != 201) {
+        // keep queue for retry
+        return;
       }
+      // accepted and duplicate events are stored server-side; keep anything else
+      final results = (jsonDecode(resp.body)['results'] as List<dynamic>?) ?? [];
+      final done = results
+          .where((r) => r['status'] == 'accepted' || r['status'] == 'duplicate')
+          .map((r) => r['id'])
+          .toSet();
+      // re-read: events may have been enqueued while the request was in flight
+      final current = await _getQueue();
+      await _setQueue(current.where((it) => !done.contains(it['event_id'])).toList());
+    } catch (e) {
+      // network error -> keep queue for retry
     }
-    await _setQueue(remaining);
   }
 }
@@ -123,7 +123,8 @@ class GpsService {
         }),
       );
 
-      if (response.statusCode != 201) {
+      // 202: queued server-side; 429 means the server is shedding load, the next fix retries
+      if (response.statusCode != 202) {
         print('Failed to send location: ${response.statusCode}');
       }
     } catch (e) {
@@ -242,7 +243,7 @@ class GpsService {
           'vehicle_id': _vehicleId,
           'latitude': _lastPosition!.latitude,
           'longitude': _lastPosition!.longitude,
-          'timestamp': DateTime.now().toIso8601String(),
+          'timestamp': DateTime.now().toUtc().toIso8601String(),
           'activity': 'idle_continued',
           'speed': 0.0,
         }),
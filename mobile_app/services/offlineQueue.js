@@ -80,7 +80,8 @@ export async function syncQueue(apiBase, token) {
         console.warn('upload image failed', err);
       }
     }
-    eventsPayload.push(ev);
+    // queue id doubles as the event id so a replayed batch is deduplicated server-side
+    eventsPayload.push({ ...ev, event_id: q.id });
   }
 
   // post batch
@@ -92,8 +93,11 @@ export async function syncQueue(apiBase, token) {
     });
     const j = await res.json();
     if (res.ok) {
-      // remove all synced items
-      const ids = queue.map(q => q.id);
+      // accepted and duplicate events are both stored on the server; drop them from the queue
+      const done = (j.results || [])
+        .filter(r => r.status === 'accepted' || r.status === 'duplicate')
+        .map(r => r.id);
+      const ids = queue.map(q => q.id).filter(id => done.includes(id));
       await removeFromQueue(ids);
       return { ok: true, synced: ids.length, result: j };
     }
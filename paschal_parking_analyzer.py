@@ -2,6 +2,9 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 from db_utils import save_idle_report, get_idle_reports, get_connection
+from contractor_resolver import resolve_contractor_ids
+from idle_formats import read_upload
+from duration_utils import parse_durations
 import re
 
 def extract_vehicle_from_title(title_text):
@@ -153,7 +156,7 @@ def parse_paschal_parking_excel(df):
 
         # Convert duration to minutes
         if 'idle_duration_min' in data_df.columns:
-            data_df['idle_duration_min'] = data_df['idle_duration_min'].apply(parse_duration_to_minutes)
+            data_df['idle_duration_min'] = parse_durations(data_df['idle_duration_min'])
 
         # Convert times
         for col in ['idle_start', 'idle_end']:
@@ -183,8 +186,7 @@ def parse_paschal_parking_excel(df):
                             pass
 
         # Add contractor ID
-        from idle_time_analyzer_page import get_contractor_id_from_vehicle
-        data_df['contact_id'] = data_df['numberplate'].apply(get_contractor_id_from_vehicle)
+        data_df['contact_id'] = resolve_contractor_ids(data_df['numberplate'])
 
         # Select and clean final columns
         result_df = data_df[['numberplate', 'idle_start', 'idle_end', 'idle_duration_min', 'location_address', 'latitude', 'longitude', 'contact_id']].copy()
@@ -199,45 +201,6 @@ def parse_paschal_parking_excel(df):
         st.error(f"Error processing Paschal parking Excel: {e}")
         return pd.DataFrame()
 
-def parse_duration_to_minutes(duration_str):
-    """Parse duration strings to minutes"""
-    if not duration_str or pd.isna(duration_str):
-        return 0
-
-    duration_str = str(duration_str).strip()
-
-    # Handle HH:MM:SS format
-    time_match = re.match(r'(\d+):(\d+)(?::(\d+))?', duration_str)
-    if time_match:
-        hours = int(time_match.group(1) or 0)
-        minutes = int(time_match.group(2) or 0)
-        seconds = int(time_match.group(3) or 0)
-        return hours * 60 + minutes + seconds / 60
-
-    # Handle "X min Y s" format
-    match = re.match(r'(?:(\d+)\s*h\s*)?(?:(\d+)\s*min\s*)?(?:(\d+)\s*s)?', duration_str, re.IGNORECASE)
-    if match:
-        hours = int(match.group(1) or 0)
-        minutes = int(match.group(2) or 0)
-        seconds = int(match.group(3) or 0)
-        return hours * 60 + minutes + seconds / 60
-
-    # Handle decimal minutes
-    decimal_match = re.match(r'(\d+(?:\.\d+)?)\s*min', duration_str, re.IGNORECASE)
-    if decimal_match:
-        return float(decimal_match.group(1))
-
-    # Handle just seconds
-    seconds_match = re.match(r'(\d+)\s*s', duration_str, re.IGNORECASE)
-    if seconds_match:
-        return int(seconds_match.group(1)) / 60
-
-    # Try to convert directly to float
-    try:
-        return float(duration_str)
-    except:
-        return 0
-
 def paschal_parking_analyzer_page():
     st.header("🅿️ Paschal Parking Analyzer")
     st.info("Upload Paschal parking Excel files with specific format: Title with vehicle in brackets, date range, and table with Start Time, End Time, Stop Duration, and Address columns.")
@@ -250,24 +213,14 @@ def paschal_parking_analyzer_page():
 
     if uploaded_file:
         try:
-            # Read Excel file with better error handling
+            # Read the upload once; the engine is chosen from the file's magic bytes
             try:
-                df = pd.read_excel(uploaded_file, header=None, engine='xlrd')  # Try xlrd for .xls files
-                st.info("Excel file (.xls) loaded successfully with xlrd engine.")
+                df = read_upload(uploaded_file).sheet
+                st.info("Excel file loaded successfully.")
             except Exception as excel_error:
-                try:
-                    df = pd.read_excel(uploaded_file, header=None, engine='openpyxl')  # Try openpyxl for .xlsx files
-                    st.info("Excel file (.xlsx) loaded successfully with openpyxl engine.")
-                except Exception as excel_error2:
-                    st.warning(f"Could not read as Excel: {excel_error}. Trying alternative method...")
-                    try:
-                        # Try reading with different parameters
-                        df = pd.read_excel(uploaded_file, header=None)
-                        st.info("Excel file loaded successfully with default engine.")
-                    except Exception as final_error:
-                        st.error(f"Failed to read Excel file: {final_error}")
-                        st.info("Please ensure the file is a valid Excel format (.xls or .xlsx)")
-                        return
+                st.error(f"Failed to read Excel file: {excel_error}")
+                st.info("Please ensure the file is a valid Excel format (.xls or .xlsx)")
+                return
 
             st.write(f"File shape: {df.shape} rows x {df.columns} columns")
 
@@ -341,8 +294,8 @@ def paschal_parking_analyzer_page():
                         save_df = save_df.dropna(subset=['contractor_id'])
 
                         if not save_df.empty:
-                            save_idle_report(save_df, st.session_state.get('user_name', 'Unknown'))
-                            st.success(f"✅ Parking report saved to database! ({len(save_df)} records)")
+                            saved = save_idle_report(save_df, st.session_state.get('user_name', 'Unknown'))
+                            st.success(f"✅ Parking report saved to database! ({saved['inserted']} new, {saved['skipped']} already uploaded)")
                         else:
                             st.error("❌ No records with valid contractor IDs to save.")
 
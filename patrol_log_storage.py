@@ -0,0 +1,805 @@
+#!/usr/bin/env python3
+"""
+Patrol Log Storage Maintenance
+Keeps patrol_logs bounded: monthly partitions, raw-point retention and rollups.
+
+- PostgreSQL: patrol_logs becomes a table partitioned by month on timestamp
+  (run once with --partition); partitions are created ahead of time and expired
+  months are dropped whole.
+- SQLite: closed months are moved out of patrol_logs into patrol_logs_yYYYYmMM
+  tables, so the live table only holds the current month.
+- Per-vehicle 1-minute and 1-hour rollups (distance, max/avg speed, idle
+  minutes) are refreshed incrementally and outlive the raw points, so
+  long-range history is served from the hourly ones. Refreshes follow
+  ingest order (created_at), so fixes uploaded late still get rolled up, and
+  retention only removes points a refresh has covered. 1-minute rollups are
+  kept for PATROL_LOG_ROLLUP_1M_RETENTION_DAYS.
+
+The API (api.py) runs a maintenance pass every MAINTENANCE_INTERVAL_SECONDS
+from its startup handler. With several API workers or instances, set
+PATROL_LOG_MAINTENANCE_IN_API=0 on all but one, or on all of them and run
+the loop or a cron entry instead, e.g.:
+
+    */5 * * * * cd /path/to/app && python patrol_log_storage.py
+
+Usage:
+    python patrol_log_storage.py              # one maintenance pass
+    python patrol_log_storage.py --loop       # keep running in the background
+    python patrol_log_storage.py --partition  # convert patrol_logs (PostgreSQL)
+"""
+
+import datetime
+import logging
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import inspect, text
+
+from db_utils import day_range, get_sqlalchemy_engine, row_id_column, timestamp_param, utc_now
+from idle_classifier import parse_datetimes
+from idle_detection import IDLE_SPEED_THRESHOLD
+
+# Raw GPS points older than this are dropped once rolled up
+PATROL_LOG_RETENTION_DAYS = int(os.getenv("PATROL_LOG_RETENTION_DAYS", "90"))
+# 1-minute rollups older than this are dropped; hourly ones are kept
+ROLLUP_1M_RETENTION_DAYS = int(os.getenv("PATROL_LOG_ROLLUP_1M_RETENTION_DAYS", str(PATROL_LOG_RETENTION_DAYS)))
+# Monthly partitions kept ready ahead of the current month (PostgreSQL)
+PARTITION_MONTHS_AHEAD = 2
+# Seconds between maintenance passes with --loop
+MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("PATROL_LOG_MAINTENANCE_INTERVAL", "300"))
+# Whether the API process schedules maintenance itself
+MAINTENANCE_IN_API = os.getenv("PATROL_LOG_MAINTENANCE_IN_API", "1") != "0"
+# History ranges longer than this are served from hourly rollups
+RAW_HISTORY_MAX_DAYS = 2
+# Gaps between fixes longer than this (tracker off) don't count as idle time
+MAX_IDLE_GAP_MINUTES = 10
+# Points read before a refresh window so its first distance/idle values are complete
+ROLLUP_LOOKBACK = datetime.timedelta(hours=1)
+# Each refresh rescans points created this long before the last one it saw: a row
+# can commit after newer ones (PostgreSQL stamps created_at at transaction start)
+INGEST_LAG = datetime.timedelta(minutes=10)
+
+EARTH_RADIUS_KM = 6371.0
+
+RAW_POINT_COLUMNS = ["vehicle_id", "timestamp", "latitude", "longitude", "activity", "speed", "status"]
+ROLLUP_COLUMNS = ["vehicle_id", "bucket_start", "points", "distance_km", "max_speed",
+                  "avg_speed", "idle_minutes", "last_latitude", "last_longitude"]
+ROLLUP_1M_TABLE = "patrol_log_rollup_1m"
+ROLLUP_1H_TABLE = "patrol_log_rollup_1h"
+ROLLUP_STATE_TABLE = "patrol_log_rollup_state"
+
+# Activation markers from the GPS page carry placeholder coordinates, not fixes
+_MARKER_ACTIVITIES = ("activated", "deactivated")
+
+_MONTH_TABLE = re.compile(r"patrol_logs_y(\d{4})m(\d{2})")
+
+_ROLLUP_DDL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        vehicle_id INTEGER NOT NULL,
+        bucket_start TIMESTAMP NOT NULL,
+        points INTEGER,
+        distance_km REAL,
+        max_speed REAL,
+        avg_speed REAL,
+        idle_minutes REAL,
+        last_latitude REAL,
+        last_longitude REAL,
+        PRIMARY KEY (vehicle_id, bucket_start)
+    )
+"""
+
+_ROLLUP_STATE_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {ROLLUP_STATE_TABLE} (
+        name TEXT PRIMARY KEY,
+        value TIMESTAMP
+    )
+"""
+
+_PARTITIONED_DDL = """
+    CREATE TABLE patrol_logs (
+        id INTEGER NOT NULL DEFAULT nextval('patrol_logs_id_seq'),
+        vehicle_id INTEGER REFERENCES vehicles(id),
+        timestamp TIMESTAMP,
+        latitude REAL,
+        longitude REAL,
+        activity TEXT,
+        status TEXT DEFAULT 'offline',
+        speed REAL DEFAULT 0.0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) PARTITION BY RANGE (timestamp)
+"""
+
+# ------------------- MONTH HELPERS -------------------
+def month_start(value):
+    """First instant of the month containing ``value``"""
+    return pd.Timestamp(value).to_period("M").to_timestamp().to_pydatetime()
+
+
+def add_months(month, count):
+    return (pd.Timestamp(month) + pd.DateOffset(months=count)).to_pydatetime()
+
+
+def month_table(month):
+    """Name of the partition (PostgreSQL) or archive table (SQLite) holding ``month``"""
+    return f"patrol_logs_y{month.year}m{month.month:02d}"
+
+
+def _table_month(name):
+    match = _MONTH_TABLE.fullmatch(name)
+    return datetime.datetime(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def _naive_datetimes(values):
+    ts = parse_datetimes(pd.Series(values))
+    if getattr(ts.dt, "tz", None) is not None:
+        ts = ts.dt.tz_convert(None)
+    return ts
+
+
+def _is_sqlite(conn):
+    return conn.dialect.name == "sqlite"
+
+
+# ------------------- PARTITIONS / MONTH TABLES -------------------
+def is_partitioned(conn):
+    """True when patrol_logs is a partitioned table (PostgreSQL only)"""
+    if _is_sqlite(conn):
+        return False
+    return conn.execute(text("""
+        SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('patrol_logs')
+    """)).fetchone() is not None
+
+
+def month_tables(conn):
+    """{month: table} for the monthly partitions / archive tables that exist"""
+    if _is_sqlite(conn):
+        names = inspect(conn).get_table_names()
+    else:
+        names = [row[0] for row in conn.execute(text("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass('patrol_logs')
+        """))]
+    tables = {}
+    for name in names:
+        month = _table_month(name)
+        if month:
+            tables[month] = name
+    return tables
+
+
+def ensure_month_partitions(conn, months):
+    """Create the PostgreSQL partitions for ``months`` that don't exist yet.
+
+    Rows already sitting in the default partition for a new month are moved
+    into it, since PostgreSQL refuses to attach a range the default still holds.
+    """
+    existing = month_tables(conn)
+    created = 0
+    for month in sorted({month_start(m) for m in months}):
+        if month in existing:
+            continue
+        table = month_table(month)
+        bounds = {"start": month, "end": add_months(month, 1)}
+        stray = conn.execute(text(
+            "SELECT COUNT(*) FROM patrol_logs_default WHERE timestamp >= :start AND timestamp < :end"
+        ), bounds).scalar()
+        if stray:
+            conn.execute(text(
+                "CREATE TEMP TABLE _patrol_logs_moving ON COMMIT DROP AS "
+                "SELECT * FROM patrol_logs_default WHERE timestamp >= :start AND timestamp < :end"
+            ), bounds)
+            conn.execute(text(
+                "DELETE FROM patrol_logs_default WHERE timestamp >= :start AND timestamp < :end"
+            ), bounds)
+        conn.execute(text(
+            f"CREATE TABLE {table} PARTITION OF patrol_logs "
+            f"FOR VALUES FROM ('{bounds['start']:%Y-%m-%d}') TO ('{bounds['end']:%Y-%m-%d}')"
+        ))
+        if stray:
+            conn.execute(text("INSERT INTO patrol_logs SELECT * FROM _patrol_logs_moving"))
+            conn.execute(text("DROP TABLE _patrol_logs_moving"))
+        created += 1
+    return created
+
+
+def partition_patrol_logs(engine=None):
+    """Convert patrol_logs into a monthly range-partitioned table (PostgreSQL).
+
+    Copies every row into month partitions (plus a default partition for
+    NULL or far-future timestamps), keeps the id sequence and recreates the
+    (vehicle_id, timestamp) index on the parent. Idempotent.
+    """
+    engine = engine or get_sqlalchemy_engine()
+    if engine.dialect.name == "sqlite":
+        print("ℹ️ SQLite keeps closed months in patrol_logs_yYYYYmMM tables; nothing to convert")
+        return False
+
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            print("✅ patrol_logs is already partitioned")
+            return False
+
+        old_columns = {c["name"] for c in inspect(conn).get_columns("patrol_logs")}
+        print("1. Renaming patrol_logs to patrol_logs_unpartitioned...")
+        conn.execute(text("DROP INDEX IF EXISTS idx_patrol_logs_vehicle_timestamp"))
+        conn.execute(text("ALTER TABLE patrol_logs RENAME TO patrol_logs_unpartitioned"))
+
+        print("2. Creating partitioned patrol_logs...")
+        conn.execute(text("CREATE SEQUENCE IF NOT EXISTS patrol_logs_id_seq"))
+        conn.execute(text(_PARTITIONED_DDL))
+        conn.execute(text("CREATE TABLE patrol_logs_default PARTITION OF patrol_logs DEFAULT"))
+        months = [row[0] for row in conn.execute(text(
+            "SELECT DISTINCT date_trunc('month', timestamp) FROM patrol_logs_unpartitioned "
+            "WHERE timestamp IS NOT NULL"
+        ))]
+        now = utc_now()
+        months += [add_months(month_start(now), n) for n in range(PARTITION_MONTHS_AHEAD + 1)]
+        print(f"   created {ensure_month_partitions(conn, months)} monthly partitions")
+
+        print("3. Copying rows...")
+        columns = ", ".join(c for c in ["id", "created_at"] + RAW_POINT_COLUMNS if c in old_columns)
+        copied = conn.execute(text(
+            f"INSERT INTO patrol_logs ({columns}) SELECT {columns} FROM patrol_logs_unpartitioned"
+        )).rowcount
+        print(f"   copied {copied} rows")
+
+        conn.execute(text("ALTER SEQUENCE patrol_logs_id_seq OWNED BY patrol_logs.id"))
+        conn.execute(text(
+            "SELECT setval('patrol_logs_id_seq', COALESCE((SELECT MAX(id) FROM patrol_logs), 0) + 1, false)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_patrol_logs_vehicle_timestamp ON patrol_logs (vehicle_id, timestamp)"
+        ))
+        conn.execute(text("DROP TABLE patrol_logs_unpartitioned"))
+
+    print("✅ patrol_logs partitioned by month")
+    return True
+
+
+def archive_closed_months(engine=None):
+    """SQLite: move points of past months from patrol_logs into their month tables.
+
+    Writers keep inserting into patrol_logs; late points for a past month are
+    picked up by the next pass. Returns the number of rows moved.
+    """
+    engine = engine or get_sqlalchemy_engine()
+    current = month_start(utc_now())
+    moved = 0
+    with engine.begin() as conn:
+        months = [row[0] for row in conn.execute(text(
+            "SELECT DISTINCT substr(timestamp, 1, 7) FROM patrol_logs "
+            "WHERE timestamp IS NOT NULL AND timestamp < :current"
+        ), {"current": f"{current:%Y-%m-%d}"})]
+        for label in months:
+            try:
+                month = month_start(label + "-01")
+            except ValueError:
+                continue
+            table = month_table(month)
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} AS SELECT * FROM patrol_logs WHERE 0"))
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS idx_{table}_vehicle_timestamp ON {table} (vehicle_id, timestamp)"
+            ))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{table}_created_at ON {table} (created_at)"))
+            columns = ", ".join(c["name"] for c in inspect(conn).get_columns(table))
+            bounds = {"start": f"{month:%Y-%m-%d}", "end": f"{add_months(month, 1):%Y-%m-%d}"}
+            conn.execute(text(
+                f"INSERT INTO {table} ({columns}) SELECT {columns} FROM patrol_logs "
+                "WHERE timestamp >= :start AND timestamp < :end"
+            ), bounds)
+            moved += conn.execute(text(
+                "DELETE FROM patrol_logs WHERE timestamp >= :start AND timestamp < :end"
+            ), bounds).rowcount
+    return moved
+
+
+# ------------------- RAW POINTS -------------------
+def patrol_log_tables(conn, start=None, end=None):
+    """Tables holding raw points between ``start`` and ``end``.
+
+    PostgreSQL prunes partitions itself, so that's always just patrol_logs;
+    on SQLite the overlapping month tables are added.
+    """
+    if not _is_sqlite(conn):
+        return ["patrol_logs"]
+    tables = []
+    for month, table in sorted(month_tables(conn).items()):
+        if start is not None and add_months(month, 1) <= start:
+            continue
+        if end is not None and month >= end:
+            continue
+        tables.append(table)
+    return tables + ["patrol_logs"]
+
+
+def read_raw_points(conn, start=None, end=None, vehicle_id=None):
+    """Raw patrol points in [start, end), oldest first, across month tables.
+
+    The SQL filter works on whole days (date strings compare correctly however
+    SQLite stored the timestamp); the exact bounds are applied after parsing.
+    """
+    conditions = []
+    params = {}
+    if vehicle_id is not None:
+        conditions.append("vehicle_id = :vehicle_id")
+        params["vehicle_id"] = vehicle_id
+    if start is not None:
+        conditions.append("timestamp >= :range_start")
+        params["range_start"] = timestamp_param(conn, day_range(start, start)[0])
+    if end is not None:
+        conditions.append("timestamp < :range_end")
+        params["range_end"] = timestamp_param(conn, day_range(end, end)[1])
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    columns = ", ".join(RAW_POINT_COLUMNS)
+    query = " UNION ALL ".join(
+        f"SELECT {columns} FROM {table}{where}" for table in patrol_log_tables(conn, start, end)
+    )
+
+    points = pd.read_sql(text(query), conn, params=params)
+    points["timestamp"] = _naive_datetimes(points["timestamp"])
+    keep = points["timestamp"].notna()
+    if start is not None:
+        keep &= points["timestamp"] >= pd.Timestamp(start)
+    if end is not None:
+        keep &= points["timestamp"] < pd.Timestamp(end)
+    return points[keep].sort_values(["vehicle_id", "timestamp"], kind="stable").reset_index(drop=True)
+
+
+def _day_bounds(conn, start=None, end=None):
+    """SQL conditions for the inclusive days ``start``..``end`` (either may be None).
+
+    Returns (conditions, params, since, until); since/until are the same
+    bounds as datetimes, for month-table selection.
+    """
+    conditions = []
+    params = {}
+    since = until = None
+    if start is not None:
+        range_start = day_range(start, start)[0]
+        since = pd.Timestamp(range_start).to_pydatetime()
+        conditions.append("timestamp >= :range_start")
+        params["range_start"] = timestamp_param(conn, range_start)
+    if end is not None:
+        range_end = day_range(end, end)[1]
+        until = pd.Timestamp(range_end).to_pydatetime()
+        conditions.append("timestamp < :range_end")
+        params["range_end"] = timestamp_param(conn, range_end)
+    return conditions, params, since, until
+
+
+def count_raw_points(conn, start=None, end=None):
+    """Raw points on the inclusive days ``start``..``end`` (all when None), across month tables"""
+    conditions, params, since, until = _day_bounds(conn, start, end)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return sum(
+        conn.execute(text(f"SELECT COUNT(*) FROM {table}{where}"), params).scalar()
+        for table in patrol_log_tables(conn, since, until)
+    )
+
+
+def delete_raw_points(conn, start=None, end=None):
+    """Delete raw points on the inclusive days ``start``..``end`` (all when None)
+    from patrol_logs and the month tables; returns the number of rows deleted"""
+    conditions, params, since, until = _day_bounds(conn, start, end)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return sum(
+        conn.execute(text(f"DELETE FROM {table}{where}"), params).rowcount
+        for table in patrol_log_tables(conn, since, until)
+    )
+
+
+def raw_points_time_range(conn):
+    """(earliest, latest) raw point timestamps across month tables, (None, None) when empty"""
+    earliest = latest = None
+    for table in patrol_log_tables(conn):
+        row = conn.execute(text(f"SELECT MIN(timestamp), MAX(timestamp) FROM {table}")).one()
+        if row[0] is None:
+            continue
+        low, high = _naive_datetimes(list(row))
+        if pd.notna(low) and (earliest is None or low < earliest):
+            earliest = low
+        if pd.notna(high) and (latest is None or high > latest):
+            latest = high
+    return (None if earliest is None else earliest.to_pydatetime(),
+            None if latest is None else latest.to_pydatetime())
+
+
+def read_points_page(conn, vehicle_id, limit, before=None, start=None, end=None, columns=None,
+                     activities=None):
+    """One page of a vehicle's raw points, newest first, for keyset pagination.
+
+    Rows are ordered by (timestamp, id) descending, ``id`` being the rowid on
+    SQLite. ``before`` is the (timestamp, id) of the previous page's last row;
+    ``start``/``end`` are inclusive days; ``activities`` limits the page to
+    those activity values.
+    """
+    row_id = row_id_column(conn)
+    conditions, params, since, until = _day_bounds(conn, start, end)
+    conditions.insert(0, "vehicle_id = :vehicle_id")
+    params.update(vehicle_id=vehicle_id, limit=limit)
+    if activities:
+        names = [f"activity_{i}" for i in range(len(activities))]
+        conditions.append(f"activity IN ({', '.join(':' + name for name in names)})")
+        params.update(zip(names, activities))
+    if before is not None:
+        conditions.append(f"(timestamp, {row_id}) < (:before_ts, :before_id)")
+        params["before_ts"] = timestamp_param(conn, before[0])
+        params["before_id"] = int(before[1])
+    where = " AND ".join(conditions)
+    selected = ", ".join(columns or RAW_POINT_COLUMNS)
+    query = " UNION ALL ".join(
+        f"SELECT {row_id} AS id, {selected} FROM {table} WHERE {where}"
+        for table in patrol_log_tables(conn, since, until)
+    )
+    return pd.read_sql(
+        text(f"SELECT * FROM ({query}) points ORDER BY timestamp DESC, id DESC LIMIT :limit"),
+        conn, params=params
+    )
+
+
+# ------------------- ROLLUPS -------------------
+def _haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def compute_minute_rollups(points):
+    """Per-vehicle 1-minute buckets from raw points (sorted by vehicle, time).
+
+    Consecutive fixes less than MAX_IDLE_GAP_MINUTES apart (tracker on) add
+    their distance to the later fix's bucket, and the time between them counts
+    as idle in the earlier fix's bucket when its speed is at or below
+    IDLE_SPEED_THRESHOLD.
+    """
+    points = points[~points["activity"].isin(_MARKER_ACTIVITIES)]
+    points = points.dropna(subset=["vehicle_id", "timestamp"])
+    if points.empty:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+
+    vehicle = points["vehicle_id"]
+    lat = pd.to_numeric(points["latitude"], errors="coerce")
+    lon = pd.to_numeric(points["longitude"], errors="coerce")
+    speed = pd.to_numeric(points["speed"], errors="coerce").fillna(0)
+
+    gap = (points["timestamp"].shift(-1) - points["timestamp"]).dt.total_seconds() / 60
+    tracked = vehicle.eq(vehicle.shift(-1)) & (gap <= MAX_IDLE_GAP_MINUTES)
+
+    step_km = _haversine_km(lat, lon, lat.shift(-1), lon.shift(-1))
+    distance = pd.Series(step_km, index=points.index).where(tracked).fillna(0).shift(fill_value=0)
+    idle = gap.where(tracked & (speed <= IDLE_SPEED_THRESHOLD)).fillna(0)
+
+    frame = pd.DataFrame({
+        "vehicle_id": vehicle.astype(int),
+        "bucket_start": points["timestamp"].dt.floor("min"),
+        "distance_km": distance,
+        "speed": speed,
+        "idle_minutes": idle,
+        "latitude": lat,
+        "longitude": lon,
+    })
+    rollups = frame.groupby(["vehicle_id", "bucket_start"], sort=True).agg(
+        points=("speed", "size"),
+        distance_km=("distance_km", "sum"),
+        max_speed=("speed", "max"),
+        avg_speed=("speed", "mean"),
+        idle_minutes=("idle_minutes", "sum"),
+        last_latitude=("latitude", "last"),
+        last_longitude=("longitude", "last"),
+    ).reset_index()
+    return rollups[ROLLUP_COLUMNS]
+
+
+def compute_hourly_rollups(minute_rollups):
+    """Fold 1-minute rollups into 1-hour ones (avg_speed weighted by points)"""
+    if minute_rollups.empty:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+    frame = minute_rollups.assign(
+        bucket_start=minute_rollups["bucket_start"].dt.floor("h"),
+        speed_total=minute_rollups["avg_speed"] * minute_rollups["points"],
+    )
+    rollups = frame.groupby(["vehicle_id", "bucket_start"], sort=True).agg(
+        points=("points", "sum"),
+        distance_km=("distance_km", "sum"),
+        max_speed=("max_speed", "max"),
+        speed_total=("speed_total", "sum"),
+        idle_minutes=("idle_minutes", "sum"),
+        last_latitude=("last_latitude", "last"),
+        last_longitude=("last_longitude", "last"),
+    ).reset_index()
+    rollups["avg_speed"] = rollups["speed_total"] / rollups["points"]
+    return rollups[ROLLUP_COLUMNS]
+
+
+def ensure_rollup_tables(conn):
+    for table in (ROLLUP_1M_TABLE, ROLLUP_1H_TABLE):
+        conn.execute(text(_ROLLUP_DDL.format(table=table)))
+    conn.execute(text(_ROLLUP_STATE_DDL))
+    # Refreshes look up new points by ingest time
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_patrol_logs_created_at ON patrol_logs (created_at)"))
+    if _is_sqlite(conn):
+        for table in month_tables(conn).values():
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{table}_created_at ON {table} (created_at)"))
+
+
+def _replace_rollups(conn, table, rollups, since, until=None):
+    """Swap the buckets of ``table`` in [since, until) for ``rollups``"""
+    params = {"since": since}
+    delete_sql = f"DELETE FROM {table} WHERE bucket_start >= :since"
+    if until is not None:
+        delete_sql += " AND bucket_start < :until"
+        params["until"] = until
+    conn.execute(text(delete_sql), params)
+    if rollups.empty:
+        return 0
+    records = rollups.astype(object).where(rollups.notna(), None).to_dict("records")
+    for record in records:
+        record["bucket_start"] = record["bucket_start"].to_pydatetime()
+    columns = ", ".join(ROLLUP_COLUMNS)
+    values = ", ".join(f":{c}" for c in ROLLUP_COLUMNS)
+    conn.execute(text(f"INSERT INTO {table} ({columns}) VALUES ({values})"), records)
+    return len(records)
+
+
+def _created_param(conn, value):
+    """created_at bound in the form the column holds (CURRENT_TIMESTAMP text on SQLite)"""
+    return f"{value:%Y-%m-%d %H:%M:%S}" if _is_sqlite(conn) else value
+
+
+def rolled_up_through(conn):
+    """created_at of the newest point seen by the last refresh, or None before the first"""
+    value = conn.execute(
+        text(f"SELECT value FROM {ROLLUP_STATE_TABLE} WHERE name = 'rolled_up_through'")
+    ).scalar()
+    return None if value is None else pd.Timestamp(value).to_pydatetime()
+
+
+def _set_rolled_up_through(conn, value):
+    conn.execute(text(f"DELETE FROM {ROLLUP_STATE_TABLE} WHERE name = 'rolled_up_through'"))
+    conn.execute(
+        text(f"INSERT INTO {ROLLUP_STATE_TABLE} (name, value) VALUES ('rolled_up_through', :value)"),
+        {"value": value}
+    )
+
+
+def _latest_created(conn):
+    latest = None
+    for table in patrol_log_tables(conn):
+        value = conn.execute(text(f"SELECT MAX(created_at) FROM {table}")).scalar()
+        if value is not None:
+            value = pd.Timestamp(value).to_pydatetime()
+            if latest is None or value > latest:
+                latest = value
+    return latest
+
+
+def _touched_hours(conn, created_since):
+    """Hour buckets whose rollups depend on points created at or after ``created_since``.
+
+    A fix changes the distance of the next one and the idle time of the
+    previous one, up to MAX_IDLE_GAP_MINUTES away.
+    """
+    params = {"since": _created_param(conn, created_since)}
+    stamps = pd.concat([
+        pd.read_sql(text(f"SELECT DISTINCT timestamp FROM {table} WHERE created_at >= :since"),
+                    conn, params=params)["timestamp"]
+        for table in patrol_log_tables(conn)
+    ])
+    stamps = _naive_datetimes(stamps.reset_index(drop=True)).dropna()
+    gap = datetime.timedelta(minutes=MAX_IDLE_GAP_MINUTES)
+    hours = set((stamps - gap).dt.floor("h")) | set((stamps + gap).dt.floor("h"))
+    return sorted(hour.to_pydatetime() for hour in hours)
+
+
+def _hour_ranges(hours):
+    """Merge sorted hour starts into [start, end) ranges of consecutive hours"""
+    ranges = []
+    for hour in hours:
+        if ranges and ranges[-1][1] == hour:
+            ranges[-1][1] = hour + datetime.timedelta(hours=1)
+        else:
+            ranges.append([hour, hour + datetime.timedelta(hours=1)])
+    return ranges
+
+
+def _rebuild_rollups(engine, start, end):
+    """Recompute 1-minute and 1-hour rollups for the hour-aligned [start, end), a month at a time"""
+    minute_count = hour_count = 0
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(add_months(month_start(chunk_start), 1), end)
+        with engine.begin() as conn:
+            points = read_raw_points(conn, chunk_start - ROLLUP_LOOKBACK,
+                                     chunk_end + datetime.timedelta(minutes=MAX_IDLE_GAP_MINUTES))
+            minute = compute_minute_rollups(points)
+            minute = minute[(minute["bucket_start"] >= chunk_start) & (minute["bucket_start"] < chunk_end)]
+            minute_count += _replace_rollups(conn, ROLLUP_1M_TABLE, minute, chunk_start, chunk_end)
+            hour_count += _replace_rollups(conn, ROLLUP_1H_TABLE, compute_hourly_rollups(minute),
+                                           chunk_start, chunk_end)
+        chunk_start = chunk_end
+    return minute_count, hour_count
+
+
+def refresh_rollups(engine=None):
+    """Recompute the rollup hours touched by points ingested since the last refresh.
+
+    New points are found by created_at, not timestamp, so fixes uploaded late
+    (offline queues, bulk uploads) land in their buckets too. The first
+    refresh rebuilds everything from the earliest point. Hours before the
+    retention cutoff are left alone: their raw points are (partly) gone, so a
+    rebuild would shrink them. Returns (minute_buckets, hour_buckets) written.
+    """
+    engine = engine or get_sqlalchemy_engine()
+    with engine.begin() as conn:
+        ensure_rollup_tables(conn)
+        marker = rolled_up_through(conn)
+        latest = _latest_created(conn)
+        if latest is None:
+            return 0, 0
+        if marker is None:
+            earliest, newest = raw_points_time_range(conn)
+            if earliest is None:
+                return 0, 0
+            start = pd.Timestamp(earliest).floor("h").to_pydatetime()
+            end = pd.Timestamp(newest).floor("h").to_pydatetime() + datetime.timedelta(hours=1)
+            ranges = [[start, end]]
+        else:
+            hours = _touched_hours(conn, marker - INGEST_LAG)
+            kept = [hour for hour in hours if hour >= retention_cutoff()]
+            if len(kept) < len(hours):
+                logging.warning(f"Skipped rollups for {len(hours) - len(kept)} hours before the retention "
+                                f"cutoff; their late points are not rolled up")
+            ranges = _hour_ranges(kept)
+
+    minute_count = hour_count = 0
+    for start, end in ranges:
+        minutes, hours = _rebuild_rollups(engine, start, end)
+        minute_count += minutes
+        hour_count += hours
+
+    with engine.begin() as conn:
+        _set_rolled_up_through(conn, latest)
+    return minute_count, hour_count
+
+
+# ------------------- RETENTION -------------------
+def retention_cutoff(now=None):
+    """Raw points before this day are past the retention window"""
+    now = now or utc_now()
+    return pd.Timestamp(now - datetime.timedelta(days=PATROL_LOG_RETENTION_DAYS)).normalize().to_pydatetime()
+
+
+def apply_retention(engine=None):
+    """Drop raw points past the retention window that are already rolled up.
+
+    Only points created before the last refresh (less INGEST_LAG) count as
+    rolled up; late uploads wait for the next refresh. Whole expired months go
+    at once (DROP of the partition / month table) when they hold no such
+    pending points; the rest is trimmed row by row. Returns rows removed
+    (dropped months count as their row count).
+    """
+    engine = engine or get_sqlalchemy_engine()
+    removed = 0
+    with engine.begin() as conn:
+        ensure_rollup_tables(conn)
+        marker = rolled_up_through(conn)
+        if marker is None:
+            return 0
+        cutoff = retention_cutoff()
+        params = {"cutoff": f"{cutoff:%Y-%m-%d}", "rolled_up": _created_param(conn, marker - INGEST_LAG)}
+
+        if _is_sqlite(conn) or is_partitioned(conn):
+            for month, table in sorted(month_tables(conn).items()):
+                if add_months(month, 1) > cutoff:
+                    continue
+                pending = conn.execute(
+                    text(f"SELECT COUNT(*) FROM {table} WHERE created_at >= :rolled_up"), params
+                ).scalar()
+                if pending:
+                    continue
+                removed += conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+                conn.execute(text(f"DROP TABLE {table}"))
+                logging.info(f"Dropped expired month {table}")
+
+        for table in patrol_log_tables(conn, end=cutoff):
+            removed += conn.execute(text(
+                f"DELETE FROM {table} WHERE timestamp < :cutoff "
+                "AND (created_at < :rolled_up OR created_at IS NULL)"
+            ), params).rowcount
+    return removed
+
+
+def prune_minute_rollups(engine=None):
+    """Drop 1-minute rollups older than ROLLUP_1M_RETENTION_DAYS; returns buckets removed"""
+    engine = engine or get_sqlalchemy_engine()
+    cutoff = pd.Timestamp(
+        utc_now() - datetime.timedelta(days=ROLLUP_1M_RETENTION_DAYS)
+    ).normalize().to_pydatetime()
+    with engine.begin() as conn:
+        ensure_rollup_tables(conn)
+        return conn.execute(
+            text(f"DELETE FROM {ROLLUP_1M_TABLE} WHERE bucket_start < :cutoff"), {"cutoff": cutoff}
+        ).rowcount
+
+
+# ------------------- HISTORY -------------------
+def load_patrol_history(vehicle_id, start, end, engine=None):
+    """GPS history for one vehicle: raw points for short, recent ranges, hourly rollups otherwise.
+
+    Returns (resolution, frame) with resolution 'raw' (RAW_POINT_COLUMNS) or
+    '1h' (ROLLUP_COLUMNS). Falls back to raw points when no rollups exist yet.
+    """
+    engine = engine or get_sqlalchemy_engine()
+    use_rollups = (end - start > datetime.timedelta(days=RAW_HISTORY_MAX_DAYS)
+                   or start < retention_cutoff())
+    with engine.begin() as conn:
+        if use_rollups:
+            ensure_rollup_tables(conn)
+            hourly = pd.read_sql(text(f"""
+                SELECT {', '.join(ROLLUP_COLUMNS)}
+                FROM {ROLLUP_1H_TABLE}
+                WHERE vehicle_id = :vehicle_id AND bucket_start >= :start AND bucket_start < :end
+                ORDER BY bucket_start
+            """), conn, params={"vehicle_id": vehicle_id, "start": start, "end": end})
+            if not hourly.empty:
+                hourly["bucket_start"] = _naive_datetimes(hourly["bucket_start"])
+                return "1h", hourly
+        return "raw", read_raw_points(conn, start, end, vehicle_id)
+
+
+# ------------------- MAINTENANCE -------------------
+def run_maintenance(engine=None):
+    """One pass: future partitions, rollups, month archiving (SQLite), retention, 1-minute rollup pruning"""
+    engine = engine or get_sqlalchemy_engine()
+    summary = {"partitions": 0, "minute_buckets": 0, "hour_buckets": 0, "archived": 0, "removed": 0,
+               "minute_buckets_removed": 0}
+
+    if engine.dialect.name != "sqlite":
+        with engine.begin() as conn:
+            if is_partitioned(conn):
+                current = month_start(utc_now())
+                months = [add_months(current, n) for n in range(PARTITION_MONTHS_AHEAD + 1)]
+                summary["partitions"] = ensure_month_partitions(conn, months)
+
+    summary["minute_buckets"], summary["hour_buckets"] = refresh_rollups(engine)
+    if engine.dialect.name == "sqlite":
+        summary["archived"] = archive_closed_months(engine)
+    summary["removed"] = apply_retention(engine)
+    summary["minute_buckets_removed"] = prune_minute_rollups(engine)
+    logging.info(f"Patrol log maintenance: {summary}")
+    return summary
+
+
+def main():
+    """Maintenance loop"""
+    logging.basicConfig(
+        filename='patrol_log_maintenance.log',
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    logging.info("Patrol log maintenance started")
+
+    while True:
+        try:
+            run_maintenance()
+            time.sleep(MAINTENANCE_INTERVAL_SECONDS)
+        except KeyboardInterrupt:
+            logging.info("Patrol log maintenance stopped by user")
+            break
+        except Exception as e:
+            logging.error(f"Maintenance error: {e}")
+            time.sleep(MAINTENANCE_INTERVAL_SECONDS)
+
+if __name__ == "__main__":
+    if "--partition" in sys.argv:
+        partition_patrol_logs()
+    elif "--loop" in sys.argv:
+        main()
+    else:
+        print(run_maintenance())
@@ -0,0 +1,75 @@
+# plate_utils.py - Shared license plate normalization
+import re
+from functools import lru_cache
+
+import pandas as pd
+
+# Vehicle strings that carry no plate at all
+_UNKNOWN_VEHICLES = {'unknown', 'unknown vehicle', ''}
+
+_SEPARATORS = re.compile(r'[\s\t\n\r"\'-]+')
+_WHITESPACE = re.compile(r'\s+')
+# Primary pattern: 3 letters + space + 3-4 digits + optional letter (e.g., "KDK 825Y")
+_SPACED_PLATE = re.compile(r'\b([A-Z]{3}\s+\d{3,4}[A-Z]?)\b')
+# Secondary pattern: 3 letters + 3-4 digits + optional letter, possibly followed by a
+# company name (e.g., "KDG320ZWIZPROENTERPRISESLTD" -> "KDG320Z")
+_COMPACT_PLATE = re.compile(r'\b([A-Z]{3}\d{3,4}[A-Z]?)[A-Z]*\b')
+_COMPACT_SPLIT = re.compile(r'([A-Z]{3})(\d)')
+# Fallback: any license plate-like pattern
+_FALLBACK_PLATE = re.compile(r'\b([A-Z]{2,4}\s*\d{1,4}[A-Z]*)\b')
+_NON_WORD = re.compile(r'[^\w]')
+
+PLATE_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=PLATE_CACHE_SIZE)
+def _extract_plate_cached(vehicle_string):
+    if vehicle_string.lower() in _UNKNOWN_VEHICLES:
+        return None
+
+    # Clean the string: remove extra whitespace, newlines, tabs, quotes and dashes
+    upper = _SEPARATORS.sub(' ', vehicle_string.strip()).upper()
+
+    match = _SPACED_PLATE.search(upper)
+    if match:
+        # Normalize spacing (ensure single space between letters and numbers)
+        return _WHITESPACE.sub(' ', match.group(1))
+
+    match = _COMPACT_PLATE.search(upper)
+    if match:
+        # Add space between letters and numbers for consistency
+        return _COMPACT_SPLIT.sub(r'\1 \2', match.group(1))
+
+    match = _FALLBACK_PLATE.search(upper)
+    if match:
+        return _WHITESPACE.sub(' ', match.group(1)).strip()
+
+    # Last resort: clean and return as-is
+    return _NON_WORD.sub('', upper)
+
+
+def extract_license_plate(vehicle_string):
+    """Extract standardized license plate from vehicle string, normalizing variations"""
+    if not isinstance(vehicle_string, str) or not vehicle_string:
+        return None
+    return _extract_plate_cached(vehicle_string)
+
+
+def normalize_plates(series):
+    """Normalize a column of vehicle strings to license plates.
+
+    The regexes only run once per distinct value; the results are mapped back
+    onto every row, so the cost follows the number of vehicles rather than rows.
+    """
+    series = pd.Series(series)
+    uniques = series.dropna().unique()
+    mapping = {value: extract_license_plate(value) for value in uniques}
+    return series.map(mapping)
+
+
+def unique_plates(series):
+    """Sorted distinct normalized plates in a column of vehicle strings"""
+    uniques = pd.Series(series).dropna().unique()
+    plates = {extract_license_plate(value) for value in uniques}
+    plates.discard(None)
+    return sorted(plates)
@@ -1,9 +1,9 @@
 import streamlit as st
 import pandas as pd
-from db_utils import get_sqlalchemy_engine
+from db_utils import get_sqlalchemy_engine, ensure_vehicle_last_position_once, fix_time_param, utc_now
 from auth_utils import get_active_contractor
 from sqlalchemy import text
-from datetime import datetime, timedelta
+from datetime import timedelta
 import time
 from streamlit_folium import folium_static
 import folium
@@ -14,6 +14,64 @@ try:
 except ImportError:
     AUTOREFRESH_AVAILABLE = False
 
+# Fixes older than this are shown as offline at the default location
+LATEST_FIX_WINDOW = timedelta(hours=24)
+
+
+def load_latest_positions(is_re_office, contractor_id=None, window=LATEST_FIX_WINDOW):
+    """One row per vehicle with its latest fix from vehicle_last_position.
+
+    vehicle_last_position holds a single row per vehicle, written through on
+    every patrol_logs insert, so this is a primary-key lookup per vehicle and
+    doesn't grow with log history. Vehicles without a recent fix still appear
+    (offline, Nairobi default) so they stay visible on the map.
+    """
+    engine = get_sqlalchemy_engine()
+    ensure_vehicle_last_position_once(engine)
+    # Same stored form as the fixes (naive UTC, 'T' text on SQLite) so the comparison holds
+    params = {"since": fix_time_param(engine, utc_now() - window)}
+
+    if is_re_office:
+        # RE Office sees vehicles from Wizpro, Paschal, and Avators contractors
+        vehicles_query = """
+            SELECT
+                v.id,
+                v.plate_number,
+                c.name as contractor_name,
+                COALESCE(latest_gps.latitude, -1.2921) as latitude,
+                COALESCE(latest_gps.longitude, 36.8219) as longitude,
+                latest_gps.timestamp as last_update,
+                COALESCE(latest_gps.activity, 'stationary') as activity,
+                COALESCE(latest_gps.status, 'offline') as status
+            FROM vehicles v
+            JOIN contractors c ON v.contractor = c.name
+            LEFT JOIN vehicle_last_position latest_gps ON latest_gps.vehicle_id = v.id
+                AND latest_gps.timestamp > :since
+            WHERE c.name IN ('Wizpro', 'Paschal', 'Avators')
+            ORDER BY c.name, v.plate_number
+        """
+    else:
+        # Other contractors see only their vehicles
+        vehicles_query = """
+            SELECT
+                v.id,
+                v.plate_number,
+                COALESCE(latest_gps.latitude, -1.2921) as latitude,
+                COALESCE(latest_gps.longitude, 36.8219) as longitude,
+                latest_gps.timestamp as last_update,
+                COALESCE(latest_gps.activity, 'stationary') as activity,
+                COALESCE(latest_gps.status, 'offline') as status
+            FROM vehicles v
+            LEFT JOIN vehicle_last_position latest_gps ON latest_gps.vehicle_id = v.id
+                AND latest_gps.timestamp > :since
+            WHERE v.contractor = (SELECT name FROM contractors WHERE id = :contractor_id)
+            ORDER BY v.plate_number
+        """
+        params["contractor_id"] = contractor_id
+
+    return pd.read_sql(text(vehicles_query), engine, params=params)
+
+
 def realtime_gps_monitoring_page():
     # Auto-refresh every 30 seconds (if available)
     if AUTOREFRESH_AVAILABLE:
@@ -36,149 +94,7 @@ def realtime_gps_monitoring_page():
         st.info(f"🏢 **{user_contractor} Access**: Monitoring your contractor's vehicles in real-time.")
 
     # Get all vehicles with their latest GPS status
-    engine = get_sqlalchemy_engine()
-
-    if is_re_office:
-        # RE Office sees vehicles from Wizpro, Paschal, and Avators contractors
-        # Always show vehicles even without GPS data - they should be visible on map
-        try:
-            vehicles_query = """
-                SELECT
-                    v.id,
-                    v.plate_number,
-                    c.name as contractor_name,
-                    COALESCE(latest_gps.latitude, -1.2921) as latitude,
-                    COALESCE(latest_gps.longitude, 36.8219) as longitude,
-                    latest_gps.timestamp as last_update,
-                    COALESCE(latest_gps.activity, 'stationary') as activity,
-                    COALESCE(latest_gps.status, 'offline') as status
-                FROM vehicles v
-                JOIN contractors c ON v.contractor = c.name
-                LEFT JOIN patrol_logs latest_gps ON latest_gps.vehicle_id = v.id
-                    AND latest_gps.timestamp = (
-                        SELECT MAX(timestamp)
-                        FROM patrol_logs
-                        WHERE vehicle_id = v.id
-                        AND timestamp > datetime('now', '-24 hours')  -- Extended to 24 hours
-                    )
-                WHERE c.name IN ('Wizpro', 'Paschal', 'Avators')
-                ORDER BY c.name, v.plate_number
-            """
-            vehicles_df = pd.read_sql(vehicles_query, engine)
-        except Exception as e:
-            err = str(e).lower()
-            # If patrol_logs table doesn't exist, show vehicles without GPS data
-            if "does not exist" in err or "undefinedtable" in err:
-                vehicles_query = """
-                    SELECT
-                        v.id,
-                        v.plate_number,
-                        c.name as contractor_name,
-                        -1.2921 as latitude,
-                        36.8219 as longitude,
-                        NULL as last_update,
-                        'stationary' as activity,
-                        'offline' as status
-                    FROM vehicles v
-                    JOIN contractors c ON v.contractor = c.name
-                    WHERE c.name IN ('Wizpro', 'Paschal', 'Avators')
-                    ORDER BY c.name, v.plate_number
-                """
-                vehicles_df = pd.read_sql(vehicles_query, engine)
-            elif 'no such column' in err or 'unknown column' in err or 'status' in err or 'activity' in err:
-                # Retry without referencing latest_gps.status which may not exist in older schemas
-                vehicles_query = """
-                    SELECT
-                        v.id,
-                        v.plate_number,
-                        c.name as contractor_name,
-                        COALESCE(latest_gps.latitude, -1.2921) as latitude,
-                        COALESCE(latest_gps.longitude, 36.8219) as longitude,
-                        latest_gps.timestamp as last_update,
-                        COALESCE(latest_gps.activity, 'stationary') as activity,
-                        'offline' as status
-                    FROM vehicles v
-                    JOIN contractors c ON v.contractor = c.name
-                    LEFT JOIN patrol_logs latest_gps ON latest_gps.vehicle_id = v.id
-                        AND latest_gps.timestamp = (
-                            SELECT MAX(timestamp)
-                            FROM patrol_logs
-                            WHERE vehicle_id = v.id
-                            AND timestamp > datetime('now', '-24 hours')
-                        )
-                    WHERE c.name IN ('Wizpro', 'Paschal', 'Avators')
-                    ORDER BY c.name, v.plate_number
-                """
-                vehicles_df = pd.read_sql(vehicles_query, engine)
-            else:
-                raise e
-    else:
-        # Other contractors see only their vehicles
-        # Always show vehicles even without GPS data
-        try:
-            vehicles_query = """
-                SELECT
-                    v.id,
-                    v.plate_number,
-                    COALESCE(latest_gps.latitude, -1.2921) as latitude,
-                    COALESCE(latest_gps.longitude, 36.8219) as longitude,
-                    latest_gps.timestamp as last_update,
-                    COALESCE(latest_gps.activity, 'stationary') as activity,
-                    COALESCE(latest_gps.status, 'offline') as status
-                FROM vehicles v
-                LEFT JOIN patrol_logs latest_gps ON latest_gps.vehicle_id = v.id
-                    AND latest_gps.timestamp = (
-                        SELECT MAX(timestamp)
-                        FROM patrol_logs
-                        WHERE vehicle_id = v.id
-                        AND timestamp > datetime('now', '-24 hours')  -- Extended to 24 hours
-                    )
-                WHERE v.contractor = (SELECT name FROM contractors WHERE id = :contractor_id)
-                ORDER BY v.plate_number
-            """
-            vehicles_df = pd.read_sql(text(vehicles_query), engine, params={"contractor_id": contractor_id})
-        except Exception as e:
-            err = str(e).lower()
-            # If patrol_logs table doesn't exist, show vehicles without GPS data
-            if "does not exist" in err or "undefinedtable" in err:
-                vehicles_query = """
-                    SELECT
-                        v.id,
-                        v.plate_number,
-                        -1.2921 as latitude,
-                        36.8219 as longitude,
-                        NULL as last_update,
-                        'stationary' as activity,
-                        'offline' as status
-                    FROM vehicles v
-                    WHERE v.contractor = (SELECT name FROM contractors WHERE id = :contractor_id)
-                    ORDER BY v.plate_number
-                """
-                vehicles_df = pd.read_sql(text(vehicles_query), engine, params={"contractor_id": contractor_id})
-            elif 'no such column' in err or 'unknown column' in err or 'status' in err or 'activity' in err:
-                vehicles_query = """
-                    SELECT
-                        v.id,
-                        v.plate_number,
-                        COALESCE(latest_gps.latitude, -1.2921) as latitude,
-                        COALESCE(latest_gps.longitude, 36.8219) as longitude,
-                        latest_gps.timestamp as last_update,
-                        COALESCE(latest_gps.activity, 'stationary') as activity,
-                        'offline' as status
-                    FROM vehicles v
-                    LEFT JOIN patrol_logs latest_gps ON latest_gps.vehicle_id = v.id
-                        AND latest_gps.timestamp = (
-                            SELECT MAX(timestamp)
-                            FROM patrol_logs
-                            WHERE vehicle_id = v.id
-                            AND timestamp > datetime('now', '-24 hours')
-                        )
-                    WHERE v.contractor = (SELECT name FROM contractors WHERE id = :contractor_id)
-                    ORDER BY v.plate_number
-                """
-                vehicles_df = pd.read_sql(text(vehicles_query), engine, params={"contractor_id": contractor_id})
-            else:
-                raise e
+    vehicles_df = load_latest_positions(is_re_office, contractor_id)
 
     if vehicles_df.empty:
         st.warning("No vehicles found.")
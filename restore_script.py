@@ -11,6 +11,7 @@ import shutil
 import datetime
 import time
 import logging
+import zipfile
 from pathlib import Path
 
 # Google Drive API imports
@@ -34,8 +35,11 @@ except ImportError:
     print("Email libraries not installed. Install with: pip install secure-smtplib")
     exit(1)
 
+from blob_store import BACKUP_ARCHIVE_PREFIX, restore_local_blobs
+
 # Configuration
 DB_PATH = 'vts_database.db'
+IMAGES_DIR = 'uploaded_accident_images'
 BACKUP_DIR = 'backups'
 RESTORE_DIR = 'restores'
 GOOGLE_DRIVE_FOLDER_ID = None  # Will be set after finding folder
@@ -95,6 +99,30 @@ def find_backup_folder(service):
     GOOGLE_DRIVE_FOLDER_ID = items[0]['id']
     return GOOGLE_DRIVE_FOLDER_ID
 
+def get_latest_images_backup(service):
+    """Get the latest images backup (uploaded images + blob store) from Google Drive, or None"""
+    folder_id = find_backup_folder(service)
+    query = f"'{folder_id}' in parents and name contains 'uploaded_images_backup_' and trashed=false"
+    results = service.files().list(
+        q=query,
+        spaces='drive',
+        orderBy='createdTime desc',
+        pageSize=1
+    ).execute()
+    items = results.get('files', [])
+    return items[0] if items else None
+
+def restore_images(zip_path):
+    """Unpack an images backup: blob store entries back into the blob store, the rest into IMAGES_DIR"""
+    with zipfile.ZipFile(zip_path) as zipf:
+        blobs = restore_local_blobs(zipf)
+        legacy = [name for name in zipf.namelist() if not name.startswith(BACKUP_ARCHIVE_PREFIX) and not name.endswith('/')]
+        os.makedirs(IMAGES_DIR, exist_ok=True)
+        for name in legacy:
+            zipf.extract(name, IMAGES_DIR)
+    logging.info(f"Images restored from {zip_path}: {blobs} blobs, {len(legacy)} uploaded images")
+    return blobs, len(legacy)
+
 def get_latest_database_backup(service):
     """Get the latest database backup from Google Drive"""
     folder_id = find_backup_folder(service)
@@ -244,7 +272,7 @@ def cleanup_old_restores():
     try:
         restore_files = []
         for file in os.listdir(RESTORE_DIR):
-            if file.startswith('vts_database_backup_'):
+            if file.startswith(('vts_database_backup_', 'uploaded_images_backup_')):
                 restore_files.append(os.path.join(RESTORE_DIR, file))
 
         # Sort by modification time (newest first)
@@ -282,6 +310,18 @@ def perform_restore():
         success, pre_backup = restore_database(downloaded_path)
 
         if success:
+            # Images live outside the database (blob store); restore them alongside it
+            images_note = 'No images backup found'
+            try:
+                images_backup = get_latest_images_backup(service)
+                if images_backup:
+                    images_path = download_file(service, images_backup['id'], images_backup['name'])
+                    blobs, legacy = restore_images(images_path)
+                    images_note = f"{images_backup['name']} ({blobs} blobs, {legacy} uploaded images)"
+            except Exception as e:
+                images_note = f'Images restore failed: {e}'
+                logging.error(images_note)
+
             # Send success notification
             subject = "VTS Database Restore Completed Successfully"
             body = f"""VTS Database Restore Completed Successfully
@@ -291,6 +331,7 @@ Restore Details:
 - Backup Date: {latest_backup['createdTime']}
 - Restored At: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 - Pre-restore Backup: {pre_backup if pre_backup else 'None (first restore)'}
+- Images: {images_note}
 
 The database has been successfully restored from the latest Google Drive backup.
 """
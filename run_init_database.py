@@ -1,12 +1,14 @@
 import traceback
 import sys
-from db_utils import init_database, _mask_db_url, DATABASE_URL
+from db_utils import bootstrap_database, _mask_db_url, DATABASE_URL, SCHEMA_VERSION
 
 print('DATABASE_URL (masked):', _mask_db_url(DATABASE_URL))
 
 try:
-    init_database()
-    print('init_database() completed successfully')
+    if bootstrap_database():
+        print(f'Schema version {SCHEMA_VERSION} applied successfully')
+    else:
+        print(f'Schema version {SCHEMA_VERSION} already recorded; nothing to do')
 except Exception:
     traceback.print_exc()
     sys.exit(1)
@@ -42,6 +42,57 @@ CREATE TABLE IF NOT EXISTS patrol_logs (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (vehicle_id) REFERENCES vehicles(id)
 );
+CREATE INDEX IF NOT EXISTS idx_patrol_logs_vehicle_timestamp ON patrol_logs (vehicle_id, timestamp);
+
+-- Latest fix per vehicle, kept current on every patrol_logs insert (realtime map)
+CREATE TABLE IF NOT EXISTS vehicle_last_position (
+    vehicle_id INTEGER PRIMARY KEY,
+    timestamp TIMESTAMP,
+    latitude REAL,
+    longitude REAL,
+    activity TEXT,
+    status TEXT DEFAULT 'offline',
+    speed REAL DEFAULT 0.0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (vehicle_id) REFERENCES vehicles(id)
+);
+
+-- Ingest order for rollup refreshes (patrol_log_storage.py)
+CREATE INDEX IF NOT EXISTS idx_patrol_logs_created_at ON patrol_logs (created_at);
+
+-- Per-vehicle 1-minute patrol_logs rollups, kept for PATROL_LOG_ROLLUP_1M_RETENTION_DAYS (patrol_log_storage.py)
+CREATE TABLE IF NOT EXISTS patrol_log_rollup_1m (
+    vehicle_id INTEGER NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    points INTEGER,
+    distance_km REAL,
+    max_speed REAL,
+    avg_speed REAL,
+    idle_minutes REAL,
+    last_latitude REAL,
+    last_longitude REAL,
+    PRIMARY KEY (vehicle_id, bucket_start)
+);
+
+-- Per-vehicle 1-hour patrol_logs rollups, kept after raw points expire (patrol_log_storage.py)
+CREATE TABLE IF NOT EXISTS patrol_log_rollup_1h (
+    vehicle_id INTEGER NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    points INTEGER,
+    distance_km REAL,
+    max_speed REAL,
+    avg_speed REAL,
+    idle_minutes REAL,
+    last_latitude REAL,
+    last_longitude REAL,
+    PRIMARY KEY (vehicle_id, bucket_start)
+);
+
+-- Rollup progress: patrol_logs.created_at up to which points are rolled up (patrol_log_storage.py)
+CREATE TABLE IF NOT EXISTS patrol_log_rollup_state (
+    name TEXT PRIMARY KEY,
+    value TIMESTAMP
+);
 
 -- Incident reports table
 CREATE TABLE IF NOT EXISTS incident_reports (
@@ -73,21 +124,30 @@ CREATE TABLE IF NOT EXISTS incident_reports (
     contractor_id INTEGER,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+CREATE INDEX IF NOT EXISTS idx_incident_reports_contractor_date ON incident_reports (contractor_id, incident_date);
 
 -- Incident images table
+-- Image bytes live in the blob store, keyed by SHA-256 (blob_key);
+-- image_data only holds rows written before the blob store existed
 CREATE TABLE IF NOT EXISTS incident_images (
     id SERIAL PRIMARY KEY,
     incident_id INTEGER,
     image_data BYTEA,
     image_name TEXT,
+    blob_key TEXT,
+    content_type TEXT,
+    size_bytes INTEGER,
     uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (incident_id) REFERENCES incident_reports(id)
 );
+CREATE INDEX IF NOT EXISTS idx_incident_images_incident ON incident_images (incident_id);
+CREATE INDEX IF NOT EXISTS idx_incident_images_blob_key ON incident_images (blob_key);
 
 -- Idle reports table
 CREATE TABLE IF NOT EXISTS idle_reports (
     id SERIAL PRIMARY KEY,
     vehicle TEXT,
+    plate TEXT,
     idle_start TIMESTAMP,
     idle_end TIMESTAMP,
     idle_duration_min REAL,
@@ -100,6 +160,10 @@ CREATE TABLE IF NOT EXISTS idle_reports (
     uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Natural key: re-uploading an export must not duplicate idle periods
+CREATE UNIQUE INDEX IF NOT EXISTS idx_idle_reports_natural_key ON idle_reports (plate, idle_start, idle_end);
+CREATE INDEX IF NOT EXISTS idx_idle_reports_contractor_start ON idle_reports (contractor_id, idle_start);
+
 -- Breaks table
 CREATE TABLE IF NOT EXISTS breaks (
     id SERIAL PRIMARY KEY,
@@ -111,6 +175,7 @@ CREATE TABLE IF NOT EXISTS breaks (
     contractor_id INTEGER,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+CREATE INDEX IF NOT EXISTS idx_breaks_contractor_date ON breaks (contractor_id, break_date);
 
 -- Pickups table
 CREATE TABLE IF NOT EXISTS pickups (
@@ -123,6 +188,7 @@ CREATE TABLE IF NOT EXISTS pickups (
     contractor_id INTEGER,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+CREATE INDEX IF NOT EXISTS idx_pickups_contractor_start ON pickups (contractor_id, pickup_start);
 
 -- Accidents table (if needed)
 CREATE TABLE IF NOT EXISTS accidents (
@@ -173,6 +239,13 @@ CREATE TABLE IF NOT EXISTS accident_reports_images (
     upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Applied schema versions (db_utils.bootstrap_database, migrate_indexes.py)
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name TEXT,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Insert default contractors (only if table is empty)
 INSERT INTO contractors (name) VALUES ('Wizpro') ON CONFLICT DO NOTHING;
 INSERT INTO contractors (name) VALUES ('Paschal') ON CONFLICT DO NOTHING;
@@ -222,6 +295,57 @@ CREATE TABLE IF NOT EXISTS patrol_logs (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (vehicle_id) REFERENCES vehicles(id)
 );
+CREATE INDEX IF NOT EXISTS idx_patrol_logs_vehicle_timestamp ON patrol_logs (vehicle_id, timestamp);
+
+-- Latest fix per vehicle, kept current on every patrol_logs insert (realtime map)
+CREATE TABLE IF NOT EXISTS vehicle_last_position (
+    vehicle_id INTEGER PRIMARY KEY,
+    timestamp TIMESTAMP,
+    latitude REAL,
+    longitude REAL,
+    activity TEXT,
+    status TEXT DEFAULT 'offline',
+    speed REAL DEFAULT 0.0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (vehicle_id) REFERENCES vehicles(id)
+);
+
+-- Ingest order for rollup refreshes (patrol_log_storage.py)
+CREATE INDEX IF NOT EXISTS idx_patrol_logs_created_at ON patrol_logs (created_at);
+
+-- Per-vehicle 1-minute patrol_logs rollups, kept for PATROL_LOG_ROLLUP_1M_RETENTION_DAYS (patrol_log_storage.py)
+CREATE TABLE IF NOT EXISTS patrol_log_rollup_1m (
+    vehicle_id INTEGER NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    points INTEGER,
+    distance_km REAL,
+    max_speed REAL,
+    avg_speed REAL,
+    idle_minutes REAL,
+    last_latitude REAL,
+    last_longitude REAL,
+    PRIMARY KEY (vehicle_id, bucket_start)
+);
+
+-- Per-vehicle 1-hour patrol_logs rollups, kept after raw points expire (patrol_log_storage.py)
+CREATE TABLE IF NOT EXISTS patrol_log_rollup_1h (
+    vehicle_id INTEGER NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    points INTEGER,
+    distance_km REAL,
+    max_speed REAL,
+    avg_speed REAL,
+    idle_minutes REAL,
+    last_latitude REAL,
+    last_longitude REAL,
+    PRIMARY KEY (vehicle_id, bucket_start)
+);
+
+-- Rollup progress: patrol_logs.created_at up to which points are rolled up (patrol_log_storage.py)
+CREATE TABLE IF NOT EXISTS patrol_log_rollup_state (
+    name TEXT PRIMARY KEY,
+    value TIMESTAMP
+);
 
 -- Incident reports table
 CREATE TABLE IF NOT EXISTS incident_reports (
@@ -253,21 +377,30 @@ CREATE TABLE IF NOT EXISTS incident_reports (
     contractor_id INTEGER,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+CREATE INDEX IF NOT EXISTS idx_incident_reports_contractor_date ON incident_reports (contractor_id, incident_date);
 
 -- Incident images table
+-- Image bytes live in the blob store, keyed by SHA-256 (blob_key);
+-- image_data only holds rows written before the blob store existed
 CREATE TABLE IF NOT EXISTS incident_images (
     id SERIAL PRIMARY KEY,
     incident_id INTEGER,
     image_data BYTEA,
     image_name TEXT,
+    blob_key TEXT,
+    content_type TEXT,
+    size_bytes INTEGER,
     uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (incident_id) REFERENCES incident_reports(id)
 );
+CREATE INDEX IF NOT EXISTS idx_incident_images_incident ON incident_images (incident_id);
+CREATE INDEX IF NOT EXISTS idx_incident_images_blob_key ON incident_images (blob_key);
 
 -- Idle reports table
 CREATE TABLE IF NOT EXISTS idle_reports (
     id SERIAL PRIMARY KEY,
     vehicle TEXT,
+    plate TEXT,
     idle_start TIMESTAMP,
     idle_end TIMESTAMP,
     idle_duration_min REAL,
@@ -280,6 +413,10 @@ CREATE TABLE IF NOT EXISTS idle_reports (
     uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Natural key: re-uploading an export must not duplicate idle periods
+CREATE UNIQUE INDEX IF NOT EXISTS idx_idle_reports_natural_key ON idle_reports (plate, idle_start, idle_end);
+CREATE INDEX IF NOT EXISTS idx_idle_reports_contractor_start ON idle_reports (contractor_id, idle_start);
+
 -- Breaks table
 CREATE TABLE IF NOT EXISTS breaks (
     id SERIAL PRIMARY KEY,
@@ -291,6 +428,7 @@ CREATE TABLE IF NOT EXISTS breaks (
     contractor_id INTEGER,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+CREATE INDEX IF NOT EXISTS idx_breaks_contractor_date ON breaks (contractor_id, break_date);
 
 -- Pickups table
 CREATE TABLE IF NOT EXISTS pickups (
@@ -303,6 +441,7 @@ CREATE TABLE IF NOT EXISTS pickups (
     contractor_id INTEGER,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+CREATE INDEX IF NOT EXISTS idx_pickups_contractor_start ON pickups (contractor_id, pickup_start);
 
 -- Accidents table (if needed)
 CREATE TABLE IF NOT EXISTS accidents (
@@ -353,6 +492,13 @@ CREATE TABLE IF NOT EXISTS accident_reports_images (
     upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Applied schema versions (db_utils.bootstrap_database, migrate_indexes.py)
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name TEXT,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Insert default contractors (only if table is empty)
 INSERT INTO contractors (name) VALUES ('Wizpro') ON CONFLICT DO NOTHING;
 INSERT INTO contractors (name) VALUES ('Paschal') ON CONFLICT DO NOTHING;
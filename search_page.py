@@ -205,7 +205,7 @@ def fill_incident_template(ws, row, index):
 def search_page():
     import streamlit as st
     import pandas as pd
-    from db_utils import get_sqlalchemy_engine
+    from db_utils import get_sqlalchemy_engine, day_range, load_image_data
     from io import BytesIO
     import openpyxl
     from openpyxl.drawing.image import Image as OpenpyxlImage
@@ -277,14 +277,18 @@ def search_page():
                 placeholders = ','.join([f':id_{i}' for i in range(len(report_ids))])
                 image_params = {f'id_{i}': rid for i, rid in enumerate(report_ids)}
 
-                # Query the image table for BLOB data and metadata
-                # Note the change: incident_images table and incident_id column
-                image_query = f"SELECT incident_id, image_name, image_data FROM incident_images WHERE incident_id IN ({placeholders})"
+                # Query the image table for metadata and blob keys; the bytes are read from
+                # the blob store per image while the export is written. Inline image_data
+                # only comes back for rows that predate the blob store.
+                image_query = (
+                    "SELECT incident_id, image_name, blob_key, "
+                    "CASE WHEN blob_key IS NULL THEN image_data END AS image_data "
+                    f"FROM incident_images WHERE incident_id IN ({placeholders})"
+                )
                 print(f"DEBUG: Image query: {image_query}")
                 print(f"DEBUG: Image params: {image_params}")
 
                 try:
-                    # Fetching the BLOB data is slow but necessary for embedding
                     with engine.connect() as conn:
                         image_df = pd.read_sql_query(text(image_query), conn, params=image_params)
                     print(f"DEBUG: Fetched {len(image_df)} images")
@@ -313,8 +317,9 @@ def search_page():
                 st.error(f"Database error fetching breaks data: {e}")
 
         elif selected_option == "Pickups":
-            query = "SELECT * FROM pickups WHERE DATE(pickup_start) BETWEEN :start_date AND :end_date"
-            params = {"start_date": start_date, "end_date": end_date}
+            query = "SELECT * FROM pickups WHERE pickup_start >= :range_start AND pickup_start < :range_end"
+            range_start, range_end = day_range(start_date, end_date)
+            params = {"range_start": range_start, "range_end": range_end}
             if vehicle:
                 query += " AND vehicle = :vehicle"
                 params["vehicle"] = vehicle
@@ -390,6 +395,12 @@ def search_page():
 
                                     for img_counter, (img_index, img_row) in enumerate(linked_images.iterrows()):
                                         img_data_blob = img_row['image_data']
+                                        if pd.notna(img_row['blob_key']):
+                                            try:
+                                                img_data_blob = load_image_data(img_row['blob_key'])
+                                            except Exception as blob_e:
+                                                print(f"Could not read image {img_row['blob_key']} from blob store: {blob_e}")
+                                                continue
                                         img_name = img_row['image_name']
 
                                         # Decode if necessary - handle hex-encoded data
@@ -1,13 +1,9 @@
-from db_utils import get_connection
+from db_utils import db_cursor
 
 def list_users():
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT id, username, name FROM users;")
-    users = cur.fetchall()
-    cur.close()
-    conn.close()
-    return users
+    with db_cursor() as cur:
+        cur.execute("SELECT id, username, name FROM users;")
+        return cur.fetchall()
 
 # List and print users
 users = list_users()
@@ -8,7 +8,9 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
 import bcrypt
-from db_utils import get_sqlalchemy_engine, get_connection
+from db_utils import get_sqlalchemy_engine, get_connection, day_range, pool_metrics
+from patrol_log_storage import count_raw_points, delete_raw_points, raw_points_time_range
+from contractor_resolver import invalidate_vehicle_contractor_cache
 from sqlalchemy import text
 import traceback
 
@@ -634,6 +636,8 @@ def merge_contractors(source_ids, target_id):
             # Delete source contractor rows
             conn.execute(text(f"DELETE FROM contractors WHERE id IN ({id_list})"))
 
+        invalidate_vehicle_contractor_cache()
+
     except Exception as e:
         traceback.print_exc()
         raise
@@ -785,6 +789,7 @@ def add_new_vehicle(plate_number, contractor):
             else:
                 conn.execute(text("INSERT INTO vehicles (plate_number, contractor) VALUES (:plate_number, :contractor) ON CONFLICT DO NOTHING"),
                            {"plate_number": plate_number, "contractor": contractor})
+        invalidate_vehicle_contractor_cache()
 
         st.success(f"✅ Patrol car '{plate_number}' added successfully!")
 
@@ -800,6 +805,7 @@ def delete_vehicle(vehicle_id, plate_number):
 
         with engine.begin() as conn:
             conn.execute(text("DELETE FROM vehicles WHERE id = :vehicle_id"), {"vehicle_id": vehicle_id})
+        invalidate_vehicle_contractor_cache()
 
         st.success(f"Patrol car '{plate_number}' deleted successfully!")
 
@@ -865,7 +871,6 @@ def data_management_section():
                     (SELECT COUNT(*) FROM incident_reports) as incident_count,
                     (SELECT COUNT(*) FROM incident_images) as image_count,
                     (SELECT COUNT(*) FROM idle_reports) as idle_count,
-                    (SELECT COUNT(*) FROM patrol_logs) as patrol_count,
                     (SELECT COUNT(*) FROM breaks) as break_count,
                     (SELECT COUNT(*) FROM pickups) as pickup_count,
                     (SELECT COUNT(*) FROM vehicles) as vehicle_count
@@ -881,7 +886,6 @@ def data_management_section():
                 ('incident_reports', 'incident_count'),
                 ('incident_images', 'image_count'),
                 ('idle_reports', 'idle_count'),
-                ('patrol_logs', 'patrol_count'),
                 ('breaks', 'break_count'),
                 ('pickups', 'pickup_count'),
                 ('vehicles', 'vehicle_count')
@@ -894,6 +898,13 @@ def data_management_section():
                 except Exception:
                     stats[count_key] = 0  # Table doesn't exist
 
+        # Patrol logs span the live table and archived month tables (SQLite)
+        try:
+            with engine.connect() as conn:
+                stats['patrol_count'] = count_raw_points(conn)
+        except Exception:
+            stats['patrol_count'] = 0
+
         # Database usage and space information
         st.subheader("💾 Database Usage & Storage")
 
@@ -955,6 +966,23 @@ def data_management_section():
             else:
                 st.info("ℹ️ Database file not found or empty.")
 
+        # Connection pool usage for this process (shared by all sessions)
+        with st.expander("🔌 Connection Pool"):
+            metrics = pool_metrics()
+            if "checkouts" in metrics:
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric("In Use", f"{metrics['checked_out']} / {metrics['size'] + metrics['max_overflow']}")
+                with col2:
+                    st.metric("Checkouts", metrics['checkouts'])
+                with col3:
+                    st.metric("Avg / Max Wait", f"{metrics['wait_seconds_avg'] * 1000:.1f} / {metrics['wait_seconds_max'] * 1000:.0f} ms")
+                with col4:
+                    st.metric("Pool Timeouts", metrics['timeouts'])
+                if metrics['timeouts']:
+                    st.warning("⚠️ Requests have timed out waiting for a connection. Consider raising DB_POOL_SIZE / DB_MAX_OVERFLOW.")
+            st.json(metrics)
+
         st.markdown("---")
 
         # Display statistics with date ranges
@@ -965,7 +993,6 @@ def data_management_section():
         tables_with_dates = [
             ('incident_reports', 'incident_date'),
             ('idle_reports', 'uploaded_at'),
-            ('patrol_logs', 'timestamp'),
             ('breaks', 'break_date'),
             ('pickups', 'pickup_date')
         ]
@@ -983,6 +1010,15 @@ def data_management_section():
             except Exception:
                 date_ranges[table_name] = ""
 
+        try:
+            with engine.connect() as conn:
+                first_point, last_point = raw_points_time_range(conn)
+            date_ranges['patrol_logs'] = (
+                f"({first_point.strftime('%m/%d/%Y')}-{last_point.strftime('%m/%d/%Y')})" if first_point else ""
+            )
+        except Exception:
+            date_ranges['patrol_logs'] = ""
+
         col1, col2, col3, col4 = st.columns(4)
         with col1:
             incident_label = f"Incident Reports {date_ranges.get('incident_reports', '')}"
@@ -1087,9 +1123,8 @@ def data_management_section():
                     params['contractor_id'] = int(contractor_id)
 
                 if len(delete_idle_date_range) == 2:
-                    preview_query += " AND DATE(uploaded_at) BETWEEN :start_date AND :end_date"
-                    params['start_date'] = delete_idle_date_range[0]
-                    params['end_date'] = delete_idle_date_range[1]
+                    preview_query += " AND uploaded_at >= :range_start AND uploaded_at < :range_end"
+                    params['range_start'], params['range_end'] = day_range(*delete_idle_date_range)
 
                 count = pd.read_sql_query(text(preview_query), engine, params=params).iloc[0]['count']
 
@@ -1119,15 +1154,11 @@ def data_management_section():
                     st.session_state['confirm_delete_patrol'] = True
 
             if st.session_state.get('confirm_delete_patrol', False):
-                preview_query = "SELECT COUNT(*) as count FROM patrol_logs WHERE 1=1"
-                params = {}
-
-                if len(delete_patrol_date_range) == 2:
-                    preview_query += " AND DATE(timestamp) BETWEEN :start_date AND :end_date"
-                    params['start_date'] = delete_patrol_date_range[0]
-                    params['end_date'] = delete_patrol_date_range[1]
-
-                count = pd.read_sql_query(text(preview_query), engine, params=params).iloc[0]['count']
+                with engine.connect() as conn:
+                    if len(delete_patrol_date_range) == 2:
+                        count = count_raw_points(conn, *delete_patrol_date_range)
+                    else:
+                        count = count_raw_points(conn)
 
                 st.warning(f"⚠️ This will delete **{count}** patrol logs. Are you sure?")
                 col1, col2 = st.columns(2)
@@ -1278,9 +1309,8 @@ def delete_idle_reports(contractor_filter, date_range, contractors_df):
                 params['contractor_id'] = int(contractor_id)
             
             if len(date_range) == 2:
-                delete_query += " AND DATE(uploaded_at) BETWEEN :start_date AND :end_date"
-                params['start_date'] = date_range[0]
-                params['end_date'] = date_range[1]
+                delete_query += " AND uploaded_at >= :range_start AND uploaded_at < :range_end"
+                params['range_start'], params['range_end'] = day_range(*date_range)
 
             result = conn.execute(text(delete_query), params)
             
@@ -1296,18 +1326,14 @@ def delete_patrol_logs(date_range):
     try:
         engine = get_sqlalchemy_engine()
         
+        # Archived month tables (SQLite) are cleared along with patrol_logs
         with engine.begin() as conn:
-            delete_query = "DELETE FROM patrol_logs WHERE 1=1"
-            params = {}
-            
             if len(date_range) == 2:
-                delete_query += " AND DATE(timestamp) BETWEEN :start_date AND :end_date"
-                params['start_date'] = date_range[0]
-                params['end_date'] = date_range[1]
-
-            result = conn.execute(text(delete_query), params)
+                deleted = delete_raw_points(conn, *date_range)
+            else:
+                deleted = delete_raw_points(conn)
             
-        st.success(f"✅ Deleted {result.rowcount} patrol logs!")
+        st.success(f"✅ Deleted {deleted} patrol logs!")
         
     except Exception as e:
         st.error(f"Error deleting patrol logs: {e}")
@@ -0,0 +1,59 @@
+"""Batched patrol log writes (db_utils.record_patrol_logs) on an in-memory SQLite database.
+
+Run with: python -m pytest test_record_patrol_logs.py
+"""
+from sqlalchemy import create_engine, text
+
+from db_utils import _LAST_POSITION_DDL, record_patrol_logs
+
+
+def _engine():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE patrol_logs (
+                id INTEGER PRIMARY KEY, vehicle_id INTEGER, timestamp TIMESTAMP,
+                latitude REAL, longitude REAL, activity TEXT, speed REAL, status TEXT
+            )
+        """))
+        conn.execute(text(_LAST_POSITION_DDL))
+    return engine
+
+
+def _fix(timestamp, latitude, activity="moving"):
+    return {"vehicle_id": 1, "timestamp": timestamp, "latitude": latitude,
+            "longitude": 36.8, "activity": activity, "speed": 0.0}
+
+
+def test_mixed_timestamp_forms_in_one_batch():
+    # GPS fixes arrive as UTC with 'Z', bulk rows with '+00:00', older clients send naive time
+    engine = _engine()
+    with engine.begin() as conn:
+        record_patrol_logs(conn, [
+            _fix("2026-10-16T10:00:05.000Z", -1.2),
+            _fix("2026-10-16T10:00:07", -1.3, "idle_continued"),
+            _fix("2026-10-16T10:00:06+00:00", -1.4),
+        ])
+
+    with engine.connect() as conn:
+        stored = [row[0] for row in conn.execute(text("SELECT timestamp FROM patrol_logs ORDER BY timestamp"))]
+        last = conn.execute(text("SELECT timestamp, latitude FROM vehicle_last_position")).one()
+
+    assert stored == [
+        "2026-10-16T10:00:05.000000",
+        "2026-10-16T10:00:06.000000",
+        "2026-10-16T10:00:07.000000",
+    ]
+    assert last == ("2026-10-16T10:00:07.000000", -1.3)
+
+
+def test_older_batch_does_not_overwrite_last_position():
+    engine = _engine()
+    with engine.begin() as conn:
+        record_patrol_logs(conn, [_fix("2026-10-16T12:00:00Z", -1.0)])
+    with engine.begin() as conn:
+        record_patrol_logs(conn, [_fix("2026-10-16T13:00:00+02:00", -2.0)])
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT latitude FROM vehicle_last_position")).scalar() == -1.0
+        assert conn.execute(text("SELECT COUNT(*) FROM patrol_logs")).scalar() == 2
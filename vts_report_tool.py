@@ -5,9 +5,11 @@ import pandas as pd
 import datetime
 import io
 from sqlalchemy import text
-from db_utils import get_sqlalchemy_engine
+from db_utils import get_sqlalchemy_engine, bootstrap_database, db_cursor, param_marker, fix_time_param, utc_now, insert_idle_rows
 from auth_utils import get_user, verify_password, get_contractor_id, get_active_contractor
 from breaks_pickups_page import breaks_pickups_page
+from idle_detection import find_idle_runs
+from patrol_log_storage import read_points_page
 from streamlit_folium import st_folium
 import folium
 
@@ -26,69 +28,33 @@ st.set_page_config(
 
 # ---------------- DATABASE INITIALIZATION ----------------
 def init_database_if_needed():
-    """Initialize database tables if they don't exist"""
-    from db_utils import init_database
-
-    # Initialize database tables and data
+    """Bootstrap the database once per process; reruns return immediately"""
     try:
-        init_database()
-
-        # Always ensure vehicles exist (in case they were deleted or missing)
-        # Note: The patrol cars being monitored through GPRS are the five vehicles from the two contractors:
-        # Wizpro (3 vehicles + recovery car) and Paschal (2 vehicles + recovery car)
-        # The recovery cars serve as additional slots for backup vehicles
-        from db_utils import get_sqlalchemy_engine
-        from sqlalchemy import text
-        engine = get_sqlalchemy_engine()
-        is_sqlite = engine.dialect.name == "sqlite"
-        with engine.begin() as conn:
-            # Total of 8 vehicles: 3 Wizpro, 2 Paschal, 3 Avators
-            vehicles = [
-                ('KDG 320Z', 'Wizpro'), ('KDS 374F', 'Wizpro'), ('KDK 825Y', 'Wizpro'),
-                ('KDC 873G', 'Paschal'), ('KDD 500X', 'Paschal'),
-                ('KAV 444A', 'Avators'), ('KAV 555A', 'Avators'), ('KAV 666A', 'Avators')
-            ]
-            # Use raw cursor for vehicle insertion to avoid SQLAlchemy parameter issues
-            cursor = conn.connection.cursor()
-            for plate_number, contractor in vehicles:
-                if is_sqlite:
-                    cursor.execute("INSERT OR IGNORE INTO vehicles (plate_number, contractor) VALUES (?, ?)",
-                                  (plate_number, contractor))
-                else:
-                    cursor.execute("INSERT INTO vehicles (plate_number, contractor) VALUES (%s, %s) ON CONFLICT DO NOTHING",
-                                  (plate_number, contractor))
-            # Add sample idle reports for testing (only if table is empty)
-            try:
-                cursor.execute("SELECT COUNT(*) FROM idle_reports")
-                count = cursor.fetchone()[0]
-
-                if count == 0:  # Only add sample data if table is empty
-                    from datetime import datetime
-                    idle_reports = [
-                        ('KDG 320Z', datetime(2024, 10, 1, 8, 0, 0), datetime(2024, 10, 1, 8, 30, 0), 30.0, 'Nairobi CBD', -1.2864, 36.8172, 'Traffic congestion', 'admin', 1),
-                        ('KDS 374F', datetime(2024, 10, 1, 9, 15, 0), datetime(2024, 10, 1, 9, 45, 0), 30.0, 'Westlands', -1.2630, 36.8065, 'Waiting for client', 'admin', 1),
-                        ('KDC 873G', datetime(2024, 10, 1, 10, 0, 0), datetime(2024, 10, 1, 10, 20, 0), 20.0, 'Kilimani', -1.2910, 36.7844, 'Break time', 'admin', 2),
-                        ('KDD 500X', datetime(2024, 10, 1, 11, 30, 0), datetime(2024, 10, 1, 12, 0, 0), 30.0, 'Karen', -1.3168, 36.7073, 'Lunch break', 'admin', 2),
-                        ('KAV 444A', datetime(2024, 10, 1, 14, 0, 0), datetime(2024, 10, 1, 14, 25, 0), 25.0, 'Parklands', -1.2640, 36.8261, 'Vehicle maintenance', 'admin', 4),
-                    ]
-                    for vehicle, idle_start, idle_end, duration, location, lat, lon, description, uploaded_by, contractor_id in idle_reports:
-                        if is_sqlite:
-                            cursor.execute("""
-                                INSERT OR IGNORE INTO idle_reports
-                                (vehicle, idle_start, idle_end, idle_duration_min, location_address, latitude, longitude, description, uploaded_by, contractor_id, uploaded_at)
-                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                            """, (vehicle, idle_start, idle_end, duration, location, lat, lon, description, uploaded_by, contractor_id, datetime.now()))
-                        else:
-                            cursor.execute("""
-                                INSERT INTO idle_reports
-                                (vehicle, idle_start, idle_end, idle_duration_min, location_address, latitude, longitude, description, uploaded_by, contractor_id, uploaded_at)
-                                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                                ON CONFLICT DO NOTHING
-                            """, (vehicle, idle_start, idle_end, duration, location, lat, lon, description, uploaded_by, contractor_id, datetime.now()))
-            except Exception as e:
-                st.warning(f"Could not check idle_reports table: {e}")
+        # Creates tables, default users and patrol vehicles only when the schema version is new
+        if not bootstrap_database():
+            return
 
-            cursor.close()
+        engine = get_sqlalchemy_engine()
+        # Add sample idle reports for testing (only if table is empty)
+        try:
+            with engine.connect() as conn:
+                count = conn.execute(text("SELECT COUNT(*) FROM idle_reports")).scalar()
+
+            if count == 0:  # Only add sample data if table is empty
+                from datetime import datetime
+                idle_reports = pd.DataFrame([
+                    ('KDG 320Z', datetime(2024, 10, 1, 8, 0, 0), datetime(2024, 10, 1, 8, 30, 0), 30.0, 'Nairobi CBD', -1.2864, 36.8172, 'Traffic congestion', 'admin', 1),
+                    ('KDS 374F', datetime(2024, 10, 1, 9, 15, 0), datetime(2024, 10, 1, 9, 45, 0), 30.0, 'Westlands', -1.2630, 36.8065, 'Waiting for client', 'admin', 1),
+                    ('KDC 873G', datetime(2024, 10, 1, 10, 0, 0), datetime(2024, 10, 1, 10, 20, 0), 20.0, 'Kilimani', -1.2910, 36.7844, 'Break time', 'admin', 2),
+                    ('KDD 500X', datetime(2024, 10, 1, 11, 30, 0), datetime(2024, 10, 1, 12, 0, 0), 30.0, 'Karen', -1.3168, 36.7073, 'Lunch break', 'admin', 2),
+                    ('KAV 444A', datetime(2024, 10, 1, 14, 0, 0), datetime(2024, 10, 1, 14, 25, 0), 25.0, 'Parklands', -1.2640, 36.8261, 'Vehicle maintenance', 'admin', 4),
+                ], columns=['vehicle', 'idle_start', 'idle_end', 'idle_duration_min', 'location_address',
+                            'latitude', 'longitude', 'description', 'uploaded_by', 'contractor_id'])
+                idle_reports['uploaded_at'] = datetime.now()
+                # Same path as uploads, so the rows get their plate and the natural-key dedup
+                insert_idle_rows(idle_reports, bind=engine)
+        except Exception as e:
+            st.warning(f"Could not check idle_reports table: {e}")
 
     except Exception as e:
         st.error(f"❌ Database initialization failed: {e}")
@@ -193,23 +159,12 @@ if not st.session_state["login_state"]:
 
                 import bcrypt
 
-                engine = get_sqlalchemy_engine()
-                is_sqlite = engine.dialect.name == "sqlite"
-                conn = engine.raw_connection()
-                cur = conn.cursor()
-
-                if is_sqlite:
-                    # SQLite uses ?
-                    cur.execute("SELECT u.id, u.password_hash, u.role FROM users u JOIN contractors c ON u.contractor_id = c.id WHERE c.name = ? AND u.username = ?",
+                # ? on SQLite, %s on PostgreSQL
+                marker = param_marker()
+                with db_cursor() as cur:
+                    cur.execute(f"SELECT u.id, u.password_hash, u.role FROM users u JOIN contractors c ON u.contractor_id = c.id WHERE c.name = {marker} AND u.username = {marker}",
                                 (contractor, username))
-                else:
-                    # PostgreSQL uses %s
-                    cur.execute("SELECT u.id, u.password_hash, u.role FROM users u JOIN contractors c ON u.contractor_id = c.id WHERE c.name = %s AND u.username = %s",
-                                (contractor, username))
-                user = cur.fetchone()
-
-                cur.close()
-                conn.close()
+                    user = cur.fetchone()
 
                 if user and bcrypt.checkpw(password.encode('utf-8'), user[1].encode('utf-8')):
                     st.session_state["login_state"] = True
@@ -615,31 +570,39 @@ else:
         st.session_state["selected_vehicle"] = selected_vehicle
 
 # ---- LOAD PATROL LOGS ----
+PATROL_LOGS_PAGE_SIZE = 500
+PATROL_LOG_COLUMNS = ["timestamp", "latitude", "longitude", "activity", "speed"]
+
 if selected_vehicle:
     vehicle_id = next((v["id"] for v in vehicle_list if v["plate_number"] == selected_vehicle), None)
     if vehicle_id:
+        today = datetime.date.today()
+        log_dates = st.date_input("Patrol Log Dates", [today - datetime.timedelta(days=6), today], key="patrol_log_dates")
+        # A single picked day (range still being chosen) is treated as a one-day range
+        start_day, end_day = (log_dates[0], log_dates[-1]) if log_dates else (None, None)
+
+        # Keyset pages: the stack holds the (timestamp, id) each visited page starts after
+        filters = (vehicle_id, start_day, end_day)
+        if st.session_state.get("patrol_logs_filters") != filters:
+            st.session_state["patrol_logs_filters"] = filters
+            st.session_state["patrol_logs_cursors"] = [None]
+        cursors = st.session_state["patrol_logs_cursors"]
+
         engine = get_sqlalchemy_engine()
-        with engine.begin() as conn:
+        with engine.connect() as conn:
+            page_args = dict(before=cursors[-1], start=start_day, end=end_day)
             # Check if patrol_logs table exists first
             try:
-                # Try full query including speed column
-                patrol_logs = pd.read_sql(text("""
-                    SELECT timestamp, latitude, longitude, activity, speed
-                    FROM patrol_logs
-                    WHERE vehicle_id = :vehicle_id
-                    ORDER BY timestamp DESC
-                """), conn, params={"vehicle_id": vehicle_id})
+                # Try full query including speed column (spans archived months on SQLite)
+                patrol_logs = read_points_page(conn, vehicle_id, PATROL_LOGS_PAGE_SIZE,
+                                               columns=PATROL_LOG_COLUMNS, **page_args)
             except Exception as e:
                 err = str(e).lower()
                 # If the speed column doesn't exist, retry without it
                 if "no such column" in err or "unknown column" in err or "speed" in err:
                     try:
-                        patrol_logs = pd.read_sql(text("""
-                            SELECT timestamp, latitude, longitude, activity
-                            FROM patrol_logs
-                            WHERE vehicle_id = :vehicle_id
-                            ORDER BY timestamp DESC
-                        """), conn, params={"vehicle_id": vehicle_id})
+                        patrol_logs = read_points_page(conn, vehicle_id, PATROL_LOGS_PAGE_SIZE,
+                                                       columns=PATROL_LOG_COLUMNS[:-1], **page_args)
                         # Add speed column with NaN so downstream code can reference it
                         patrol_logs["speed"] = pd.NA
                     except Exception as e2:
@@ -655,12 +618,32 @@ if selected_vehicle:
                         st.error(f"Error loading patrol logs: {e}")
                     patrol_logs = pd.DataFrame()
 
+        has_next = len(patrol_logs) == PATROL_LOGS_PAGE_SIZE
+        if has_next:
+            next_cursor = (patrol_logs["timestamp"].iloc[-1], patrol_logs["id"].iloc[-1])
+        patrol_logs = patrol_logs.drop(columns="id", errors="ignore")
+        prev_col, page_col, next_col = st.columns([1, 2, 1])
+        if prev_col.button("⬅️ Previous", disabled=len(cursors) == 1, key="patrol_logs_prev"):
+            cursors.pop()
+            st.rerun()
+        page_col.caption(f"Page {len(cursors)} · {len(patrol_logs)} log(s)")
+        if next_col.button("Next ➡️", disabled=not has_next, key="patrol_logs_next"):
+            cursors.append(next_cursor)
+            st.rerun()
+
         if patrol_logs.empty:
             st.info(f"No patrol logs found for {selected_vehicle}")
         else:
             st.subheader(f"📋 Patrol Logs for {selected_vehicle}")
             st.dataframe(patrol_logs, width='stretch')
 
+            # Idle periods from the logged speeds (skipped when speed isn't recorded)
+            if patrol_logs["speed"].notna().any():
+                idle_runs = find_idle_runs(patrol_logs.assign(vehicle=selected_vehicle), "vehicle", "timestamp", "speed")
+                if not idle_runs.empty:
+                    st.subheader(f"⏸️ Idle Periods for {selected_vehicle}")
+                    st.dataframe(idle_runs, width='stretch')
+
             st.subheader(f"🗺️ Map View for {selected_vehicle}")
 
             if not patrol_logs.empty and patrol_logs.iloc[0]["latitude"] and patrol_logs.iloc[0]["longitude"]:
@@ -766,17 +749,15 @@ elif page == "Real-Time GPS":
                            COALESCE(p.activity, 'unknown') as activity,
                            p.timestamp as last_update
                     FROM vehicles v
-                    LEFT JOIN patrol_logs p ON v.id = p.vehicle_id
-                        AND p.timestamp = (
-                            SELECT MAX(timestamp)
-                            FROM patrol_logs
-                            WHERE vehicle_id = v.id
-                            AND timestamp > datetime('now', '-10 minutes')
-                        )
-                    WHERE v.contractor_id = :contractor_id
+                    LEFT JOIN vehicle_last_position p ON v.id = p.vehicle_id
+                        AND p.timestamp > :since
+                    WHERE v.contractor = (SELECT name FROM contractors WHERE id = :contractor_id)
                     ORDER BY v.contractor, v.plate_number
                 """
-                result = conn.execute(text(vehicles_query), {"contractor_id": contractor_id})
+                result = conn.execute(text(vehicles_query), {
+                    "contractor_id": contractor_id,
+                    "since": fix_time_param(conn, utc_now() - datetime.timedelta(minutes=10))
+                })
                 vehicles_data = result.fetchall()
 
                 if vehicles_data: